@@ -16,8 +16,11 @@ class CmpcRoleController:
     Para cambiar los datos base, modificar data_folder (carpeta donde se encuentran USER_ADDR_IDAD3 y AGR_USERS) y data_type (formato de los archivos: .csv o .xlsx).
     """
 
-    def __init__(self, similarity_metric, resumen_data_path, n_top = 10, data_folder = "data", threshold=0.7, data_type = ".csv"):
-        self.recommender = CmpcRoleRecommender(similarity_metric, resumen_data_path, n_top, data_folder, threshold, data_type)
+    def __init__(self, similarity_metric, resumen_data_path, n_top = 10, data_folder = "data", threshold=0.7, data_type = ".csv", cache_dir=None,
+                 neighbor_index=None):
+        # neighbor_index: 'exact' o 'rp_forest' (índice aproximado) para las consultas de usuarios similares
+        self.recommender = CmpcRoleRecommender(similarity_metric, resumen_data_path, n_top, data_folder, threshold, data_type, cache_dir,
+                                               neighbor_index=neighbor_index)
 
     def generate_recommendations(self, model_path=None, threshold=0.5):
 
@@ -87,6 +90,25 @@ class CmpcRoleController:
         
         return user_recommendations
     
+    def get_similar_users(self, user_id, k=None):
+        """
+        Obtiene los usuarios más similares a un usuario (consulta al índice de vecinos).
+
+        Args:
+            user_id (str): Identificador del usuario.
+            k (int, opcional): Número de usuarios (por defecto n_top).
+
+        Returns:
+            list: Lista de diccionarios [{"Usuario": "XX", "Similarity": 0.93}, ...] ordenada por similitud.
+        """
+        calculator = self.recommender.similarity_calculator
+        if calculator.get_similarity_df() is None:
+            return []
+        return [
+            {"Usuario": user, "Similarity": round(float(similarity), 4)}
+            for user, similarity in calculator.get_similar_users(user_id, k)
+        ]
+
     def get_data_by(self,data_type = "Usuario"):
         """
         Obtiene una lista de valores únicos para un tipo de dato específico (Usuario, Departamento, Función).
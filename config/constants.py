@@ -4,4 +4,10 @@ USER_ADDR_COLUMNS = ["Usuario", "Departamento", "Función"]
 
 AGR_1251_COLUMNS = ["Rol", "Valor de la autorización"]
 
-AGR_USERS_COLUMNS = ["Usuario", "Rol"]
\ No newline at end of file
+AGR_USERS_COLUMNS = ["Usuario", "Rol"]
+
+# Folder (inside the data folder) for cached snapshots and intermediate artifacts
+CACHE_FOLDER = ".cache"
+
+# Column added by load_data (source_column=SOURCE_COLUMN) with the file each row was read from
+SOURCE_COLUMN = "Archivo"
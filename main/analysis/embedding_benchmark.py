@@ -0,0 +1,170 @@
+"""
+Benchmark of the embedding backends against the exact KPCA path.
+
+For synthetic user bases of several sizes, each backend of compute_kpca is
+run on the same sparse features and followed by the usual cosine similarity
+and RoleRecommender steps. The report gives, per backend:
+
+- runtime and peak traced memory (tracemalloc) of the embedding step
+- neighbor recall@k: share of each user's exact top-k neighbors recovered
+- recommendation recall: share of the exact (Usuario, Rol) recommendations
+  recovered (the "recall loss" is 1 minus this value)
+
+Usage:
+    python main/analysis/embedding_benchmark.py --sizes 1000 5000 --landmarks 200 500 1000
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from main.modulo_similaridad.embeadding.embeddings import compute_kpca
+from main.modulo_similaridad.embeadding.features import build_user_features
+from main.modulo_similaridad.similarity_calculation.potencial_roles import RoleRecommender
+
+BENCHMARK_SIZES = (1000, 5000)
+BENCHMARK_LANDMARKS = (200, 500, 1000)
+NEIGHBORS_K = 10
+SIMILARITY_THRESHOLD = 0.7
+
+
+def synthetic_split_roles(n_users, n_departments=200, n_functions=450, n_roles=3600,
+                          users_per_profile=20, roles_per_profile=15, seed=0, with_future=False):
+    """
+    split_roles-like DataFrame with users grouped in profiles.
+
+    Users of a profile share department, function and most of their roles,
+    so similar users and role recommendations exist as in the real data.
+    With with_future=True also returns a resumen-like DataFrame (Usuario,
+    Rol, Fecha) where each user later receives half of the profile roles
+    they are missing, as ground truth for ValidationCalculator.
+    """
+    rng = np.random.default_rng(seed)
+    n_profiles = max(1, n_users // users_per_profile)
+    profile_roles = [rng.choice(n_roles, roles_per_profile, replace=False) for _ in range(n_profiles)]
+    profile_department = rng.integers(0, n_departments, n_profiles)
+    profile_function = rng.integers(0, n_functions, n_profiles)
+
+    profiles = rng.integers(0, n_profiles, n_users)
+    roles = []
+    future = []
+    for i, p in enumerate(profiles):
+        kept_mask = rng.random(roles_per_profile) > 0.2
+        kept = profile_roles[p][kept_mask]
+        extra = rng.integers(0, n_roles, 2)
+        roles.append([f"ZR_{r:04d}" for r in dict.fromkeys(np.concatenate([kept, extra]))])
+        if with_future:
+            missing = profile_roles[p][~kept_mask]
+            future += [(f"U{i}", f"ZR_{r:04d}") for r in missing[rng.random(len(missing)) < 0.5]]
+
+    split_df = pd.DataFrame({
+        'Usuario': [f"U{i}" for i in range(n_users)],
+        'Departamento': [f"D{d}" for d in profile_department[profiles]],
+        'Función': [f"F{f}" for f in profile_function[profiles]],
+        'Rol': roles,
+    })
+    if not with_future:
+        return split_df
+    resumen_df = pd.DataFrame(future, columns=['Usuario', 'Rol'])
+    resumen_df['Fecha'] = pd.Timestamp('2025-07-01')
+    return split_df, resumen_df
+
+
+def _timed(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _top_k(sim, k):
+    sim = sim.copy()
+    np.fill_diagonal(sim, -np.inf)
+    return np.argpartition(-sim, k, axis=1)[:, :k]
+
+
+def neighbor_recall(exact_top, approx_top) -> float:
+    hits = sum(len(np.intersect1d(e, a)) for e, a in zip(exact_top, approx_top))
+    return hits / exact_top.size
+
+
+def recommendation_pairs(split_df, emb_df, threshold=SIMILARITY_THRESHOLD) -> set:
+    sim_df = pd.DataFrame(cosine_similarity(emb_df.values), index=emb_df.index, columns=emb_df.index)
+    recommendations = RoleRecommender(split_df, sim_df, similarity_threshold=threshold).recommend_roles_for_all_users()
+    if recommendations.empty:
+        return set(), sim_df.values
+    return set(zip(recommendations['Usuario'], recommendations['Recommended_Role'])), sim_df.values
+
+
+def benchmark_embeddings(sizes=BENCHMARK_SIZES, landmarks=BENCHMARK_LANDMARKS, methods=None,
+                         n_components=10, kernel='rbf', gamma='scale') -> pd.DataFrame:
+    """
+    Run every backend on synthetic data and compare it with the exact KPCA.
+
+    Args:
+        sizes: Numbers of synthetic users
+        landmarks: Landmark counts for the 'nystroem' backend
+        methods: Extra backends to compare besides 'exact' (default: randomized and nystroem)
+        n_components, kernel, gamma: KPCA parameters
+
+    Returns:
+        DataFrame with one row per (size, backend)
+    """
+    methods = methods or ['randomized', 'nystroem']
+    rows = []
+    for n_users in sizes:
+        split_df = synthetic_split_roles(n_users)
+        X = build_user_features(split_df, sparse=True)
+        base_params = dict(n_components=n_components, kernel=kernel, gamma=gamma)
+
+        runs = [('exact', {})]
+        for method in methods:
+            if method == 'nystroem':
+                runs += [(f"nystroem_{m}", {'method': 'nystroem', 'n_landmarks': m}) for m in landmarks]
+            else:
+                runs.append((method, {'method': method}))
+
+        exact_pairs = exact_top = None
+        for name, params in runs:
+            (emb_df, _), elapsed, peak = _timed(lambda: compute_kpca(X, **base_params, **params))
+            pairs, sim = recommendation_pairs(split_df, emb_df)
+            top = _top_k(sim, NEIGHBORS_K)
+            if name == 'exact':
+                exact_pairs, exact_top = pairs, top
+            rec_recall = len(pairs & exact_pairs) / len(exact_pairs) if exact_pairs else 1.0
+            rows.append({
+                'users': n_users,
+                'backend': name,
+                'seconds': round(elapsed, 3),
+                'peak_mb': round(peak / 1024 ** 2, 1),
+                f'neighbor_recall@{NEIGHBORS_K}': round(neighbor_recall(exact_top, top), 4),
+                'recommendation_recall': round(rec_recall, 4),
+                'recall_loss': round(1 - rec_recall, 4),
+                'recommendations': len(pairs),
+            })
+            print(rows[-1])
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark of approximate KPCA backends vs exact KPCA")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(BENCHMARK_SIZES))
+    parser.add_argument("--landmarks", type=int, nargs="+", default=list(BENCHMARK_LANDMARKS))
+    parser.add_argument("--output", default=None, help="CSV file for the report")
+    args = parser.parse_args()
+
+    report = benchmark_embeddings(args.sizes, args.landmarks)
+    print(report.to_string(index=False))
+    if args.output:
+        report.to_csv(args.output, index=False)
@@ -0,0 +1,89 @@
+"""
+Check the binary metrics of SimilarityCalculator against the previous implementations.
+
+On synthetic users, binary_similarity_frame ('jaccard', 'dice',
+'jaccard_hamming') is compared with 1 - pdist (check_results.py) and with
+the per-pair loop of j_h.user_similarity_jaccard_hamming (on a subsample,
+the loop is O(n^2 * d) in Python). Each metric is also run with the
+bit-packed popcount engine (packed_similarity_frame).
+
+Usage:
+    python main/analysis/metric_check.py --users 1000 --loop-users 200
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial.distance import pdist, squareform
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from main.analysis.embedding_benchmark import synthetic_split_roles
+from main.modulo_similaridad.embeadding.features import build_user_features
+from main.similarity_implementations.j_h import user_similarity_jaccard_hamming
+from utils.bitpacked_similarity import packed_similarity_frame
+from utils.similarity_metrics import binary_similarity_frame
+
+
+def check_metrics(n_users=1000, loop_users=200, seed=0) -> list:
+    """
+    Max absolute difference of each metric against its reference, and the run times.
+
+    Returns:
+        List of dicts (metric, reference, max_abs_error, packed_abs_error, sparse_s, packed_s, reference_s)
+    """
+    split_df = synthetic_split_roles(n_users, seed=seed)
+    X = build_user_features(split_df, sparse=True)
+    dense = X.to_frame()
+    rows = []
+    for metric in ('jaccard', 'dice'):
+        start = time.perf_counter()
+        sparse_sim = binary_similarity_frame(X, metric).to_numpy()
+        sparse_s = time.perf_counter() - start
+        start = time.perf_counter()
+        packed_sim = packed_similarity_frame(X, metric).to_numpy()
+        packed_s = time.perf_counter() - start
+        start = time.perf_counter()
+        reference = 1 - squareform(pdist(dense.to_numpy() > 0, metric=metric))
+        rows.append({
+            'metric': metric,
+            'reference': 'pdist',
+            'max_abs_error': float(np.abs(sparse_sim - reference).max()),
+            'packed_abs_error': float(np.abs(packed_sim - reference).max()),
+            'sparse_s': round(sparse_s, 3),
+            'packed_s': round(packed_s, 3),
+            'reference_s': round(time.perf_counter() - start, 3),
+        })
+
+    sample = dense.iloc[:loop_users]
+    start = time.perf_counter()
+    sparse_sim = binary_similarity_frame(sample, 'jaccard_hamming').to_numpy()
+    sparse_s = time.perf_counter() - start
+    start = time.perf_counter()
+    packed_sim = packed_similarity_frame(sample, 'jaccard_hamming').to_numpy()
+    packed_s = time.perf_counter() - start
+    start = time.perf_counter()
+    reference = user_similarity_jaccard_hamming(sample).to_numpy()
+    rows.append({
+        'metric': 'jaccard_hamming',
+        'reference': 'j_h loop',
+        'max_abs_error': float(np.abs(sparse_sim - reference).max()),
+        'packed_abs_error': float(np.abs(packed_sim - reference).max()),
+        'sparse_s': round(sparse_s, 3),
+        'packed_s': round(packed_s, 3),
+        'reference_s': round(time.perf_counter() - start, 3),
+    })
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sparse binary metrics vs pdist / j_h")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--loop-users", type=int, default=200)
+    args = parser.parse_args()
+
+    for row in check_metrics(args.users, args.loop_users):
+        print(row)
@@ -0,0 +1,85 @@
+"""
+Check that the float32 / float16 modes keep the role candidates of float64.
+
+On synthetic users, the features -> KPCA -> cosine similarity ->
+RoleRecommender chain is run in float64 and in a reduced precision. The
+candidate set of the reduced precision is accepted when it is bracketed by
+the float64 candidates at threshold + tolerance and threshold - tolerance,
+i.e. it can only differ on pairs whose similarity is within tolerance of the
+threshold.
+
+Usage:
+    python main/analysis/precision_check.py --users 2000 --precision float32 float16
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from main.analysis.embedding_benchmark import synthetic_split_roles
+from main.modulo_similaridad.embeadding.embeddings import compute_kpca
+from main.modulo_similaridad.embeadding.features import build_user_features
+from main.modulo_similaridad.similarity_calculation.potencial_roles import RoleRecommender
+from utils.precision import cosine_similarity_frame, resolve_precision
+
+SIMILARITY_THRESHOLD = 0.7
+# float32 error comes mostly from the eigendecomposition; float16 adds a rounding of up to 2.4e-4 in [0.5, 1]
+TOLERANCE = {'float64': 0.0, 'float32': 1e-3, 'float16': 2e-3}
+
+
+def candidate_pairs(split_df, sim_df, threshold) -> set:
+    recommendations = RoleRecommender(split_df, sim_df, similarity_threshold=threshold).recommend_roles_for_all_users()
+    if recommendations.empty:
+        return set()
+    return set(zip(recommendations['Usuario'], recommendations['Recommended_Role']))
+
+
+def similarity_frame(split_df, precision, n_components=10) -> pd.DataFrame:
+    dtype, similarity_dtype = resolve_precision(precision)
+    X = build_user_features(split_df, sparse=True, dtype=dtype)
+    emb_df, _ = compute_kpca(X, n_components=n_components, dtype=dtype.__name__)
+    return cosine_similarity_frame(emb_df, dtype=similarity_dtype)
+
+
+def check_precision(split_df, precision, threshold=SIMILARITY_THRESHOLD, tolerance=None) -> dict:
+    """
+    Compare the candidates of precision with the float64 ones.
+
+    Returns:
+        Dict with the similarity error, the candidate counts and 'ok'
+    """
+    tolerance = TOLERANCE[precision] if tolerance is None else tolerance
+    reference = similarity_frame(split_df, 'float64')
+    reduced = similarity_frame(split_df, precision)
+
+    candidates = candidate_pairs(split_df, reduced, threshold)
+    strict = candidate_pairs(split_df, reference, min(threshold + tolerance, 1.0))
+    loose = candidate_pairs(split_df, reference, max(threshold - tolerance, 0.0))
+    exact = candidate_pairs(split_df, reference, threshold)
+    return {
+        'precision': precision,
+        'max_similarity_error': float(np.abs(reduced.to_numpy(np.float64) - reference.to_numpy()).max()),
+        'similarity_mb': round(reduced.to_numpy().nbytes / 1024 ** 2, 1),
+        'candidates_float64': len(exact),
+        'candidates': len(candidates),
+        'changed': len(candidates ^ exact),
+        'ok': strict <= candidates <= loose,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Candidate sets of float32/float16 vs float64")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--precision", nargs="+", default=['float32', 'float16'])
+    args = parser.parse_args()
+
+    split_df = synthetic_split_roles(args.users)
+    results = [check_precision(split_df, precision) for precision in args.precision]
+    print(pd.DataFrame(results).to_string(index=False))
+    if not all(result['ok'] for result in results):
+        sys.exit(1)
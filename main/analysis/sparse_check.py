@@ -0,0 +1,80 @@
+"""
+Check that the sparse CSR feature path of KPCA gives the dense embeddings.
+
+On synthetic users, build_user_features(sparse=True) -> compute_kpca is
+compared with the dense DataFrame path for each KPCA backend. Eigenvectors
+are only defined up to sign, so each embedding column is aligned in sign
+before comparing; the cosine similarities and the RoleRecommender
+candidates (with the same threshold bracketing as precision_check.py) are
+compared as well.
+
+Usage:
+    python main/analysis/sparse_check.py --users 2000 --methods exact randomized nystroem
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from main.analysis.embedding_benchmark import synthetic_split_roles
+from main.analysis.precision_check import SIMILARITY_THRESHOLD, candidate_pairs
+from main.modulo_similaridad.embeadding.embeddings import compute_kpca
+from main.modulo_similaridad.embeadding.features import build_user_features
+from utils.precision import cosine_similarity_frame
+
+# Both paths run in float64; differences come from the summation order of the kernel
+TOLERANCE = 1e-6
+
+
+def embedding_error(sparse_emb: pd.DataFrame, dense_emb: pd.DataFrame) -> float:
+    """Max absolute difference of the embeddings, with each column aligned in sign."""
+    a, b = sparse_emb.to_numpy(), dense_emb.to_numpy()
+    return float(np.minimum(np.abs(a - b).max(axis=0), np.abs(a + b).max(axis=0)).max())
+
+
+def check_sparse(split_df, method='exact', n_components=10, threshold=SIMILARITY_THRESHOLD,
+                 tolerance=TOLERANCE) -> dict:
+    """
+    Compare the sparse and dense feature paths of one KPCA backend.
+
+    Returns:
+        Dict with the embedding and similarity errors, the candidate counts and 'ok'
+    """
+    embeddings = {}
+    for sparse in (False, True):
+        X = build_user_features(split_df, sparse=sparse)
+        embeddings[sparse], _ = compute_kpca(X, n_components=n_components, method=method)
+    dense_sim = cosine_similarity_frame(embeddings[False])
+    sparse_sim = cosine_similarity_frame(embeddings[True])
+
+    candidates = candidate_pairs(split_df, sparse_sim, threshold)
+    strict = candidate_pairs(split_df, dense_sim, min(threshold + tolerance, 1.0))
+    loose = candidate_pairs(split_df, dense_sim, max(threshold - tolerance, 0.0))
+    exact = candidate_pairs(split_df, dense_sim, threshold)
+    return {
+        'method': method,
+        'max_embedding_error': embedding_error(embeddings[True], embeddings[False]),
+        'max_similarity_error': float(np.abs(sparse_sim.to_numpy() - dense_sim.to_numpy()).max()),
+        'candidates_dense': len(exact),
+        'candidates': len(candidates),
+        'changed': len(candidates ^ exact),
+        'ok': strict <= candidates <= loose,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="KPCA embeddings of the sparse vs dense features")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--methods", nargs="+", default=['exact', 'randomized', 'nystroem'])
+    args = parser.parse_args()
+
+    split_df = synthetic_split_roles(args.users)
+    results = [check_sparse(split_df, method) for method in args.methods]
+    print(pd.DataFrame(results).to_string(index=False))
+    if not all(result['ok'] for result in results):
+        sys.exit(1)
@@ -0,0 +1,120 @@
+"""
+Benchmark of the truncated-SVD embedding against compute_kpca.
+
+For synthetic user bases of 1k, 10k and 100k users, each embedding is
+computed on the same sparse features; the role recommendations of the
+similar users are validated with ValidationCalculator against the
+synthetic future assignments. The report gives, per (size, embedding):
+
+- runtime and peak traced memory (tracemalloc) of the embedding step
+- precision and recall of the recommendations (ValidationCalculator)
+
+The exact KPCA needs the n x n kernel, so above EXACT_MAX_USERS it is
+replaced by the Nyström backend. Recommendations are computed in row
+blocks of the cosine similarity (top n_top neighbors above the threshold)
+so no n x n similarity matrix is built.
+
+Usage:
+    python main/analysis/svd_benchmark.py --sizes 1000 10000 100000
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from main.analysis.embedding_benchmark import synthetic_split_roles, _timed
+from main.analysis.validation_calculator import ValidationCalculator
+from main.modulo_similaridad.embeadding.embeddings import compute_kpca, compute_svd
+from main.modulo_similaridad.embeadding.features import build_user_features
+
+BENCHMARK_SIZES = (1000, 10_000, 100_000)
+EXACT_MAX_USERS = 10_000
+SIMILARITY_THRESHOLD = 0.7
+N_TOP = 20
+BLOCK_SIZE = 512
+
+
+def blocked_recommendations(split_df, emb_df, threshold=SIMILARITY_THRESHOLD, n_top=N_TOP,
+                            block_size=BLOCK_SIZE) -> pd.DataFrame:
+    """
+    (Usuario, Recommended_Role) pairs: roles of the n_top most similar users
+    (cosine >= threshold) that the user does not have, one row block at a time.
+    """
+    Z = normalize(emb_df.to_numpy())
+    roles = split_df.set_index('Usuario')['Rol'].reindex(emb_df.index).map(set).tolist()
+    users = emb_df.index.to_numpy()
+    k = min(n_top, len(users) - 1)
+    pairs = set()
+    for start in range(0, len(users), block_size):
+        stop = min(start + block_size, len(users))
+        sim = Z[start:stop] @ Z.T
+        sim[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+        for row, neighbors in enumerate(top):
+            neighbors = neighbors[sim[row, neighbors] >= threshold]
+            user = users[start + row]
+            own = roles[start + row]
+            for j in neighbors:
+                pairs.update((user, role) for role in roles[j] - own)
+    return pd.DataFrame(sorted(pairs), columns=['Usuario', 'Recommended_Role'])
+
+
+def benchmark_svd(sizes=BENCHMARK_SIZES, n_components=10, kernel='rbf', gamma='scale',
+                  exact_max_users=EXACT_MAX_USERS) -> pd.DataFrame:
+    """
+    Compare compute_svd and compute_kpca on synthetic users.
+
+    Args:
+        sizes: Numbers of synthetic users
+        n_components: Embedding dimension
+        kernel, gamma: KPCA parameters
+        exact_max_users: Largest size run with exact KPCA (Nyström above it)
+
+    Returns:
+        DataFrame with one row per (size, embedding)
+    """
+    rows = []
+    for n_users in sizes:
+        split_df, resumen_df = synthetic_split_roles(n_users, with_future=True)
+        X = build_user_features(split_df, sparse=True)
+        kpca_method = 'exact' if n_users <= exact_max_users else 'nystroem'
+        runs = [
+            (f"kpca_{kpca_method}", lambda: compute_kpca(X, n_components=n_components, kernel=kernel,
+                                                         gamma=gamma, method=kpca_method)),
+            ('svd', lambda: compute_svd(X, n_components=n_components)),
+        ]
+        for name, embed in runs:
+            (emb_df, _), elapsed, peak = _timed(embed)
+            predictions = blocked_recommendations(split_df, emb_df)
+            validation = ValidationCalculator(predictions, split_df[['Usuario', 'Rol']], resumen_df)
+            results = validation.compute_validation()
+            rows.append({
+                'users': n_users,
+                'embedding': name,
+                'seconds': round(elapsed, 3),
+                'peak_mb': round(peak / 1024 ** 2, 1),
+                'recommendations': len(predictions),
+                'precision': round(results['precision'], 2),
+                'recall': round(results['recall'], 2),
+            })
+            print(rows[-1])
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark of truncated-SVD embeddings vs KPCA")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(BENCHMARK_SIZES))
+    parser.add_argument("--n-components", type=int, default=10)
+    parser.add_argument("--output", default=None, help="CSV file for the report")
+    args = parser.parse_args()
+
+    report = benchmark_svd(args.sizes, n_components=args.n_components)
+    print(report.to_string(index=False))
+    if args.output:
+        report.to_csv(args.output, index=False)
@@ -15,6 +15,10 @@ import numpy as np
 from typing import Union, Dict, Optional, Tuple
 from pathlib import Path
 
+from utils.incidence import is_incidence_store, load_incidence
+from utils.encoding import Vocabulary, known_pairs, pair_keys
+from utils.resumen import read_resumen
+
 
 def extract_role_prefix(role_full: str) -> str:
     """
@@ -60,7 +64,8 @@ class ValidationCalculator:
         Args:
             predictions_data: DataFrame or path to CSV with predictions
                             Required columns: Usuario, Recommended_Role (or Recomendation)
-            past_assignments_data: DataFrame or path to CSV with past assignments
+            past_assignments_data: DataFrame, path to CSV or incidence store folder
+                                  (utils.incidence) with past assignments
                                   Required columns: Usuario, Rol
             resumen_data: DataFrame or path to CSV with future assignments
                          Required columns: Usuario, Rol, Fecha (optional)
@@ -110,12 +115,18 @@ class ValidationCalculator:
         return df
     
     def _load_past_assignments(self, data: Union[pd.DataFrame, str]) -> pd.DataFrame:
-        """Load past assignments data from DataFrame or CSV file."""
+        """Load past assignments data from DataFrame, CSV file or incidence store."""
         if isinstance(data, pd.DataFrame):
             df = data.copy()
         elif isinstance(data, str):
             if not Path(data).exists():
                 raise FileNotFoundError(f"Past assignments file not found: {data}")
+            if is_incidence_store(data):
+                # Already one (Usuario, Rol) row per role, no list parsing needed
+                pairs = load_incidence(data).user_role_pairs()
+                pairs = pairs[pairs['Rol'] != 'NONE']
+                pairs['Rol'] = pairs['Rol'].apply(extract_role_prefix)
+                return pairs[['Usuario', 'Rol']].drop_duplicates()
             df = pd.read_csv(data)
         else:
             raise TypeError(f"past_assignments_data must be DataFrame or str, got {type(data)}")
@@ -173,13 +184,14 @@ class ValidationCalculator:
         return past_assignments
     
     def _load_resumen(self, data: Union[pd.DataFrame, str], date_filter: Optional[str] = None) -> pd.DataFrame:
-        """Load resumen (future assignments) data from DataFrame or CSV file."""
+        """
+        Load resumen (future assignments) data from DataFrame, CSV file or
+        month-partitioned store (only the months after date_filter are read).
+        """
         if isinstance(data, pd.DataFrame):
             df = data.copy()
         elif isinstance(data, str):
-            if not Path(data).exists():
-                raise FileNotFoundError(f"Resumen file not found: {data}")
-            df = pd.read_csv(data)
+            df = read_resumen(data, fecha_min=date_filter, inclusive=False)
         else:
             raise TypeError(f"resumen_data must be DataFrame or str, got {type(data)}")
         
@@ -217,22 +229,24 @@ class ValidationCalculator:
             raise ValueError("Resumen DataFrame must have 'Usuario' and 'Rol' columns")
     
     def _add_user_role_keys(self):
-        """Add User_Role key columns for matching."""
-        # Predictions
+        """
+        Add integer User_Id and User_Role key columns for matching.
+
+        Users (upper-cased) and roles are dictionary-encoded with vocabularies
+        shared by the three DataFrames, and User_Role is the int64 pair key
+        (see utils.encoding.pair_keys), so matching runs on integer arrays.
+        """
+        self.user_vocabulary = Vocabulary()
+        self.role_vocabulary = Vocabulary()
         role_col = 'Recommended_Role' if 'Recommended_Role' in self.predictions_df.columns else 'Recomendation'
-        self.predictions_df['User_Role'] = (
-            self.predictions_df['Usuario'].str.upper() + "_" + self.predictions_df[role_col].astype(str)
-        )
         
-        # Past assignments
-        self.past_assignments_df['User_Role'] = (
-            self.past_assignments_df['Usuario'].str.upper() + "_" + self.past_assignments_df['Rol'].astype(str)
-        )
-        
-        # Resumen - use Rol_Prefix instead of Rol for matching
-        self.resumen_df['User_Role'] = (
-            self.resumen_df['Usuario'].str.upper() + "_" + self.resumen_df['Rol_Prefix'].astype(str)
-        )
+        # Predictions, past assignments and resumen (use Rol_Prefix instead of Rol for matching)
+        for df, col in ((self.predictions_df, role_col),
+                        (self.past_assignments_df, 'Rol'),
+                        (self.resumen_df, 'Rol_Prefix')):
+            df['User_Id'] = self.user_vocabulary.encode(df['Usuario'].str.upper(), add=True)
+            role_ids = self.role_vocabulary.encode(df[col].astype(str), add=True)
+            df['User_Role'] = pair_keys(df['User_Id'], role_ids)
     
     def compute_validation(self) -> Dict:
         """
@@ -254,37 +268,38 @@ class ValidationCalculator:
                 - true_hit_predictions_df: DataFrame with only true hits
         """
         # Get unique users from predictions
-        predicted_users = set(self.predictions_df['Usuario'].str.upper().unique())
+        predicted_users = np.unique(self.predictions_df['User_Id'].to_numpy())
         
         # Filter resumen and past assignments to only include users in predictions
         resumen_filtered = self.resumen_df[
-            self.resumen_df['Usuario'].str.upper().isin(predicted_users)
+            self.resumen_df['User_Id'].isin(predicted_users)
         ].copy()
         
         past_filtered = self.past_assignments_df[
-            self.past_assignments_df['Usuario'].str.upper().isin(predicted_users)
+            self.past_assignments_df['User_Id'].isin(predicted_users)
         ].copy()
 
 
-        # Get unique user-role pairs
-        predicted_pairs = set(self.predictions_df['User_Role'].unique())
-        future_pairs = set(resumen_filtered['User_Role'].unique())
-        past_pairs = set(past_filtered['User_Role'].unique())
+        # Get unique user-role pairs (sorted int64 key arrays); rows with a missing
+        # user or role have key -1 and would otherwise all match each other
+        predicted_pairs = known_pairs(self.predictions_df['User_Role'])
+        future_pairs = known_pairs(resumen_filtered['User_Role'])
+        past_pairs = known_pairs(past_filtered['User_Role'])
         
         # STEP 1: Find predictions in future assignments
-        matches_in_future = predicted_pairs.intersection(future_pairs)
+        matches_in_future = np.intersect1d(predicted_pairs, future_pairs, assume_unique=True)
         
         # STEP 2: Filter out false positives (already in past)
-        false_positives = matches_in_future.intersection(past_pairs)
+        false_positives = np.intersect1d(matches_in_future, past_pairs, assume_unique=True)
         
         # STEP 3: TRUE HITS = In Future AND NOT in Past
-        true_hits = matches_in_future - false_positives
+        true_hits = np.setdiff1d(matches_in_future, false_positives, assume_unique=True)
         
         # Predictions not in resumen
-        not_in_resumen = predicted_pairs - future_pairs
+        not_in_resumen = np.setdiff1d(predicted_pairs, future_pairs, assume_unique=True)
         
         # Recommendations for roles already had
-        already_had = predicted_pairs.intersection(past_pairs)
+        already_had = np.intersect1d(predicted_pairs, past_pairs, assume_unique=True)
         
         # Add validation flags to predictions DataFrame
         predictions_validated = self.predictions_df.copy()
@@ -294,11 +309,11 @@ class ValidationCalculator:
         predictions_validated['Is_False_Positive'] = predictions_validated['User_Role'].isin(false_positives)
         
         # Calculate metrics
-        precision = (len(true_hits) / len(predicted_pairs) * 100) if predicted_pairs else 0
+        precision = (len(true_hits) / len(predicted_pairs) * 100) if len(predicted_pairs) else 0
         
         # Recall = True Hits / Truly New Future Roles
-        truly_new_future_roles = future_pairs - past_pairs
-        recall = (len(true_hits) / len(truly_new_future_roles) * 100) if truly_new_future_roles else 0
+        truly_new_future_roles = np.setdiff1d(future_pairs, past_pairs, assume_unique=True)
+        recall = (len(true_hits) / len(truly_new_future_roles) * 100) if len(truly_new_future_roles) else 0
         
         # Get true hit predictions with dates if available
         true_hit_predictions = predictions_validated[predictions_validated['Is_True_Hit']].copy()
@@ -318,7 +333,7 @@ class ValidationCalculator:
             'true_hits': len(true_hits),
             'precision': precision,
             'recall': recall,
-            'old_match_rate': (len(matches_in_future) / len(predicted_pairs) * 100) if predicted_pairs else 0,
+            'old_match_rate': (len(matches_in_future) / len(predicted_pairs) * 100) if len(predicted_pairs) else 0,
             'date_filter': self.date_filter
         }
         
@@ -434,7 +449,7 @@ class ValidationCalculator:
         
         # Get future roles from resumen - use Rol_Prefix
         resumen_filtered = self.results['resumen_filtered']
-        user_future = resumen_filtered.groupby('Usuario')['Rol_Prefix'].nunique().reset_index(name='Future_Roles')
+        user_future = resumen_filtered.groupby('Usuario', observed=True)['Rol_Prefix'].nunique().reset_index(name='Future_Roles')
         user_stats = user_stats.merge(user_future, on='Usuario', how='left')
         user_stats['Future_Roles'] = user_stats['Future_Roles'].fillna(0).astype(int)
         
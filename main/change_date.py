@@ -1,8 +1,14 @@
 import argparse
+import sys
+import os
 from pathlib import Path
 import pandas as pd
 from datetime import datetime
 from ast import literal_eval
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.incidence import load_split_roles, is_incidence_store
+from utils.resumen import read_resumen, is_resumen_store
 
 def safe_list(val):
 	if isinstance(val, list):
@@ -36,7 +42,7 @@ def build_roles_to_remove(resumen_df: pd.DataFrame, cutoff: str) -> dict:
 	posteriores['RolBase'] = posteriores['Rol'].astype(str).str.split('-').str[0]
 
 	# Mapa: usuario -> set(roles a remover)
-	roles_remove = posteriores.groupby('Usuario')['RolBase'].apply(lambda s: set(s.dropna().tolist())).to_dict()
+	roles_remove = posteriores.groupby('Usuario', observed=True)['RolBase'].apply(lambda s: set(s.dropna().tolist())).to_dict()
 	return roles_remove
 
 
@@ -90,20 +96,21 @@ def main():
 	# Rutas
 	base = Path('data/processed')
 	split_roles_path = base / 'split_roles.csv'
+	split_roles_store = base / 'split_roles'
 	resumen_path = base / 'resumen_2025.csv'
+	resumen_store = base / 'resumen'
 
-	if not split_roles_path.exists():
+	if not split_roles_path.exists() and not is_incidence_store(split_roles_store):
 		print(f'No existe {split_roles_path}')
 		return
-	if not resumen_path.exists():
+	if not resumen_path.exists() and not is_resumen_store(resumen_store):
 		print(f'No existe {resumen_path}')
 		return
 
 	# Carga
-	split_roles_df = pd.read_csv(split_roles_path)
-	split_roles_df['Rol'] = split_roles_df['Rol'].apply(literal_eval)
-	split_roles_df['Location'] = split_roles_df['Location'].apply(literal_eval)
-	resumen_df = pd.read_csv(resumen_path)
+	split_roles_df = load_split_roles(split_roles_path)
+	# Solo se leen los meses posteriores a cutoff
+	resumen_df = read_resumen(resumen_path, fecha_min=cutoff, inclusive=False)
 
 	# Validación de columnas mínimas
 	for col in ['Usuario', 'Rol']:
@@ -3,16 +3,26 @@ from pathlib import Path
 from main.modulo_similaridad.similarity import SimilarityCalculator
 from main.analysis.validation_calculator import ValidationCalculator
 from main.modulo_recomendacion_roles.predictor import RoleRecommendationPredictor
+from utils.artifact_cache import hash_file
+from utils.precision import DEFAULT_PRECISION
 
 MODEL_PATH = "models/modulo_recomendacion_roles/20251012_173859_TargetEnc_m20_s15_LGBM_set6_BEST.joblib"
 OUTPUT_PATH = "data/outputs/test_full/filtered_recommendations_classifier.csv"
+ARTIFACT_CACHE_PATH = "data/.cache/artifacts"
 mkdir = Path(OUTPUT_PATH).parent
 mkdir.mkdir(parents=True, exist_ok=True)
 
 
 class CmpcRoleRecommender:
-    def __init__(self, similarity_metric, resumen_data_path, n_top = 10, data_folder = "data", threshold=0.7, data_type = ".csv"):
-        self.similarity_calculator = SimilarityCalculator(similarity_metric, n_top, data_folder, threshold, data_type)
+    def __init__(self, similarity_metric, resumen_data_path, n_top = 10, data_folder = "data", threshold=0.7, data_type = ".csv", cache_dir=None,
+                 precision=DEFAULT_PRECISION, neighbor_graph=False, neighbor_index=None):
+        # cache_dir enables the artifact cache (features, embedding, similarity, candidates, scored table)
+        # precision: 'float64', 'float32' or 'float16' (float32 compute, float16 similarity matrix)
+        # neighbor_graph: keep only the top n_top neighbors per user instead of the dense similarity matrix
+        # neighbor_index: 'exact' or 'rp_forest' neighbor index queried for the n_top neighbors of each user
+        self.similarity_calculator = SimilarityCalculator(similarity_metric, n_top, data_folder, threshold, data_type, cache_dir=cache_dir,
+                                                          precision=precision, neighbor_graph=neighbor_graph,
+                                                          neighbor_index=neighbor_index)
 
         self.resumen_data = pd.read_csv(resumen_data_path)
         self.split_roles = self.similarity_calculator.get_split_df()
@@ -33,9 +43,14 @@ class CmpcRoleRecommender:
     def classify_recommendations(self, model_path=MODEL_PATH,threshold=0.5):
         self.predictor = RoleRecommendationPredictor(model_path,classification_threshold=threshold)
         
-        features_df = self.predictor.prepare_features(self.recommendations, self.split_roles)
-        self.predictor.load_model()
-        self.predictions_df_full = self.predictor.predict(features_df)   
+        def score():
+            features_df = self.predictor.prepare_features(self.recommendations, self.split_roles)
+            self.predictor.load_model()
+            return self.predictor.predict(features_df)
+        # The scored table does not depend on the classification threshold, only on the candidates and the model
+        calculator = self.similarity_calculator
+        params = {'model': hash_file(model_path)} if calculator.cache else {}
+        self.predictions_df_full = calculator.run_stage('scored', 'candidates', params, score)
         self.predictions_df = self.predictor.filter_recommendations(self.predictions_df_full)
 
 
@@ -92,6 +107,7 @@ if __name__ == "__main__":
             similarity_metric='cosine',
             resumen_data_path='data/processed/resumen_2025.csv',
             threshold=s_threshold,
+            cache_dir=ARTIFACT_CACHE_PATH,
         )
         recommendations = recommender.run_recommendations()
         thresholds= [0.5, 0.6, 0.7, 0.8, 0.9]
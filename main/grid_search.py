@@ -1,32 +1,52 @@
 
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
 import pandas as pd
-from user_vector import createUsersVector
+from pathlib import Path
+import multiprocessing
 import utils.utils as ut
-from sklearn.metrics.pairwise import cosine_similarity
+from utils.block_gram import BlockGramEngine
+from utils.resumen import read_resumen
+from utils.sparse_features import SparseFeatures
 import concurrent.futures
 
-def evaluate_combination(args):
-    # Desempaqueta los argumentos
-    (params, base_uv_df, department_cols, function_cols, roleloc_cols, roles_cols, resumen_df, split_df) = args
-    import pandas as pd
-    from sklearn.metrics.pairwise import cosine_similarity
-    import utils.utils as ut
-    department_weight, role_weight, area_weight, subarea_weight, neighbors = params
-    uv_df = base_uv_df.copy()
-    uv_df[department_cols] = uv_df[department_cols] * department_weight
-    uv_df[function_cols] = uv_df[function_cols] * role_weight
-    uv_df[roleloc_cols] = uv_df[roleloc_cols] * area_weight
-    uv_df[roles_cols] = uv_df[roles_cols] * subarea_weight
-
-    sim_matrix = cosine_similarity(uv_df.values)
-    sim_df = pd.DataFrame(sim_matrix, index=uv_df.index, columns=uv_df.index)
+# Motor de Grams por bloque del proceso (ver _init_worker)
+_ENGINE = None
+_RESUMEN_DF = None
+_SPLIT_DF = None
+
+
+def _init_worker(engine, resumen_df, split_df):
+    """
+    Recibe una sola vez por proceso el motor de Grams (o las features con que construirlo) y los datos de
+    evaluación. Con fork el motor del proceso padre se hereda sin copiarlo; con spawn se reciben las
+    features (CSR) y cada proceso calcula sus propios Grams.
+    """
+    global _ENGINE, _RESUMEN_DF, _SPLIT_DF
+    if isinstance(engine, SparseFeatures):
+        engine = BlockGramEngine(engine)
+    _ENGINE, _RESUMEN_DF, _SPLIT_DF = engine, resumen_df, split_df
+
+
+def evaluate_combination(params, engine=None, resumen_df=None, split_df=None):
+    # La similitud de cada combinación es sum_b w_b^2 G_b normalizada (sin copiar base_uv_df)
+    engine = engine if engine is not None else _ENGINE
+    resumen_df = resumen_df if resumen_df is not None else _RESUMEN_DF
+    split_df = split_df if split_df is not None else _SPLIT_DF
+    department_weight, role_weight, subarea_weight, neighbors = params
+    sim_df = engine.similarity_df({
+        'department': department_weight,
+        'function': role_weight,
+        'roles': subarea_weight,
+    })
     result = ut.roles_found(sim_df, resumen_df, split_df, k=neighbors, threshold=0.7)
     if result:
         print(f"total_roles {result[0]}, found_roles {result[1]}, score {result[2]} | params: {params}")
         return {
             "department_weight": department_weight,
             "role_weight": role_weight,
-            "area_weight": area_weight,
             "subarea_weight": subarea_weight,
             "neighbors": neighbors,
             "total_roles": result[0],
@@ -40,46 +60,46 @@ def grid_search():
     best_params = None
     best_score = float("-inf")
     resumen_path = 'data/processed/resumen_2025.csv'
-    resumen_df = pd.read_csv(resumen_path)
+    resumen_df = read_resumen(resumen_path, fecha_min='2025-06-01')
 
-    user_addr_df, agr_users_df, agr_1251_df = ut.load_data(".csv")
-    if user_addr_df is None or agr_users_df is None or agr_1251_df is None:
+    user_addr_df, agr_users_df = ut.load_data(Path("data"), ".csv")
+    if user_addr_df is None or agr_users_df is None:
         print("Error loading data.")
         return
 
-    merged_df = ut.merge_df(user_addr_df, agr_users_df, agr_1251_df)
+    merged_df = ut.merge_df(user_addr_df, agr_users_df)
     split_df = ut.split_merge_df(merged_df)
 
-    # Calcula una sola vez el vector multi-hot base (todos los pesos en 1)
-    base_uv_df = ut.create_user_multihot_vectors(split_df, 1, 1, 1, 1)
-
-    # Identifica las columnas de cada tipo
-    department_cols = [col for col in base_uv_df.columns if col.startswith('Departamento')]
-    function_cols = [col for col in base_uv_df.columns if col.startswith('Función')]
-    roleloc_cols = [col for col in base_uv_df.columns if col.startswith('pair_')]
-    roles_cols = [col for col in base_uv_df.columns if col.startswith('role_')]
+    # Calcula una sola vez el vector multi-hot base (todos los pesos en 1) y los Grams por bloque
+    base_features = ut.create_user_multihot_vectors(split_df, 1, 1, 1, 1, sparse=True)
 
     weight_combinations = [0, 0.1, 0.5, 1, 2, 5]
     neighbor_options = [10, 50, 100, -1]
 
-    # Prepara todas las combinaciones de hiperparámetros
+    # Prepara todas las combinaciones de hiperparámetros. area_weight (pares rol-location) no tiene
+    # bloque en el vector multi-hot actual, así que no se recorre (solo repetiría evaluaciones)
     from itertools import product
-    param_grid = list(product(weight_combinations, weight_combinations, weight_combinations, weight_combinations, neighbor_options))
+    param_grid = list(product(weight_combinations, weight_combinations, weight_combinations, neighbor_options))
 
     results = []
 
-    # Prepara los argumentos para cada proceso
-    args_list = [
-        (params, base_uv_df, department_cols, function_cols, roleloc_cols, roles_cols, resumen_df, split_df)
-        for params in param_grid
-    ]
-
-    # Paraleliza la evaluación de combinaciones
+    # Paraleliza la evaluación de combinaciones; las que solo cambian neighbors van juntas (misma similitud).
+    # Memoria (n usuarios, B=3 bloques, W procesos, float64):
+    #   fork:  los Grams se calculan una vez en el padre y los procesos los comparten (copy-on-write,
+    #          solo se leen): (B + W) * n^2 * 8 bytes
+    #   spawn: cada proceso recibe las features CSR y calcula sus Grams: W * (B + 1) * n^2 * 8 bytes
     import os
     max_workers = min(8, os.cpu_count() or 1)  # Puedes ajustar este valor
-    import concurrent.futures
-    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        for res in executor.map(evaluate_combination, args_list):
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        engine = BlockGramEngine(base_features)
+    else:
+        context = None
+        engine = base_features
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                                initializer=_init_worker,
+                                                initargs=(engine, resumen_df, split_df)) as executor:
+        for res in executor.map(evaluate_combination, param_grid, chunksize=len(neighbor_options)):
             if res:
                 results.append(res)
 
@@ -87,7 +107,7 @@ def grid_search():
     for res in results:
         if res["score"] > best_score:
             best_score = res["score"]
-            best_params = (res["department_weight"], res["role_weight"], res["area_weight"], res["subarea_weight"], res["neighbors"])
+            best_params = (res["department_weight"], res["role_weight"], res["subarea_weight"], res["neighbors"])
 
     # Guarda los resultados en un CSV
     results_df = pd.DataFrame(results)
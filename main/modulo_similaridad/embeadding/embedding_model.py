@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils.sparse_features import SparseFeatures
+from main.modulo_similaridad.embeadding.embeddings import compute_embedding
+from main.modulo_similaridad.embeadding.features import build_user_features
+
+EMBEDDING_MODEL_PATH = "models/modulo_similaridad/embedding_model.joblib"
+# Refit policy: age of the model and drift of the feature distribution
+REFIT_MAX_AGE_DAYS = 30
+REFIT_DRIFT_THRESHOLD = 0.1
+
+
+def align_features(X: pd.DataFrame | SparseFeatures, columns: list, dtype: str = 'float64') -> sparse.csr_matrix:
+    """Reorder X to the given feature columns: unknown features are dropped, missing ones are zero."""
+    if isinstance(X, SparseFeatures):
+        if X.columns == list(columns):
+            # Encoded with the same FeatureVocabulary: already aligned
+            return X.matrix.astype(dtype, copy=False)
+        position = pd.Index(columns).get_indexer(X.columns)
+        coo = X.matrix.tocoo()
+        keep = position[coo.col] >= 0
+        return sparse.csr_matrix(
+            (coo.data[keep].astype(dtype, copy=False), (coo.row[keep], position[coo.col[keep]])),
+            shape=(X.shape[0], len(columns)),
+        )
+    return sparse.csr_matrix(X.reindex(columns=columns, fill_value=0).to_numpy(dtype=dtype))
+
+
+def feature_distribution(X: pd.DataFrame | SparseFeatures) -> pd.Series:
+    """Share of the total feature mass in each column."""
+    if isinstance(X, SparseFeatures):
+        totals = pd.Series(np.asarray(abs(X.matrix).sum(axis=0)).ravel(), index=X.columns)
+    else:
+        totals = X.abs().sum(axis=0)
+    total = totals.sum()
+    return totals / total if total > 0 else totals
+
+
+class EmbeddingModel:
+    """
+    Fitted embedding model (KPCA or truncated SVD) together with the feature vocabulary it was fitted on.
+
+    New or changed users are projected into the existing space with
+    transform (kernel against the training users only), without refitting.
+
+    Attributes:
+        kpca: Fitted sklearn KernelPCA, NystroemKPCA or TruncatedSVD
+        columns (list): Feature vocabulary (column order of the training matrix)
+        feature_params (dict): Block weights used to build the features
+        kpca_params (dict): Parameters of compute_embedding
+        fitted_at (datetime): Fit time
+        n_users (int): Users in the training matrix
+        distribution (pd.Series): Feature distribution of the training matrix (drift reference)
+    """
+
+    def __init__(self, kpca, columns, feature_params, kpca_params, distribution, n_users, fitted_at=None):
+        self.kpca = kpca
+        self.columns = list(columns)
+        self.feature_params = dict(feature_params)
+        self.kpca_params = dict(kpca_params)
+        self.distribution = distribution
+        self.n_users = n_users
+        self.fitted_at = fitted_at or datetime.now()
+
+    @classmethod
+    def fit(cls, X: pd.DataFrame | SparseFeatures, feature_params: dict, **kpca_params):
+        """
+        Fit the embedding on X (kpca_params may select embedding='svd').
+
+        Returns:
+            (embedding_df, EmbeddingModel)
+        """
+        emb_df, kpca = compute_embedding(X, **kpca_params)
+        model = cls(kpca, X.columns, feature_params, kpca_params, feature_distribution(X), X.shape[0])
+        return emb_df, model
+
+    def transform(self, X: pd.DataFrame | SparseFeatures) -> pd.DataFrame:
+        """Project users (features built with feature_params) into the fitted space."""
+        dtype = self.kpca_params.get('dtype', 'float64')
+        Z = self.kpca.transform(align_features(X, self.columns, dtype)).astype(dtype, copy=False)
+        prefix = self.kpca_params.get('embedding', 'kpca')
+        cols = [f"{prefix}_{i+1}" for i in range(Z.shape[1])]
+        return pd.DataFrame(Z, index=X.index, columns=cols)
+
+    def drift(self, X: pd.DataFrame | SparseFeatures) -> float:
+        """
+        Total variation distance between the feature distribution of X and the
+        training one (features unknown to the model count fully as drift).
+        """
+        current = feature_distribution(X)
+        reference = self.distribution.reindex(current.index.union(self.distribution.index), fill_value=0)
+        current = current.reindex(reference.index, fill_value=0)
+        return float(0.5 * (current - reference).abs().sum())
+
+    def needs_refit(self, X: pd.DataFrame | SparseFeatures,
+                    max_age_days: int = REFIT_MAX_AGE_DAYS,
+                    drift_threshold: float = REFIT_DRIFT_THRESHOLD) -> bool:
+        """Refit when the model is older than max_age_days or X drifted beyond drift_threshold."""
+        age_days = (datetime.now() - self.fitted_at).days
+        if age_days >= max_age_days:
+            print(f"Embedding model has {age_days} days: refit")
+            return True
+        drift = self.drift(X)
+        if drift > drift_threshold:
+            print(f"Feature drift {drift:.3f} > {drift_threshold}: refit")
+            return True
+        return False
+
+    def save(self, path=EMBEDDING_MODEL_PATH) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(self, path)
+        return path
+
+    @staticmethod
+    def load(path=EMBEDDING_MODEL_PATH) -> "EmbeddingModel":
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Embedding model not found: {path}")
+        return joblib.load(path)
+
+
+def transform_new_users(split_df: pd.DataFrame, model: EmbeddingModel | str = EMBEDDING_MODEL_PATH,
+                        sparse_features: bool = False, vocabulary=None, hash_dims=None) -> pd.DataFrame:
+    """
+    Embed new or changed users with a saved model, without refitting.
+
+    Args:
+        split_df: split_roles rows of the users to embed
+        model: EmbeddingModel or path to a saved one
+        sparse_features: Build the users' features as SparseFeatures
+        vocabulary: FeatureVocabulary the model features were encoded with
+                    (the users are then encoded directly in the model columns)
+        hash_dims: Buckets per block if the model was fitted on hashed features
+
+    Returns:
+        Embedding DataFrame indexed by Usuario
+    """
+    if not isinstance(model, EmbeddingModel):
+        model = EmbeddingModel.load(model)
+    X = build_user_features(split_df, sparse=sparse_features, vocabulary=vocabulary,
+                            hash_dims=hash_dims, **model.feature_params)
+    return model.transform(X)
+
+
+def reusable_model(X: pd.DataFrame | SparseFeatures, feature_params: dict, kpca_params: dict,
+                   model_path: Optional[str] = EMBEDDING_MODEL_PATH,
+                   max_age_days: int = REFIT_MAX_AGE_DAYS,
+                   drift_threshold: float = REFIT_DRIFT_THRESHOLD) -> Optional[EmbeddingModel]:
+    """Saved model if it can embed X: present, fitted with the same parameters, not too old nor drifted (else None)."""
+    if model_path is None or not Path(model_path).exists():
+        return None
+    model = EmbeddingModel.load(model_path)
+    same_params = model.feature_params == feature_params and model.kpca_params == kpca_params
+    if same_params and not model.needs_refit(X, max_age_days, drift_threshold):
+        return model
+    return None
+
+
+def fit_and_save(X: pd.DataFrame | SparseFeatures, feature_params: dict, kpca_params: dict,
+                 model_path: Optional[str] = EMBEDDING_MODEL_PATH):
+    """Fit a new model on X and save it to model_path (if any); returns (embedding_df, EmbeddingModel)."""
+    emb_df, model = EmbeddingModel.fit(X, feature_params, **kpca_params)
+    if model_path is not None:
+        model.save(model_path)
+    return emb_df, model
+
+
+def fit_or_transform(X: pd.DataFrame | SparseFeatures, feature_params: dict, kpca_params: dict,
+                     model_path: Optional[str] = EMBEDDING_MODEL_PATH,
+                     max_age_days: int = REFIT_MAX_AGE_DAYS,
+                     drift_threshold: float = REFIT_DRIFT_THRESHOLD):
+    """
+    Reuse the saved model for X unless it is missing, fitted with other
+    parameters, too old or drifted; otherwise refit and save it.
+
+    Returns:
+        (embedding_df, EmbeddingModel)
+    """
+    model = reusable_model(X, feature_params, kpca_params, model_path, max_age_days, drift_threshold)
+    if model is not None:
+        return model.transform(X), model
+    return fit_and_save(X, feature_params, kpca_params, model_path)
@@ -1,41 +1,166 @@
 from __future__ import annotations
 
+import numpy as np
 import pandas as pd
 from typing import Tuple, Optional
-from sklearn.decomposition import KernelPCA
+from sklearn.decomposition import IncrementalPCA, KernelPCA, TruncatedSVD
+from sklearn.kernel_approximation import Nystroem
+
+from utils.sparse_features import SparseFeatures, kernel_stats
+
+# Backends of compute_kpca
+KPCA_METHODS = ('exact', 'randomized', 'nystroem')
+DEFAULT_LANDMARKS = 1000
+DEFAULT_BATCH_SIZE = 10_000
+# Embeddings selectable in SimilarityCalculator.compute_embeddings
+EMBEDDING_METHODS = ('kpca', 'svd')
+# Kernels whose sklearn implementation takes a gamma parameter
+GAMMA_KERNELS = ('rbf', 'laplacian', 'poly', 'sigmoid', 'chi2')
+
+
+class NystroemKPCA:
+    """Approximate kernel PCA: Nyström feature map on landmark users + incremental PCA.
+
+    The kernel is only evaluated between users and n_landmarks landmarks and
+    users are processed in batches, so memory is O(batch_size * n_landmarks)
+    instead of O(n^2), and time is linear in the number of users.
+    """
+
+    def __init__(self, n_components=2, kernel='rbf', gamma=None, n_landmarks=DEFAULT_LANDMARKS,
+                 batch_size=DEFAULT_BATCH_SIZE, random_state=42):
+        self.n_components = n_components
+        self.kernel = kernel
+        self.gamma = gamma
+        self.n_landmarks = n_landmarks
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+    def _batches(self, n):
+        # The last batch is merged into the previous one if it is smaller than n_components
+        bounds = list(range(0, n, self.batch_size)) + [n]
+        if len(bounds) > 2 and bounds[-1] - bounds[-2] < self.n_components:
+            bounds.pop(-2)
+        return zip(bounds[:-1], bounds[1:])
+
+    def fit(self, X):
+        n_landmarks = min(self.n_landmarks, X.shape[0])
+        kernel_params = {'gamma': self.gamma} if self.kernel in GAMMA_KERNELS else {}
+        self.nystroem_ = Nystroem(kernel=self.kernel, n_components=n_landmarks,
+                                  random_state=self.random_state, **kernel_params).fit(X)
+        self.pca_ = IncrementalPCA(n_components=self.n_components)
+        for start, stop in self._batches(X.shape[0]):
+            self.pca_.partial_fit(self.nystroem_.transform(X[start:stop]))
+        return self
+
+    def transform(self, X):
+        return np.vstack([
+            self.pca_.transform(self.nystroem_.transform(X[start:stop]))
+            for start, stop in self._batches(X.shape[0])
+        ])
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+
+def feature_matrix(X: pd.DataFrame | SparseFeatures, dtype: str = 'float64'):
+    """CSR matrix of a SparseFeatures or array of a DataFrame, in dtype."""
+    if isinstance(X, SparseFeatures):
+        return X.astype(dtype).matrix
+    return X.to_numpy(dtype=dtype)
 
 
 def compute_kpca(
-    X: pd.DataFrame,
+    X: pd.DataFrame | SparseFeatures,
     n_components: int = 2,
     kernel: str = 'rbf',
     gamma: str | float | None = 'scale',
     random_state: Optional[int] = 42,
+    method: str = 'exact',
+    n_landmarks: int = DEFAULT_LANDMARKS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dtype: str = 'float64',
 ):
     """Compute Kernel PCA embeddings over a numeric feature matrix X.
 
     Returns (embedding_df, model) where embedding_df has the same index as X
-    and columns ['kpca_1', 'kpca_2', ...].
+    and columns ['kpca_1', 'kpca_2', ...]. X may be a SparseFeatures; the
+    kernel is then computed from the CSR matrix without densifying X.
+
+    method selects the backend:
+      - 'exact': KernelPCA with the full n x n kernel (O(n^2) memory, O(n^3) time)
+      - 'randomized': KernelPCA with the randomized eigensolver (full kernel,
+        only the top n_components eigenpairs are computed)
+      - 'nystroem': NystroemKPCA with n_landmarks landmarks, processed in
+        batches of batch_size users (bounded memory, for large user bases)
+
+    dtype ('float64' or 'float32') is the dtype of the input matrix, of the
+    kernel computations and of the returned embeddings.
     """
+    if method not in KPCA_METHODS:
+        raise ValueError(f"Unknown KPCA method: {method}. Options: {KPCA_METHODS}")
     # Normalize gamma option for older sklearn versions that don't accept strings
+    # (the statistics are computed once and cached with the feature matrix)
     gamma_value = gamma
     if isinstance(gamma, str):
-        if gamma.lower() == 'scale':
-            var = float(X.values.var())
-            gamma_value = 1.0 / (X.shape[1] * var) if var > 0 else 1.0
-        elif gamma.lower() == 'auto':
-            gamma_value = 1.0 / X.shape[1] if X.shape[1] > 0 else 1.0
+        if gamma.lower() in ('scale', 'auto'):
+            gamma_value = kernel_stats(X).gamma(gamma.lower())
         else:
             # Fallback to None for unknown strings
             gamma_value = None
 
-    kpca = KernelPCA(
+    if method == 'nystroem':
+        kpca = NystroemKPCA(
+            n_components=n_components,
+            kernel=kernel,
+            gamma=gamma_value,
+            n_landmarks=n_landmarks,
+            batch_size=batch_size,
+            random_state=random_state,
+        )
+    else:
+        kpca = KernelPCA(
+            n_components=n_components,
+            kernel=kernel,
+            gamma=gamma_value,
+            random_state=random_state,
+            eigen_solver='randomized' if method == 'randomized' else 'auto',
+        )
+    Z = kpca.fit_transform(feature_matrix(X, dtype)).astype(dtype, copy=False)
+    cols = [f"kpca_{i+1}" for i in range(n_components)]
+    emb_df = pd.DataFrame(Z, index=X.index, columns=cols)
+    return emb_df, kpca
+
+
+def compute_svd(
+    X: pd.DataFrame | SparseFeatures,
+    n_components: int = 10,
+    n_iter: int = 5,
+    random_state: Optional[int] = 42,
+    dtype: str = 'float64',
+):
+    """Compute linear (LSA-style) embeddings with randomized truncated SVD.
+
+    Works directly on the CSR matrix of a SparseFeatures: the cost is
+    O(nnz * n_components) per iteration and no n x n kernel is built.
+    Returns (embedding_df, model) with columns ['svd_1', 'svd_2', ...]
+    in dtype.
+    """
+    svd = TruncatedSVD(
         n_components=n_components,
-        kernel=kernel,
-        gamma=gamma_value,
+        algorithm='randomized',
+        n_iter=n_iter,
         random_state=random_state,
     )
-    Z = kpca.fit_transform(X.values)
-    cols = [f"kpca_{i+1}" for i in range(n_components)]
+    Z = svd.fit_transform(feature_matrix(X, dtype)).astype(dtype, copy=False)
+    cols = [f"svd_{i+1}" for i in range(n_components)]
     emb_df = pd.DataFrame(Z, index=X.index, columns=cols)
-    return emb_df, kpca
+    return emb_df, svd
+
+
+def compute_embedding(X: pd.DataFrame | SparseFeatures, embedding: str = 'kpca', **params):
+    """Dispatch to compute_kpca or compute_svd; returns (embedding_df, model)."""
+    if embedding == 'kpca':
+        return compute_kpca(X, **params)
+    if embedding == 'svd':
+        return compute_svd(X, **params)
+    raise ValueError(f"Unknown embedding: {embedding}. Options: {EMBEDDING_METHODS}")
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 import pandas as pd
-from typing import Optional
+from typing import Dict, Optional
 
 # Reuse existing, proven implementation
 from utils.utils import create_user_multihot_vectors
+from utils.sparse_features import SparseFeatures
+from utils.feature_vocabulary import FeatureVocabulary
 
 
 def build_user_features(
@@ -12,16 +14,30 @@ def build_user_features(
     department_weight: float = 1.0,
     function_weight: float = 1.0,
     roles_weight: float = 1.0,
-) -> pd.DataFrame:
+    sparse: bool = False,
+    dtype=None,
+    vocabulary: Optional[FeatureVocabulary] = None,
+    hash_dims: Optional[Dict[str, int]] = None,
+) -> pd.DataFrame | SparseFeatures:
     """Create a user feature matrix (multi-hot) from split_roles-like DataFrame.
 
     The function delegates to utils.utils.create_user_multihot_vectors but
     provides a clear, domain-specific entrypoint for the similarity module.
-    Index of the returned DataFrame is 'Usuario'.
+    Index of the returned DataFrame is 'Usuario'. With sparse=True a
+    SparseFeatures (CSR matrix + user index + column blocks) is returned.
+    dtype sets the dtype of the matrix (e.g. np.float32 for the float32 mode).
+    With a fitted FeatureVocabulary the columns are the vocabulary ones, stable
+    across runs (categories unknown to it are ignored). With hash_dims
+    (block -> buckets, see utils.feature_hashing) the categories are hashed
+    into a fixed number of columns per block instead.
     """
     return create_user_multihot_vectors(
         split_df,
         department_weight=department_weight,
         function_weight=function_weight,
         roles_weight=roles_weight,
+        sparse=sparse,
+        dtype=dtype,
+        vocabulary=vocabulary,
+        hash_dims=hash_dims,
     )
@@ -0,0 +1,180 @@
+"""
+Kernel PCA over many (n_components, kernel, gamma) settings with shared work.
+
+The Gram matrix X X^T (and from it the squared distances used by every RBF
+gamma) is computed once. Settings that only differ in n_components share one
+eigendecomposition: the top-k eigenpairs are a prefix of the top-K ones for
+k <= K. Each embedding is yielded as soon as it is ready, so a sweep holds
+at most the Gram, the distances and one kernel matrix in memory.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import linalg, sparse
+
+from utils.sparse_features import SparseFeatures, kernel_stats
+from main.modulo_similaridad.embeadding.embeddings import feature_matrix
+
+SWEEP_KERNELS = ('rbf', 'linear', 'poly', 'sigmoid', 'cosine')
+# Same defaults as sklearn KernelPCA
+DEFAULT_DEGREE = 3
+DEFAULT_COEF0 = 1
+
+
+class KPCASweep:
+    """
+    Exact kernel PCA embeddings of one feature matrix for many settings.
+
+    Embeddings match compute_kpca(method='exact') up to the sign of each
+    component (cosine similarities between users are identical).
+
+    Attributes:
+        index (pd.Index): Usuario of each row
+        gram (np.ndarray): X X^T (users x users)
+        sq_norms (np.ndarray): Squared norm of each row
+        n_features (int): Columns of X
+    """
+
+    def __init__(self, X: pd.DataFrame | SparseFeatures, dtype: str = 'float64'):
+        self.index = X.index
+        self.dtype = dtype
+        self.n_features = X.shape[1]
+        self.stats = kernel_stats(X)
+        M = feature_matrix(X, dtype)
+        gram = M @ M.T
+        self.gram = np.asarray(gram.toarray() if sparse.issparse(gram) else gram, dtype=dtype)
+        self.sq_norms = np.diag(self.gram).copy()
+        self._sq_distances = None
+        self.eigendecompositions = 0
+
+    @property
+    def sq_distances(self) -> np.ndarray:
+        """Squared Euclidean distances ||x_i||^2 + ||x_j||^2 - 2 x_i.x_j (computed on first use)."""
+        if self._sq_distances is None:
+            D = self.gram * -2
+            D += self.sq_norms[:, None]
+            D += self.sq_norms[None, :]
+            np.maximum(D, 0, out=D)
+            self._sq_distances = D
+        return self._sq_distances
+
+    def resolve_gamma(self, gamma) -> float:
+        """'scale' / 'auto' from the cached kernel statistics, None -> 1 / n_features."""
+        if isinstance(gamma, str):
+            return self.stats.gamma(gamma.lower())
+        if gamma is None:
+            return 1.0 / self.n_features if self.n_features > 0 else 1.0
+        return float(gamma)
+
+    def kernel_matrix(self, kernel: str = 'rbf', gamma=None, degree=DEFAULT_DEGREE,
+                      coef0=DEFAULT_COEF0) -> np.ndarray:
+        """Kernel matrix of a setting, in a new users x users array."""
+        if kernel not in SWEEP_KERNELS:
+            raise ValueError(f"Unknown kernel: {kernel}. Options: {SWEEP_KERNELS}")
+        gamma = self.resolve_gamma(gamma)
+        if kernel == 'rbf':
+            K = np.multiply(self.sq_distances, -gamma)
+            np.exp(K, out=K)
+        elif kernel == 'linear':
+            K = self.gram.copy()
+        elif kernel == 'poly':
+            K = np.multiply(self.gram, gamma)
+            K += coef0
+            K **= degree
+        elif kernel == 'sigmoid':
+            K = np.multiply(self.gram, gamma)
+            K += coef0
+            np.tanh(K, out=K)
+        else:
+            norms = np.sqrt(self.sq_norms)
+            norms[norms == 0] = 1
+            K = self.gram / norms[:, None]
+            K /= norms[None, :]
+        return K
+
+    def eigendecomposition(self, n_components: int, kernel: str = 'rbf', gamma=None,
+                           degree=DEFAULT_DEGREE, coef0=DEFAULT_COEF0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top n_components eigenpairs of the centered kernel matrix.
+
+        Returns:
+            (eigenvalues in decreasing order, eigenvectors as columns)
+        """
+        K = self.kernel_matrix(kernel, gamma, degree, coef0)
+        n = K.shape[0]
+        n_components = min(n_components, n)
+        # Centering in feature space, in place (as sklearn KernelCenterer)
+        row_means = K.mean(axis=1)
+        total_mean = row_means.mean()
+        K -= row_means[:, None]
+        K -= row_means[None, :]
+        K += total_mean
+        eigenvalues, eigenvectors = linalg.eigh(K, subset_by_index=[n - n_components, n - 1], overwrite_a=True)
+        del K
+        eigenvalues, eigenvectors = eigenvalues[::-1], eigenvectors[:, ::-1]
+        # Deterministic signs: the largest entry of each eigenvector is positive
+        signs = np.sign(eigenvectors[np.abs(eigenvectors).argmax(axis=0), np.arange(n_components)])
+        signs[signs == 0] = 1
+        self.eigendecompositions += 1
+        return eigenvalues, eigenvectors * signs
+
+    def embedding(self, eigenvalues: np.ndarray, eigenvectors: np.ndarray, n_components: int) -> pd.DataFrame:
+        """Embedding of the first n_components eigenpairs (eigenvectors scaled by sqrt(eigenvalues))."""
+        scale = np.sqrt(np.clip(eigenvalues[:n_components], 0, None))
+        Z = (eigenvectors[:, :n_components] * scale).astype(self.dtype, copy=False)
+        cols = [f"kpca_{i+1}" for i in range(Z.shape[1])]
+        return pd.DataFrame(Z, index=self.index, columns=cols)
+
+    def sweep(self, settings: Iterable[Dict]) -> Iterator[Tuple[Dict, pd.DataFrame]]:
+        """
+        Yield (setting, embedding_df) for each setting.
+
+        Args:
+            settings: Dicts with n_components, kernel and gamma (and optionally
+                degree / coef0). Settings with the same kernel parameters share
+                one eigendecomposition for their largest n_components.
+        """
+        groups: Dict[Tuple, list] = {}
+        for setting in settings:
+            setting = dict(setting)
+            key = (
+                setting.get('kernel', 'rbf'),
+                repr(setting.get('gamma', 'scale')),
+                setting.get('degree', DEFAULT_DEGREE),
+                setting.get('coef0', DEFAULT_COEF0),
+            )
+            groups.setdefault(key, []).append(setting)
+
+        for group in groups.values():
+            first = group[0]
+            eigenvalues, eigenvectors = self.eigendecomposition(
+                max(s['n_components'] for s in group),
+                kernel=first.get('kernel', 'rbf'),
+                gamma=first.get('gamma', 'scale'),
+                degree=first.get('degree', DEFAULT_DEGREE),
+                coef0=first.get('coef0', DEFAULT_COEF0),
+            )
+            for setting in group:
+                yield setting, self.embedding(eigenvalues, eigenvectors, setting['n_components'])
+
+
+def sweep_kpca(X: pd.DataFrame | SparseFeatures, n_components=(10,), kernels=('rbf',), gammas=('scale',),
+               dtype: str = 'float64') -> Iterator[Tuple[Dict, pd.DataFrame]]:
+    """
+    Stream the KPCA embeddings of the grid n_components x kernels x gammas.
+
+    Gammas are ignored for the kernels that do not use them (linear, cosine).
+
+    Yields:
+        (setting dict, embedding_df)
+    """
+    settings = []
+    for kernel in kernels:
+        for gamma in (gammas if kernel in ('rbf', 'poly', 'sigmoid') else (None,)):
+            for k in n_components:
+                settings.append({'n_components': k, 'kernel': kernel, 'gamma': gamma})
+    yield from KPCASweep(X, dtype).sweep(settings)
@@ -1,20 +1,89 @@
 
 import utils.utils as ut
-import pandas as pd
+import numpy as np
 from pathlib import Path
 
 from main.modulo_similaridad.embeadding.features import build_user_features
-from main.modulo_similaridad.embeadding.embeddings import compute_kpca
-from sklearn.metrics.pairwise import cosine_similarity
+from main.modulo_similaridad.embeadding.embeddings import compute_embedding, DEFAULT_LANDMARKS
+from main.modulo_similaridad.embeadding.embedding_model import fit_and_save, reusable_model, transform_new_users
+from main.modulo_similaridad.embeadding.kpca_sweep import KPCASweep
 from main.modulo_similaridad.similarity_calculation.potencial_roles import RoleRecommender
+from utils.encoding import SnapshotEncoding
+from utils.artifact_cache import ArtifactCache, DEFAULT_MAX_BYTES, hash_file, hash_frame
+from utils.feature_vocabulary import FeatureVocabulary
+from utils.feature_hashing import hash_collision_stats, hash_dims
+from utils.neighbor_graph import (
+    DEFAULT_N_JOBS, GRAPH_BLOCK_SIZE, NeighborGraph, build_neighbor_graph, threshold_similarity_join,
+)
+from utils.bitpacked_similarity import packed_similarity_frame
+from utils.neighbor_index import NeighborIndex, build_neighbor_index
+from utils.similarity_metrics import (
+    BINARY_ENGINES, binary_similarity_frame, binary_similarity_graph, resolve_metric,
+)
+from utils.precision import DEFAULT_PRECISION, cosine_similarity_frame, resolve_precision
+
+# Suggested dense_max_users: largest user base for which the dense n x n matrix fits comfortably
+DENSE_SIMILARITY_MAX_USERS = 20_000
+
 
 class SimilarityCalculator:
 
-    def __init__(self, similarity_metric, n_top, data_folder = "data", threshold=0.7, data_type = ".csv"):
+    def __init__(self, similarity_metric, n_top, data_folder = "data", threshold=0.7, data_type = ".csv",
+                 cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, sparse_features=False,
+                 embedding_model_path=None, kpca_method='exact', n_landmarks=DEFAULT_LANDMARKS,
+                 precision=DEFAULT_PRECISION, feature_vocabulary_path=None, hash_dims=None,
+                 neighbor_graph=False, dense_max_users=None,
+                 similarity_block_size=GRAPH_BLOCK_SIZE, n_jobs=DEFAULT_N_JOBS, neighbor_index=None,
+                 neighbor_index_params=None, binary_engine='sparse', cache_similarity=False):
         
-        self.similarity_metric = similarity_metric
+        # 'cosine' (on the embeddings) or a binary metric on the multi-hot features:
+        # 'jaccard', 'dice' or 'jaccard_hamming' (see utils.similarity_metrics)
+        self.similarity_metric = resolve_metric(similarity_metric)
+        if neighbor_index and self.similarity_metric != 'cosine':
+            raise ValueError("neighbor_index is only available for the cosine metric")
+        # Kernels of the binary metrics: 'sparse' (X X^T intersection counts) or 'bitpacked' (popcounts)
+        if binary_engine not in BINARY_ENGINES:
+            raise ValueError(f"Unknown binary engine: {binary_engine}. Options: {list(BINARY_ENGINES)}")
+        self.binary_engine = binary_engine
         self.n_top = n_top
         self.threshold = threshold
+        # Keep only the top n_top neighbors above the threshold (NeighborGraph, O(n * n_top))
+        # instead of the dense n x n similarity DataFrame
+        self.neighbor_graph = neighbor_graph
+        # Opt-in: above dense_max_users users (e.g. DENSE_SIMILARITY_MAX_USERS) the similarity stage is a
+        # blocked, multi-threaded threshold join (NeighborGraph with every pair >= threshold) instead of
+        # the dense matrix. None (default) always builds the dense DataFrame
+        self.dense_max_users = dense_max_users
+        self.similarity_block_size = similarity_block_size
+        self.n_jobs = n_jobs
+        # Neighbor index backend ('exact' or 'rp_forest', see utils.neighbor_index): the similarity stage
+        # builds the index and RoleRecommender queries the n_top most similar users of each user
+        self.neighbor_index = neighbor_index
+        self.neighbor_index_params = dict(neighbor_index_params or {})
+        self._lookup_index = None
+        self.features = None
+        self.emb_df = None
+        self.sim_df = None
+        # Build the user features as a CSR matrix (SparseFeatures) instead of a dense DataFrame
+        # (opt-in; main/analysis/sparse_check.py compares both paths)
+        self.sparse_features = sparse_features
+        # Saved KPCA model: reused (transform only) until it is too old or the features drift
+        self.embedding_model_path = embedding_model_path
+        self.embedding_model = None
+        # KPCA backend ('exact', 'randomized' or 'nystroem', see compute_kpca)
+        self.kpca_method = kpca_method
+        self.n_landmarks = n_landmarks
+        # Numeric precision ('float64', 'float32' or 'float16' for the stored similarities, see utils.precision)
+        self.precision = precision
+        self.dtype, self.similarity_dtype = resolve_precision(precision)
+        # Hashed features (block -> buckets, see utils.feature_hashing): fixed width as roles are added
+        self.hash_dims = hash_dims
+        # Optional artifact cache: each stage is stored under the hash of its inputs and parameters
+        self.cache = ArtifactCache(cache_dir, cache_max_bytes) if cache_dir else None
+        # The dense n x n similarity stage is recomputed from the embeddings instead of cached
+        # (cheap to rebuild, 20 GB at 50k users); graphs and indexes are always cached
+        self.cache_similarity = cache_similarity
+        self.stage_keys = {}
         # Load and prepare data
         user_addr_df, agr_users_df = ut.load_data(Path(data_folder),data_type)
         if user_addr_df is None or agr_users_df is None:
@@ -23,53 +92,255 @@ class SimilarityCalculator:
 
         merged_df = ut.merge_df(user_addr_df, agr_users_df)
         self.split_df = ut.split_merge_df(merged_df)
+        # Integer ids for users and roles, shared by the downstream stages
+        self.encoding = SnapshotEncoding.from_frames(split_df=self.split_df, agr_users_df=agr_users_df)
+        self.stage_keys['data'] = hash_frame(self.split_df) if self.cache else None
+        # Saved feature vocabulary: stable feature columns across runs, new categories are appended
+        self.feature_vocabulary = (
+            FeatureVocabulary.load_or_fit(self.split_df, feature_vocabulary_path) if feature_vocabulary_path else None
+        )
+
+    def run_stage(self, stage, upstream, params, compute, store=True):
+        """Run a stage through the artifact cache (if any) and remember its key (store=False: never cached)."""
+        if self.cache is None:
+            value = compute()
+        else:
+            value, self.stage_keys[stage] = self.cache.get_or_compute(
+                stage, self.stage_keys.get(upstream), params, compute, store=store
+            )
+        return value
 
+    def cached_stage(self, stage, upstream, params):
+        """Cached artifact of a stage without computing it (None without a cache or on a miss)."""
+        if self.cache is None:
+            return None
+        key = self.cache.key(stage, self.stage_keys.get(upstream), params)
+        value = self.cache.get(key)
+        if value is not None:
+            self.stage_keys[stage] = key
+        return value
 
 
-    def compute_embeddings(self, department_weight = 1, function_weight = 1, roles_weight = 1, n_components=10, kernel='rbf', gamma='scale'):
-        # Build multi-hot user feature matrix
-        X = build_user_features(
-            self.split_df,
+
+    def compute_features(self, department_weight=1, function_weight=1, roles_weight=1):
+        """Multi-hot user feature matrix; returns (X, feature_params, dtype stage parameter)."""
+        feature_params = dict(
             department_weight=department_weight,
             function_weight=function_weight,
             roles_weight=roles_weight,
         )
-
-        # Compute KPCA embeddings
-        emb_df, model = compute_kpca(
-            X,
-            n_components=n_components,
-            kernel=kernel,
-            gamma=gamma,
-            random_state=42,
+        # The dtype only enters the stage parameters outside float64, so float64 cache keys are unchanged
+        dtype = {} if self.precision == DEFAULT_PRECISION else {'dtype': self.dtype.__name__}
+        stage_params = dict(feature_params, sparse=self.sparse_features, **dtype)
+        if self.feature_vocabulary is not None:
+            stage_params['vocabulary'] = self.feature_vocabulary.fingerprint()
+        if self.hash_dims is not None:
+            stage_params['hash_dims'] = hash_dims(self.hash_dims)
+        X = self.run_stage(
+            'features', 'data', stage_params,
+            lambda: build_user_features(self.split_df, sparse=self.sparse_features, dtype=self.dtype,
+                                        vocabulary=self.feature_vocabulary, hash_dims=self.hash_dims,
+                                        **feature_params),
         )
+        self.features = X
+        return X, feature_params, dtype
+
+    def hash_collision_stats(self):
+        """Collision statistics of the hashed features per block (to size hash_dims)."""
+        return hash_collision_stats(self.split_df, self.hash_dims)
+
+    def compute_embeddings(self, department_weight = 1, function_weight = 1, roles_weight = 1, n_components=10, kernel='rbf', gamma='scale',
+                           embedding='kpca'):
+        # embedding='kpca' (kernel PCA, backend self.kpca_method) or 'svd' (randomized truncated SVD
+        # on the sparse features, O(nnz * n_components): for full-population runs where KPCA does not fit)
+        X, feature_params, dtype = self.compute_features(department_weight, function_weight, roles_weight)
+
+        # Compute KPCA / SVD embeddings
+        if embedding == 'svd':
+            kpca_params = dict(embedding='svd', n_components=n_components, random_state=42, **dtype)
+        else:
+            kpca_params = dict(
+                n_components=n_components,
+                kernel=kernel,
+                gamma=gamma,
+                random_state=42,
+                method=self.kpca_method,
+                **dtype,
+            )
+            if self.kpca_method == 'nystroem':
+                kpca_params['n_landmarks'] = self.n_landmarks
+        if self.embedding_model_path is None:
+            emb_df, model = self.run_stage(
+                'embedding', 'features', kpca_params,
+                lambda: compute_embedding(X, **kpca_params),
+            )
+        else:
+            # The refit policy (age / drift) runs before the cache lookup, and the stage is keyed on the
+            # content of the model file: a refit or replaced model never serves a stale cached embedding
+            saved = reusable_model(X, feature_params, kpca_params, self.embedding_model_path)
+            if saved is None:
+                fitted = fit_and_save(X, feature_params, kpca_params, self.embedding_model_path)
+                compute = lambda: fitted
+            else:
+                compute = lambda: (saved.transform(X), saved)
+            model_params = dict(kpca_params, model=hash_file(self.embedding_model_path)) if self.cache else kpca_params
+            emb_df, self.embedding_model = self.run_stage('embedding', 'features', model_params, compute)
+            model = self.embedding_model.kpca
 
         self.emb_df = emb_df
         self.model = model
 
+    def transform_new_users(self, split_df_new):
+        """Embed new or changed users with the saved model (no refit)."""
+        model = self.embedding_model or self.embedding_model_path
+        return transform_new_users(split_df_new, model, sparse_features=self.sparse_features,
+                                   vocabulary=self.feature_vocabulary, hash_dims=self.hash_dims)
+
+    def use_threshold_join(self, n_users):
+        """Whether the similarity stage is the threshold join (only when dense_max_users is set and exceeded)."""
+        return not self.neighbor_graph and self.dense_max_users is not None and n_users > self.dense_max_users
+
     def compute_similarity(self):
-        #TODO: Add other similarity metrics
-        sim_matrix = cosine_similarity(self.emb_df.values)
-        sim_df = pd.DataFrame(
-            sim_matrix,
-            index=self.emb_df.index,
-            columns=self.emb_df.index
-        )
-        self.sim_df = sim_df
+        self._lookup_index = None
+        if self.similarity_metric != 'cosine':
+            return self.compute_binary_similarity()
+        threshold_join = self.use_threshold_join(len(self.emb_df))
+        def compute():
+            if self.neighbor_index:
+                return self.build_neighbor_index()
+            if self.neighbor_graph:
+                return build_neighbor_graph(self.emb_df, k=self.n_top, threshold=self.threshold,
+                                            block_size=self.similarity_block_size, dtype=self.similarity_dtype,
+                                            n_jobs=self.n_jobs)
+            if threshold_join:
+                return threshold_similarity_join(self.emb_df, self.threshold, block_size=self.similarity_block_size,
+                                                 dtype=self.similarity_dtype, n_jobs=self.n_jobs)
+            return cosine_similarity_frame(self.emb_df, dtype=self.similarity_dtype)
+        params = {'metric': 'cosine'}
+        if self.precision != DEFAULT_PRECISION:
+            params['dtype'] = self.similarity_dtype.__name__
+        if self.neighbor_index:
+            params.update(dict(self.neighbor_index_params, index=self.neighbor_index, k=self.n_top))
+        elif self.neighbor_graph:
+            params.update(graph=True, k=self.n_top, threshold=self.threshold)
+        elif threshold_join:
+            params.update(graph=True, threshold=self.threshold)
+        dense = not (self.neighbor_index or self.neighbor_graph or threshold_join)
+        self.sim_df = self.run_stage('similarity', 'embedding', params, compute,
+                                     store=self.cache_similarity or not dense)
+
+    def compute_binary_similarity(self):
+        """Similarity stage of the binary metrics, on the features (upstream 'features', no embeddings needed)."""
+        if self.features is None:
+            self.compute_features()
+        metric = self.similarity_metric
+        threshold_join = self.use_threshold_join(len(self.features))
+        def compute():
+            if self.neighbor_graph or threshold_join:
+                k = self.n_top if self.neighbor_graph else None
+                return binary_similarity_graph(self.features, metric, k=k, threshold=self.threshold,
+                                               block_size=self.similarity_block_size, dtype=self.similarity_dtype,
+                                               n_jobs=self.n_jobs, engine=self.binary_engine)
+            if self.binary_engine == 'bitpacked':
+                return packed_similarity_frame(self.features, metric, dtype=self.similarity_dtype, n_jobs=self.n_jobs)
+            return binary_similarity_frame(self.features, metric, dtype=self.similarity_dtype)
+        # Both engines give the same similarities: the engine is not part of the cache key
+        params = {'metric': metric}
+        if self.precision != DEFAULT_PRECISION:
+            params['dtype'] = self.similarity_dtype.__name__
+        if self.neighbor_graph:
+            params.update(graph=True, k=self.n_top, threshold=self.threshold)
+        elif threshold_join:
+            params.update(graph=True, threshold=self.threshold)
+        dense = not (self.neighbor_graph or threshold_join)
+        self.sim_df = self.run_stage('similarity', 'features', params, compute,
+                                     store=self.cache_similarity or not dense)
+
+    def build_neighbor_index(self, backend=None):
+        """Neighbor index over the embeddings (backend: self.neighbor_index, 'exact' by default)."""
+        params = dict(self.neighbor_index_params, n_neighbors=self.n_top)
+        return build_neighbor_index(self.emb_df, backend or self.neighbor_index or 'exact', **params)
+
+    def get_similar_users(self, user, k=None):
+        """
+        Most similar users of a user (by decreasing similarity), from the neighbor
+        index of the similarity stage or, without one, an exact index built once.
+        Binary metrics read the similarity stage output.
+        """
+        if self.similarity_metric != 'cosine':
+            return self._similar_from_matrix(user, k or self.n_top)
+        if not isinstance(self.sim_df, NeighborIndex):
+            if self._lookup_index is None:
+                self._lookup_index = self.build_neighbor_index('exact')
+            return self._lookup_index.query(user, k=k or self.n_top)
+        return self.sim_df.query(user, k=k or self.n_top)
+
+    def _similar_from_matrix(self, user, k):
+        if isinstance(self.sim_df, NeighborGraph):
+            return self.sim_df.neighbors(user)[:k]
+        if user not in self.sim_df.index:
+            return []
+        row = self.sim_df.loc[user].drop(user, errors='ignore')
+        row = row.iloc[np.argsort(-row.to_numpy(), kind='stable')[:k]]
+        return list(zip(row.index, row.to_numpy(dtype=np.float64)))
 
     def compute_role_recommendation(self):
-        # For each user, find top N similar users above the threshold
-        # TODO: Implement different type of similarity metrics to find new roles (now only cosine is implemented)
-        recommender = RoleRecommender(
-            roles_data=self.split_df,
-            similarity_data=self.sim_df,
-            similarity_threshold=self.threshold
-        )
-        self.recommendations = recommender.recommend_roles_for_all_users()
+        # For each user, find top N similar users above the threshold (similarity_metric of the similarity stage)
+        def compute():
+            recommender = RoleRecommender(
+                roles_data=self.split_df,
+                similarity_data=self.sim_df,
+                similarity_threshold=self.threshold,
+                encoding=self.encoding
+            )
+            return recommender.recommend_roles_for_all_users()
+        self.recommendations = self.run_stage('candidates', 'similarity', {'threshold': self.threshold}, compute)
+
+
+    def sweep_recommendations(self, settings, department_weight=1, function_weight=1, roles_weight=1):
+        """
+        Run the similarity and recommendation stages for many exact KPCA settings.
+
+        Settings whose embedding is in the cache are yielded first, without
+        any kernel work; for the others the Gram matrix and distances are
+        computed once and settings differing only in n_components share one
+        eigendecomposition (see KPCASweep). Sweep embeddings have no fitted
+        model: get_model() returns None after a sweep.
 
+        Args:
+            settings: Dicts with n_components, kernel and gamma
+
+        Yields:
+            (setting, recommendations DataFrame)
+        """
+        X, _, dtype = self.compute_features(department_weight, function_weight, roles_weight)
+        pending = []
+        for setting in settings:
+            params = dict(setting, random_state=42, sweep=True, **dtype)
+            cached = self.cached_stage('embedding', 'features', params)
+            if cached is None:
+                pending.append(setting)
+                continue
+            self.emb_df, self.model = cached
+            yield setting, self._sweep_recommendation()
+
+        if pending:
+            for setting, emb_df in KPCASweep(X, self.dtype.__name__).sweep(pending):
+                params = dict(setting, random_state=42, sweep=True, **dtype)
+                self.emb_df, self.model = self.run_stage('embedding', 'features', params, lambda: (emb_df, None))
+                yield setting, self._sweep_recommendation()
+
+    def _sweep_recommendation(self):
+        self.compute_similarity()
+        self.compute_role_recommendation()
+        return self.get_recommendations()
 
-    def run_recommendation(self,n_component,pca_kernel,pca_gamma):
-        self.compute_embeddings(n_components=n_component, kernel=pca_kernel, gamma=pca_gamma)
+    def run_recommendation(self,n_component,pca_kernel,pca_gamma,embedding='kpca'):
+        if self.similarity_metric == 'cosine':
+            self.compute_embeddings(n_components=n_component, kernel=pca_kernel, gamma=pca_gamma, embedding=embedding)
+        else:
+            # Binary metrics compare the features directly: no embedding stage
+            self.compute_features()
         self.compute_similarity()
         self.compute_role_recommendation()
         return self.get_recommendations()
@@ -78,12 +349,15 @@ class SimilarityCalculator:
         return self.emb_df
     
     def get_model(self):
+        # None after sweep_recommendations (the sweep embeddings have no fitted model)
         return self.model
     
     def get_split_df(self):
         return self.split_df
 
     def get_similarity_df(self):
+        # DataFrame by default; NeighborGraph / NeighborIndex only with neighbor_graph, dense_max_users
+        # or neighbor_index
         return self.sim_df
     
     def get_recommendations(self):
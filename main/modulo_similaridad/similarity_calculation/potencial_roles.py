@@ -10,10 +10,15 @@ This module provides functionality to:
 
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Set, Tuple
+from typing import List, Dict, Set, Tuple, Optional
 import ast
 from pathlib import Path
 
+from utils.incidence import is_incidence_store, load_incidence
+from utils.encoding import SnapshotEncoding
+from utils.neighbor_graph import NeighborGraph
+from utils.neighbor_index import NeighborIndex
+
 
 class RoleRecommender:
     """
@@ -21,18 +26,26 @@ class RoleRecommender:
     
     Attributes:
         roles_df (pd.DataFrame): DataFrame containing user roles
-        similarity_df (pd.DataFrame): DataFrame containing user similarity matrix
+        similarity_df (pd.DataFrame, NeighborGraph or NeighborIndex): User similarity matrix,
+                                                                     top-k neighbor graph or neighbor index
         similarity_threshold (float): Minimum similarity threshold for recommendations
+        encoding (SnapshotEncoding): Integer ids for users and roles
+        user_role_ids (Dict[int, Set[int]]): User id -> set of role ids
     """
     
-    def __init__(self, roles_data, similarity_data, similarity_threshold: float = 0.7):
+    def __init__(self, roles_data, similarity_data, similarity_threshold: float = 0.7,
+                 encoding: Optional[SnapshotEncoding] = None):
         """
         Initialize the RoleRecommender.
         
         Args:
             roles_data (str or pd.DataFrame): Path to CSV file or DataFrame containing user roles
-            similarity_data (str or pd.DataFrame): Path to CSV file or DataFrame containing similarity matrix
+            similarity_data (str, pd.DataFrame, NeighborGraph or NeighborIndex): Path to CSV file,
+                                DataFrame containing similarity matrix, neighbor graph or neighbor
+                                index (queried for its n_neighbors most similar users)
             similarity_threshold (float): Minimum similarity threshold (0-1)
+            encoding (SnapshotEncoding, optional): Shared encoding of the snapshot.
+                                                   Users/roles not in it are appended.
         
         Raises:
             ValueError: If similarity_threshold is not between 0 and 1
@@ -43,16 +56,28 @@ class RoleRecommender:
             raise ValueError("similarity_threshold must be between 0 and 1")
         
         self.similarity_threshold = similarity_threshold
+        self.encoding = encoding if encoding is not None else SnapshotEncoding()
+        self.incidence = None
         self.roles_df = self._load_roles(roles_data)
         self.similarity_df = self._load_similarity_matrix(similarity_data)
-        self.user_roles_dict = self._create_user_roles_dict()
+        self.user_role_ids = self._create_user_roles_dict()
+
+    @property
+    def user_roles_dict(self) -> Dict[str, Set[str]]:
+        """User -> set of role names (decoded from user_role_ids)."""
+        users = self.encoding.users.decode(list(self.user_role_ids.keys()))
+        return {
+            user: set(self.encoding.role_prefixes.decode(list(role_ids)))
+            for user, role_ids in zip(users, self.user_role_ids.values())
+        }
     
     def _load_roles(self, data) -> pd.DataFrame:
         """
         Load user roles from CSV file or DataFrame.
         
         Args:
-            data (str or pd.DataFrame): Path to roles CSV file or DataFrame
+            data (str or pd.DataFrame): Path to roles CSV file, incidence store
+                                        folder (utils.incidence) or DataFrame
             
         Returns:
             pd.DataFrame: DataFrame with user roles
@@ -66,6 +91,9 @@ class RoleRecommender:
         elif isinstance(data, str):
             if not Path(data).exists():
                 raise FileNotFoundError(f"Roles file not found: {data}")
+            if is_incidence_store(data):
+                self.incidence = load_incidence(data)
+                return self.incidence.to_split_df()
             df = pd.read_csv(data)
             return df
         else:
@@ -85,6 +113,9 @@ class RoleRecommender:
             FileNotFoundError: If file path doesn't exist
             TypeError: If data is neither str nor DataFrame
         """
+        if isinstance(data, (NeighborGraph, NeighborIndex)):
+            # Sparse graph / neighbor index: only the neighbors of each user are read, used as is
+            return data
         if isinstance(data, pd.DataFrame):
             # Ensure it's a copy to avoid modifying the original
             df = data.copy()
@@ -105,32 +136,43 @@ class RoleRecommender:
         else:
             raise TypeError(f"similarity_data must be a string path or pandas DataFrame, got {type(data)}")
     
-    def _create_user_roles_dict(self) -> Dict[str, Set[str]]:
+    def _create_user_roles_dict(self) -> Dict[int, Set[int]]:
         """
-        Create a dictionary mapping users to their sets of roles.
+        Create a dictionary mapping user ids to their sets of role ids.
         
         Returns:
-            Dict[str, Set[str]]: Dictionary with user as key and set of roles as value
+            Dict[int, Set[int]]: Dictionary with user id as key and set of role ids as value
         """
-        user_roles = {}
-        
-        for _, row in self.roles_df.iterrows():
-            usuario = row['Usuario']
-            roles = row['Rol']
-            
-            # Parse the string representation of the list
-            if isinstance(roles, str):
-                try:
-                    roles_list = ast.literal_eval(roles)
-                except (ValueError, SyntaxError):
+        if self.incidence is not None:
+            # Roles come already parsed from the incidence store
+            roles_lists = self.incidence.row_lists('roles')
+            users = self.incidence.users
+        else:
+            roles_lists = []
+            for roles in self.roles_df['Rol']:
+                # Parse the string representation of the list
+                if isinstance(roles, str):
+                    try:
+                        roles_list = ast.literal_eval(roles)
+                    except (ValueError, SyntaxError):
+                        roles_list = []
+                elif isinstance(roles, list):
+                    roles_list = roles
+                else:
                     roles_list = []
-            elif isinstance(roles, list):
-                roles_list = roles
-            else:
-                roles_list = []
-            
-            # Store as set for efficient operations
-            user_roles[usuario] = set(roles_list)
+                roles_lists.append(roles_list)
+            users = self.roles_df['Usuario']
+
+        user_ids = self.encoding.users.encode(users, add=True)
+        flat_roles = [role for roles_list in roles_lists for role in roles_list]
+        role_ids = self.encoding.role_prefixes.encode(flat_roles, add=True).tolist()
+
+        # Store as set for efficient operations
+        user_roles = {}
+        start = 0
+        for user_id, roles_list in zip(user_ids.tolist(), roles_lists):
+            user_roles[user_id] = set(role_ids[start:start + len(roles_list)])
+            start += len(roles_list)
         
         return user_roles
     
@@ -145,6 +187,13 @@ class RoleRecommender:
         Returns:
             List[Tuple[str, float]]: List of (username, similarity_score) tuples
         """
+        if isinstance(self.similarity_df, NeighborGraph):
+            # The graph never contains self-similarities
+            return self.similarity_df.neighbors(user, threshold=self.similarity_threshold)
+        if isinstance(self.similarity_df, NeighborIndex):
+            # Index queries exclude the user itself
+            return self.similarity_df.query(user, threshold=self.similarity_threshold)
+
         if user not in self.similarity_df.index:
             return []
         
@@ -161,7 +210,7 @@ class RoleRecommender:
         # Sort by similarity (descending)
         similar_users = similar_users.sort_values(ascending=False)
         
-        return list(zip(similar_users.index, similar_users.values))
+        return list(zip(similar_users.index, similar_users.to_numpy(dtype=np.float64)))
     
     def get_potential_roles(self, user: str) -> Dict[str, Dict]:
         """
@@ -175,11 +224,12 @@ class RoleRecommender:
                             Format: {role: {'count': int, 'similar_users': List[str], 
                                            'avg_similarity': float}}
         """
-        if user not in self.user_roles_dict:
+        user_id = self.encoding.users.id_of(user)
+        if user_id not in self.user_role_ids:
             return {}
         
         # Get user's current roles
-        current_roles = self.user_roles_dict[user]
+        current_roles = self.user_role_ids[user_id]
         
         # Get similar users
         similar_users = self.get_similar_users(user)
@@ -187,14 +237,15 @@ class RoleRecommender:
         if not similar_users:
             return {}
         
-        # Collect roles from similar users
+        # Collect roles (by id) from similar users
         potential_roles = {}
         
         for similar_user, similarity_score in similar_users:
-            if similar_user not in self.user_roles_dict:
+            similar_id = self.encoding.users.id_of(similar_user)
+            if similar_id not in self.user_role_ids:
                 continue
             
-            similar_user_roles = self.user_roles_dict[similar_user]
+            similar_user_roles = self.user_role_ids[similar_id]
             
             # Find roles the user doesn't have
             new_roles = similar_user_roles - current_roles
@@ -214,11 +265,14 @@ class RoleRecommender:
         # Calculate average similarity for each role
         for role in potential_roles:
             similarities = potential_roles[role]['similarities']
-            potential_roles[role]['avg_similarity'] = np.mean(similarities)
+            # Averaged in float64: the stored similarities may be float16 (see utils.precision)
+            potential_roles[role]['avg_similarity'] = float(np.mean(similarities, dtype=np.float64))
             # Remove the raw similarities list from final output
             del potential_roles[role]['similarities']
         
-        return potential_roles
+        # Decode role ids only for the output
+        role_names = self.encoding.role_prefixes.decode(list(potential_roles.keys()))
+        return dict(zip(role_names, potential_roles.values()))
     
     def recommend_roles_for_all_users(self) -> pd.DataFrame:
         """
@@ -230,7 +284,7 @@ class RoleRecommender:
         """
         recommendations = []
         
-        for user in self.user_roles_dict.keys():
+        for user in self.encoding.users.decode(list(self.user_role_ids.keys())):
             potential_roles = self.get_potential_roles(user)
             
             for role, details in potential_roles.items():
@@ -318,14 +372,14 @@ class RoleRecommender:
         
         if recommendations_df.empty:
             return {
-                'total_users': len(self.user_roles_dict),
+                'total_users': len(self.user_role_ids),
                 'total_recommendations': 0,
                 'users_with_recommendations': 0,
                 'avg_recommendations_per_user': 0
             }
         
         stats = {
-            'total_users': len(self.user_roles_dict),
+            'total_users': len(self.user_role_ids),
             'total_recommendations': len(recommendations_df),
             'users_with_recommendations': recommendations_df['Usuario'].nunique(),
             'avg_recommendations_per_user': round(
@@ -4,7 +4,9 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 import utils.utils as ut
-import ast
+from utils.incidence import load_split_roles
+from utils.resumen import read_resumen
+from utils.sparse_features import SparseFeatures, binary_overlap_similarity
 
 K_MODES = True
 COSINE_SIMILARITY = True
@@ -36,7 +38,19 @@ def evaluate_combination(uv_df, resumen_df, split_df, metric='cosine', k=5, thre
     """
     Calcula la matriz de similitud entre usuarios según la métrica y verifica usuarios encontrados usando roles_found.
     metric: 'cosine', 'jaccard', 'dice'
+    uv_df puede ser un DataFrame denso o un SparseFeatures (CSR)
     """
+    if isinstance(uv_df, SparseFeatures):
+        X = uv_df.matrix
+        if metric == 'cosine':
+            sim_matrix = cosine_similarity(X)
+        elif metric in ('jaccard', 'dice'):
+            sim_matrix = binary_overlap_similarity(X, metric)
+        else:
+            raise ValueError(f"Métrica no soportada: {metric}")
+        sim_df = pd.DataFrame(sim_matrix, index=uv_df.index, columns=uv_df.index)
+        return _roles_found_result(sim_df, resumen_df, split_df, k, threshold, fecha_min)
+
     X = uv_df.values
     if metric == 'cosine':
         sim_matrix = cosine_similarity(X)
@@ -48,6 +62,10 @@ def evaluate_combination(uv_df, resumen_df, split_df, metric='cosine', k=5, thre
     else:
         raise ValueError(f"Métrica no soportada: {metric}")
     sim_df = pd.DataFrame(sim_matrix, index=uv_df.index, columns=uv_df.index)
+    return _roles_found_result(sim_df, resumen_df, split_df, k, threshold, fecha_min)
+
+
+def _roles_found_result(sim_df, resumen_df, split_df, k, threshold, fecha_min):
     result = ut.roles_found(sim_df, resumen_df, split_df, k=k, threshold=threshold, fecha_min=fecha_min)
     if result:
         print(f"total_roles {result[0]}, found_roles {result[1]}, score {result[2]}")
@@ -95,7 +113,7 @@ def roles_found_cluster(user_clusters_df, resumen_df, split_roles, fecha_min='20
     total_roles = 0
     roles_encontrados = 0
     user_stats = {}
-    roles_asignados_por_usuario = resumen_df.groupby('Usuario')['Rol'].apply(list).to_dict()
+    roles_asignados_por_usuario = resumen_df.groupby('Usuario', observed=True)['Rol'].apply(list).to_dict()
 
     for usuario in usuarios_validos:
         roles_asignados = roles_asignados_por_usuario.get(usuario, [])
@@ -142,16 +160,13 @@ def roles_found_cosine_stats(user_results_df):
 
 
 if __name__ == "__main__":
-    split_roles = pd.read_csv('data/processed/split_roles.csv')
-
-    split_roles['Rol'] = split_roles['Rol'].apply(ast.literal_eval)
-    split_roles['Location'] = split_roles['Location'].apply(ast.literal_eval)
+    split_roles = load_split_roles('data/processed/split_roles.csv')
 
         # --- Acumulador de resultados finales ---
     resultados_finales = []
 
     if K_MODES:
-        resumen_df = pd.read_csv('data/processed/resumen_2025.csv')
+        resumen_df = read_resumen('data/processed/resumen_2025.csv', fecha_min='2025-06-01')
         for i in range(3,11):
             print(f"--- Evaluando K-modes con {i} clusters ---")
             user_vectors_with_clusters = pd.read_csv(f'data/processed/user_vectors_with_clusters_{i}.csv')
@@ -180,7 +195,7 @@ if __name__ == "__main__":
 
     # --- DBSCAN evaluation and visualization ---
     if DBSCAN:
-        resumen_df = pd.read_csv('data/processed/resumen_2025.csv')
+        resumen_df = read_resumen('data/processed/resumen_2025.csv', fecha_min='2025-06-01')
         for min_samples in range(3, 11):
             print(f"--- Evaluando DBSCAN con min_samples={min_samples} ---")
             dbscan_clusters = pd.read_csv(f'data/processed/user_vectors_with_clusters_DBSCAN_{min_samples}.csv')
@@ -215,13 +230,13 @@ if __name__ == "__main__":
         if COSINE_SIMILARITY:
             print(f"--- Evaluando Cosine Similarity {threshold} ---")
             # Cargar los datos necesarios
-            resumen_df = pd.read_csv('data/processed/resumen_2025.csv')
+            resumen_df = read_resumen('data/processed/resumen_2025.csv', fecha_min='2025-06-01')
 
             dep_weight = 1
             fun_weight = 1   
             rolLoc_weight = 1
             role_weight = 1
-            base_uv_df = ut.create_user_multihot_vectors(split_roles, dep_weight, fun_weight, rolLoc_weight, role_weight)
+            base_uv_df = ut.create_user_multihot_vectors(split_roles, dep_weight, fun_weight, rolLoc_weight, role_weight, sparse=True)
             results = evaluate_combination(base_uv_df, resumen_df, split_roles, metric='cosine', k=-1, threshold=threshold, fecha_min='2025-06-01')
             user_results = {}
 
@@ -264,13 +279,13 @@ if __name__ == "__main__":
         if JACCARD:
             print(f"--- Evaluando Jaccard {threshold} ---")
             # Cargar los datos necesarios
-            resumen_df = pd.read_csv('data/processed/resumen_2025.csv')
+            resumen_df = read_resumen('data/processed/resumen_2025.csv', fecha_min='2025-06-01')
 
             dep_weight = 1
             fun_weight = 1   
             rolLoc_weight = 1
             role_weight = 1
-            base_uv_df = ut.create_user_multihot_vectors(split_roles, dep_weight, fun_weight, rolLoc_weight, role_weight)
+            base_uv_df = ut.create_user_multihot_vectors(split_roles, dep_weight, fun_weight, rolLoc_weight, role_weight, sparse=True)
             results = evaluate_combination(base_uv_df, resumen_df, split_roles, metric='jaccard', k=-1, threshold=threshold, fecha_min='2025-06-01')
             user_results = {}
 
@@ -314,13 +329,13 @@ if __name__ == "__main__":
         if DICE:
             print(f"--- Evaluando DICE {threshold} ---")
             # Cargar los datos necesarios
-            resumen_df = pd.read_csv('data/processed/resumen_2025.csv')
+            resumen_df = read_resumen('data/processed/resumen_2025.csv', fecha_min='2025-06-01')
 
             dep_weight = 1
             fun_weight = 1   
             rolLoc_weight = 1
             role_weight = 1
-            base_uv_df = ut.create_user_multihot_vectors(split_roles, dep_weight, fun_weight, rolLoc_weight, role_weight)
+            base_uv_df = ut.create_user_multihot_vectors(split_roles, dep_weight, fun_weight, rolLoc_weight, role_weight, sparse=True)
             results = evaluate_combination(base_uv_df, resumen_df, split_roles, metric='dice', k=-1, threshold=threshold, fecha_min='2025-06-01')
             user_results = {}
 
@@ -4,6 +4,10 @@
 import numpy as np
 import pandas as pd
 import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from utils.bitpacked_similarity import packed_similarity_frame
+from utils.neighbor_graph import DEFAULT_N_JOBS
 
 def jaccard_coefficient(u, v):
 	"""
@@ -40,10 +44,31 @@ def user_similarity_jaccard_hamming(user_vectors: pd.DataFrame):
 	return pd.DataFrame(sim_matrix, index=usuarios, columns=usuarios)
 
 
+def user_similarity_jaccard_hamming_packed(user_vectors: pd.DataFrame, n_jobs=DEFAULT_N_JOBS):
+	"""
+	Misma matriz que user_similarity_jaccard_hamming, calculada con vectores empaquetados en bits
+	(np.packbits) y popcount por bloques de usuarios, en paralelo (n_jobs hilos).
+	Retorna: DataFrame de similitud (usuarios x usuarios), índices y columnas con nombres de usuario.
+	"""
+	usuarios = user_vectors['Usuario'].tolist() if 'Usuario' in user_vectors.columns else list(user_vectors.index)
+	sim_df = packed_similarity_frame(user_vectors, metric='jaccard_hamming', n_jobs=n_jobs)
+	return pd.DataFrame(sim_df.to_numpy(), index=usuarios, columns=usuarios)
+
+
 if __name__ == "__main__":
+	import argparse
+
+	parser = argparse.ArgumentParser(description="Matriz de similitud Jaccard/Hamming entre usuarios")
+	parser.add_argument("--loop", action="store_true", help="Usar el cálculo par a par original (lento)")
+	parser.add_argument("--n-jobs", type=int, default=DEFAULT_N_JOBS)
+	args = parser.parse_args()
+
 	user_vectors = pd.read_csv('data/processed/user_vectors.csv')
 	print("Calculando matriz de similitud (Jaccard/Hamming)...")
-	sim_df = user_similarity_jaccard_hamming(user_vectors)
+	if args.loop:
+		sim_df = user_similarity_jaccard_hamming(user_vectors)
+	else:
+		sim_df = user_similarity_jaccard_hamming_packed(user_vectors, n_jobs=args.n_jobs)
 	sim_df_reset = sim_df.reset_index().rename(columns={'index': 'Usuario'})
 	sim_df_reset.to_csv('data/processed/user_similarity_jaccard_hamming.csv', index=False)
 	print("Matriz de similitud guardada en data/processed/user_similarity_jaccard_hamming.csv")
\ No newline at end of file
@@ -1,10 +1,11 @@
-import ast
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import pandas as pd
 import utils.utils as ut
+from utils.incidence import load_split_roles
+from utils.resumen import read_resumen
 from sklearn.metrics.pairwise import cosine_similarity
 
 def evaluate_combination(uv_df, resumen_df, split_df, k=5, threshold=0.7,fecha_min='2025-01-01'):
@@ -28,18 +29,17 @@ def evaluate_combination(uv_df, resumen_df, split_df, k=5, threshold=0.7,fecha_m
 def main():
     split_df_path = 'data/processed/split_roles.csv'
     resumen_df_path = 'data/processed/resumen_2025.csv'
-    split_df = pd.read_csv(split_df_path)
-    split_df['Rol'] = split_df['Rol'].apply(ast.literal_eval)
-    split_df['Location'] = split_df['Location'].apply(ast.literal_eval)
+    split_df = load_split_roles(split_df_path)
 
-    resumen_df = pd.read_csv(resumen_df_path)
+    fecha_min = '2025-06-01'
+    resumen_df = read_resumen(resumen_df_path, fecha_min=fecha_min)
     dep_weight = 1
     fun_weight = 1   
     rolLoc_weight = 1
     role_weight = 1
 
     base_uv_df = ut.create_user_multihot_vectors(split_df, dep_weight, fun_weight, rolLoc_weight, role_weight)
-    results = evaluate_combination(base_uv_df, resumen_df, split_df, k=-1, threshold=0.7,fecha_min='2025-06-01')
+    results = evaluate_combination(base_uv_df, resumen_df, split_df, k=-1, threshold=0.7,fecha_min=fecha_min)
     user_results = {}
     for i in results["detalle"]:
         usuario = i[0]
@@ -8,11 +8,12 @@ STEP 3: ANÁLISIS COMPREHENSIVE DE RESULTADOS BASE
 
 import pandas as pd
 import numpy as np
-from ast import literal_eval
 import sys
 import os
 from datetime import datetime
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.incidence import load_split_roles
 
 def comprehensive_base_analysis():
     """
@@ -28,9 +29,7 @@ def comprehensive_base_analysis():
     print("\n1. CARGANDO DATOS BASE...")
     
     try:
-        split_df = pd.read_csv('data/processed/split_roles.csv')
-        split_df['Rol'] = split_df['Rol'].apply(literal_eval)
-        split_df['Location'] = split_df['Location'].apply(literal_eval)
+        split_df = load_split_roles('data/processed/split_roles.csv')
         print(f"   ✓ Split roles: {len(split_df)} usuarios cargados")
         
         resumen_df = pd.read_csv('data/processed/resumen_2025.csv')
@@ -6,18 +6,20 @@ from sklearn.preprocessing import OneHotEncoder, MultiLabelBinarizer
 sys.path.append(str(Path(__file__).parent.parent))
 
 import utils.utils as ut
+from utils.incidence import save_incidence
 
 #Antes de empezar a ejecutar el codigo, es mejor pasar los archivos a formato CSV dado a que es mucho mas rapido la carga de este formato
 
 # En caso de que se quiera guardar los dataframes generados en el proceso, setear SAVE = True(recordar crear carpeta processed en data)
 SAVE = True
 
-def createUsersVector(save,department_weight=1, role_weight=1, area_weight=1, subarea_weight=1):
-    user_addr_df, agr_users_df, agr_1251_df = ut.load_data(".csv")
-    
-    if user_addr_df is None or agr_users_df is None or agr_1251_df is None:
+def createUsersVector(save,department_weight=1, role_weight=1, area_weight=1, subarea_weight=1, data_folder="data"):
+    # load_data devuelve (user_addr_df, agr_users_df), tres None si faltan archivos o None si falla la lectura
+    loaded = ut.load_data(Path(data_folder), ".csv")
+    if not loaded or loaded[0] is None or loaded[1] is None:
         print("Error loading data.")
         return
+    user_addr_df, agr_users_df = loaded[:2]
 
 
 
@@ -31,7 +33,10 @@ def createUsersVector(save,department_weight=1, role_weight=1, area_weight=1, su
     if merged_df is not None and save:
         merged_df.to_csv("data/processed/merged_data.csv", index=False)
     if split_df is not None and save:
-        split_df.to_csv("data/processed/split_roles.csv", index=False)
+        # El store guarda además los roles completos para aplicar deltas de AGR_USERS (utils.deltas)
+        # y reescribe split_roles.csv en cada revisión, así el CSV nunca queda desactualizado
+        save_incidence(split_df.assign(Roles=merged_df['Roles']), "data/processed/split_roles",
+                       csv_path="data/processed/split_roles.csv")
 
     if user_vector_df is not None and save:
         user_vector_df.to_csv("data/processed/user_vectors.csv")
@@ -0,0 +1,170 @@
+"""
+Content-addressed, size-bounded cache for intermediate pipeline artifacts.
+
+Each stage of SimilarityCalculator -> RoleRecommender -> predictor
+(feature matrix, embedding, similarity / neighbor graph, candidate table,
+scored table) stores its output under a key derived from the key of its
+input stage and its own parameters. Changing a downstream parameter (e.g.
+the classifier threshold or the similarity threshold) therefore reuses every
+upstream artifact.
+
+The cache folder is bounded to max_bytes: when it grows beyond that, the
+least recently used artifacts (by file mtime, refreshed on every hit) are
+deleted. Artifacts larger than max_bytes on their own are not stored.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Optional, Tuple
+
+import joblib
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+ARTIFACT_SUFFIX = ".joblib"
+
+
+def hash_frame(df: pd.DataFrame) -> str:
+    """
+    Content hash of a DataFrame (index, columns and values).
+
+    List columns (e.g. split_roles 'Rol') are hashed through their joined
+    string representation.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object and df[col].map(lambda v: isinstance(v, (list, tuple))).any():
+            df[col] = df[col].map(lambda v: "\x1f".join(map(str, v)) if isinstance(v, (list, tuple)) else str(v))
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(col) for col in df.columns]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def hash_file(path) -> str:
+    """Content hash of a file (e.g. a trained model)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """
+    On-disk cache of pipeline artifacts keyed by the hash of their inputs.
+
+    Attributes:
+        cache_dir (Path): Folder holding the artifacts
+        max_bytes (int): Size limit of the folder
+    """
+
+    def __init__(self, cache_dir, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir (str or Path): Folder for the artifacts (created on demand)
+            max_bytes (int): Maximum total size before LRU eviction
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(stage: str, upstream: Optional[str], params: dict) -> str:
+        """
+        Key of an artifact: hash of the stage name, the upstream key and the parameters.
+
+        Args:
+            stage: Stage name (e.g. 'features', 'embedding')
+            upstream: Key (or content hash) of the stage input
+            params: Parameters of the stage (JSON-serializable)
+        """
+        payload = json.dumps([stage, upstream, params], sort_keys=True, default=str)
+        return f"{stage}_{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{ARTIFACT_SUFFIX}"
+
+    def get(self, key: str) -> Optional[Any]:
+        """Load an artifact (None on a miss) and mark it as recently used."""
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            value = joblib.load(path)
+        except Exception as e:
+            print(f"Ignoring unreadable artifact {path.name}: {str(e)}")
+            return None
+        os.utime(path)
+        return value
+
+    @staticmethod
+    def _estimated_bytes(value: Any) -> int:
+        """In-memory size of frames and arrays (0 if unknown), to skip oversized artifacts before dumping them."""
+        if isinstance(value, tuple):
+            return sum(ArtifactCache._estimated_bytes(item) for item in value)
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(index=True).sum())
+        return int(getattr(value, 'nbytes', 0) or 0)
+
+    def put(self, key: str, value: Any) -> Optional[Path]:
+        """
+        Store an artifact and evict old ones if the cache is over its size limit.
+
+        Returns:
+            Path of the artifact, or None if it alone exceeds max_bytes (not stored)
+        """
+        if self._estimated_bytes(value) > self.max_bytes:
+            print(f"Not caching {key}: larger than the cache limit")
+            return None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        joblib.dump(value, tmp_path)
+        if tmp_path.stat().st_size > self.max_bytes:
+            tmp_path.unlink(missing_ok=True)
+            print(f"Not caching {key}: larger than the cache limit")
+            return None
+        tmp_path.replace(path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: Optional[Path] = None):
+        """Delete least recently used artifacts until the folder fits in max_bytes."""
+        if not self.cache_dir.exists():
+            return
+        files = [(p, p.stat()) for p in self.cache_dir.glob(f"*{ARTIFACT_SUFFIX}")]
+        total = sum(stat.st_size for _, stat in files)
+        for path, stat in sorted(files, key=lambda item: item[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    def get_or_compute(self, stage: str, upstream: Optional[str], params: dict,
+                       compute: Callable[[], Any], store: bool = True) -> Tuple[Any, str]:
+        """
+        Return the cached artifact for (stage, upstream, params), computing it on a miss.
+
+        Args:
+            store: Cache the artifact; with False it is always computed (cheap or
+                   very large artifacts) but its key is still returned
+
+        Returns:
+            (value, key) so the key can be passed as upstream to the next stage
+        """
+        key = self.key(stage, upstream, params)
+        if not store:
+            return compute(), key
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        else:
+            print(f"Reusing cached {stage} ({key})")
+        return value, key
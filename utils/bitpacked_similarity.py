@@ -0,0 +1,133 @@
+"""
+Bit-packed binary rows with popcount similarity kernels.
+
+Each multi-hot row is packed with np.packbits (8 features per byte) and
+viewed as uint64 words, so a pair of users is compared with d / 64 AND
+operations and popcounts instead of d element comparisons. Intersections
+are computed for a tile of (query rows x rows x words) at a time; union and
+Hamming distance follow from the intersection and the row sizes
+(|a | b| = |a| + |b| - |a & b|, hamming = |a| + |b| - 2 |a & b|).
+
+Row blocks are independent and numpy releases the GIL inside the bitwise
+and popcount loops, so blocks run in a thread pool on n_jobs cores.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils.neighbor_graph import DEFAULT_N_JOBS
+from utils.sparse_features import BINARY_METRICS, SparseFeatures, overlap_similarity
+
+PACK_BLOCK_SIZE = 4096
+QUERY_BLOCK_SIZE = 256
+# Bytes of the (query rows x rows x words) work tile of one block
+TILE_BYTES = 32 * 1024 ** 2
+
+# Set bits of every byte, for numpy versions without np.bitwise_count
+_POPCOUNT_TABLE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Set bits of each uint64 word, summed over the last axis."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    as_bytes = words.view(np.uint8)
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+def _pack(binary: np.ndarray, n_words: int) -> np.ndarray:
+    packed = np.packbits(binary, axis=1)
+    words = np.zeros((binary.shape[0], n_words * 8), dtype=np.uint8)
+    words[:, :packed.shape[1]] = packed
+    return words.view(np.uint64)
+
+
+class PackedRows:
+    """
+    Binary rows packed into uint64 words, with the similarity of any row block.
+
+    Attributes:
+        words (np.ndarray): n x n_words packed rows
+        sizes (np.ndarray): Set features of each row
+        index (pd.Index): Usuario of each row
+        metric (str): 'jaccard', 'dice' or 'jaccard_hamming'
+    """
+
+    def __init__(self, X, metric: str = 'jaccard_hamming', block_size: int = PACK_BLOCK_SIZE):
+        if metric not in BINARY_METRICS:
+            raise ValueError(f"Unknown binary metric: {metric}. Options: {list(BINARY_METRICS)}")
+        if isinstance(X, SparseFeatures):
+            matrix, index = X.matrix, X.index
+        elif isinstance(X, pd.DataFrame):
+            numeric = X.drop(columns=['Usuario'], errors='ignore').select_dtypes(include=[np.number])
+            matrix = numeric.to_numpy()
+            index = pd.Index(X['Usuario'] if 'Usuario' in X.columns else X.index, name='Usuario')
+        else:
+            raise TypeError("X must be a SparseFeatures or a DataFrame")
+        n, d = matrix.shape
+        n_words = max(1, -(-d // 64))
+        self.words = np.empty((n, n_words), dtype=np.uint64)
+        # Sparse matrices are densified one row block at a time
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            rows = matrix[start:stop]
+            rows = rows.toarray() if sparse.issparse(rows) else np.asarray(rows)
+            self.words[start:stop] = _pack(rows != 0, n_words)
+        self.sizes = popcount(self.words)
+        self.index = index
+        self.metric = metric
+
+    def __len__(self) -> int:
+        return self.words.shape[0]
+
+    def intersections(self, start: int, stop: int) -> np.ndarray:
+        """|a & b| of rows start:stop against every row ((stop - start) x n)."""
+        queries = self.words[start:stop, None, :]
+        n, n_words = self.words.shape
+        counts = np.empty((stop - start, n), dtype=np.int64)
+        step = max(1, TILE_BYTES // (8 * n_words * max(stop - start, 1)))
+        for col in range(0, n, step):
+            end = min(col + step, n)
+            counts[:, col:end] = popcount(queries & self.words[None, col:end, :])
+        return counts
+
+    def block(self, start: int, stop: int) -> np.ndarray:
+        """Similarities of rows start:stop against every row ((stop - start) x n)."""
+        intersection = self.intersections(start, stop).astype(np.float64)
+        return overlap_similarity(intersection, self.sizes[start:stop], self.sizes, self.metric)
+
+
+def packed_similarity_frame(X, metric: str = 'jaccard_hamming', dtype=np.float64,
+                            block_size: int = QUERY_BLOCK_SIZE, n_jobs: int = DEFAULT_N_JOBS,
+                            packed: Optional[PackedRows] = None) -> pd.DataFrame:
+    """
+    Dense users x users similarity of a binary metric with the popcount kernels.
+
+    Args:
+        X: SparseFeatures or multi-hot DataFrame (non-zero entries count as 1)
+        metric: 'jaccard', 'dice' or 'jaccard_hamming'
+        dtype: dtype of the stored similarities
+        block_size: Query rows per block
+        n_jobs: Blocks computed in parallel (threads)
+        packed: Already packed rows of X (X is then ignored)
+    """
+    packed = packed or PackedRows(X, metric)
+    n = len(packed)
+    sim = np.empty((n, n), dtype=dtype)
+
+    def fill(start):
+        stop = min(start + block_size, n)
+        sim[start:stop] = packed.block(start, stop)
+
+    starts = range(0, n, block_size)
+    if n_jobs > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(fill, starts))
+    else:
+        for start in starts:
+            fill(start)
+    return pd.DataFrame(sim, index=packed.index, columns=packed.index)
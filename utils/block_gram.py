@@ -0,0 +1,112 @@
+"""
+Block-Gram engine for cosine similarity under block weights.
+
+For block-weighted multi-hot vectors x = [w_1 x_1, ..., w_B x_B] the Gram
+matrix is X X^T = sum_b w_b^2 G_b, with G_b = X_b X_b^T the Gram matrix of
+block b. The per-block Grams are computed once from the unweighted
+SparseFeatures; the cosine similarity of any weight combination is then a
+linear combination of them normalized by its diagonal, with no feature
+matrix copies and no new matrix products.
+
+Memory: one users x users matrix per block plus one similarity buffer
+(the weighted sum is accumulated a row chunk at a time, with a
+GRAM_CHUNK_ROWS x users temporary). The Grams are only read after they are
+built, so processes forked after building the engine share them
+copy-on-write and each process adds one buffer.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.sparse_features import SparseFeatures
+
+# Rows of the temporary used to accumulate w_b^2 G_b into the buffer
+GRAM_CHUNK_ROWS = 1024
+
+
+class BlockGramEngine:
+    """
+    Precomputed per-block Gram matrices of a SparseFeatures.
+
+    Attributes:
+        index (pd.Index): Usuario of each row/column
+        grams (dict): Block name -> dense Gram matrix (users x users)
+    """
+
+    def __init__(self, features: SparseFeatures, blocks=None, dtype=np.float64):
+        """
+        Compute the Gram matrix of each block.
+
+        Args:
+            features: Unweighted features (all block weights 1)
+            blocks: Blocks to use (default: every block of features)
+            dtype: dtype of the Grams and of the returned similarities
+        """
+        self.index = features.index
+        self.grams = {}
+        for name in (blocks or features.blocks):
+            X_b = features.block(name)
+            self.grams[name] = (X_b @ X_b.T).toarray().astype(dtype, copy=False)
+        self.dtype = dtype
+        self._buffer = None
+        self._last_key: Optional[Tuple] = None
+
+    def __getstate__(self):
+        # The work buffer is not sent to worker processes; it is allocated on first use
+        state = self.__dict__.copy()
+        state.update(_buffer=None, _last_key=None)
+        return state
+
+    def _key(self, weights: Dict[str, float]) -> Tuple:
+        """Weights up to a common scale (cosine is scale invariant)."""
+        squared = np.array([float(weights.get(name, 1.0)) ** 2 for name in self.grams])
+        total = squared.sum()
+        return tuple(np.round(squared / total, 12)) if total > 0 else tuple(squared)
+
+    def gram(self, weights: Dict[str, float]) -> np.ndarray:
+        """
+        Weighted Gram matrix sum_b w_b^2 G_b (written into an internal buffer).
+
+        Args:
+            weights: Block name -> weight (missing blocks get 1)
+        """
+        n = len(self.index)
+        if self._buffer is None:
+            self._buffer = np.empty((n, n), dtype=self.dtype)
+        self._buffer.fill(0)
+        for name, G_b in self.grams.items():
+            w2 = float(weights.get(name, 1.0)) ** 2
+            if w2 == 0:
+                continue
+            for start in range(0, n, GRAM_CHUNK_ROWS):
+                rows = slice(start, min(start + GRAM_CHUNK_ROWS, n))
+                self._buffer[rows] += G_b[rows] * w2
+        self._last_key = None
+        return self._buffer
+
+    def similarity(self, weights: Dict[str, float]) -> np.ndarray:
+        """
+        Cosine similarity matrix for a weight combination.
+
+        The result lives in an internal buffer that is overwritten by the
+        next call with different weights; combinations that only differ by a
+        common scale reuse it directly. Users with a zero vector get
+        similarity 0 (as sklearn's cosine_similarity).
+        """
+        key = self._key(weights)
+        if key == self._last_key:
+            return self._buffer
+
+        S = self.gram(weights)
+        norms = np.sqrt(np.diagonal(S).copy())
+        norms[norms == 0] = 1.0
+        S /= norms[:, None]
+        S /= norms[None, :]
+        self._last_key = key
+        return S
+
+    def similarity_df(self, weights: Dict[str, float]) -> pd.DataFrame:
+        """similarity() as a DataFrame indexed by Usuario on both axes (no copy)."""
+        return pd.DataFrame(self.similarity(weights), index=self.index, columns=self.index, copy=False)
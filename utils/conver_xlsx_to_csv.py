@@ -1,40 +1,189 @@
-import pandas as pd
+import os
+import sys
+import concurrent.futures
 from pathlib import Path
-def convert_xlsx_to_csv():
-    """Convert all xlsx files in the data folder to csv format"""
-    data_folder = Path("data")
-    
+
+import pandas as pd
+from openpyxl import load_workbook
+
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.snapshot_cache import file_content_hash
+
+# Filas leidas del workbook antes de escribir al archivo de salida
+CHUNK_SIZE = 50_000
+HASH_SUFFIX = ".sha256"
+
+
+def _hash_file(output_file: Path) -> Path:
+    return output_file.with_name(output_file.name + HASH_SUFFIX)
+
+
+def _recorded_hash(output_file: Path):
+    """Hash of the source workbook recorded when output_file was written (None if unknown)."""
+    hash_file = _hash_file(output_file)
+    if not output_file.exists() or not hash_file.exists():
+        return None
+    return hash_file.read_text(encoding="utf-8").strip()
+
+
+def _is_up_to_date(xlsx_file: Path, output_file: Path, source_hash: str) -> bool:
+    """
+    Whether output_file was converted from the current workbook: same recorded
+    hash or, for outputs written before the hashes were recorded, not older
+    than the workbook (the hash is then recorded for the next runs).
+    """
+    if not output_file.exists():
+        return False
+    if _hash_file(output_file).exists():
+        return _recorded_hash(output_file) == source_hash
+    if output_file.stat().st_mtime_ns >= xlsx_file.stat().st_mtime_ns:
+        _hash_file(output_file).write_text(source_hash, encoding="utf-8")
+        return True
+    return False
+
+
+def _iter_chunks(xlsx_file: Path, chunk_size: int):
+    """Stream the first sheet of a workbook as DataFrames of at most chunk_size rows."""
+    wb = load_workbook(xlsx_file, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # Some SAP exports report wrong dimensions; read every row present in the sheet
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(col) if col is not None else f"Unnamed: {i}" for i, col in enumerate(header)]
+        width = len(header)
+
+        buffer = []
+        yielded = False
+        for row in rows:
+            if row is None or all(value is None for value in row):
+                continue
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=header)
+                yielded = True
+                buffer = []
+        if buffer or not yielded:
+            yield pd.DataFrame(buffer, columns=header)
+    finally:
+        wb.close()
+
+
+def _write_csv(chunks, output_file: Path):
+    rows = 0
+    with open(output_file, "w", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, index=False, header=(i == 0))
+            rows += len(chunk)
+    return rows
+
+
+def _text_table(chunk: pd.DataFrame, schema):
+    """Chunk as an Arrow table of the declared all-string schema (missing values stay null)."""
+    import pyarrow as pa
+
+    arrays = []
+    for i in range(chunk.shape[1]):
+        values = chunk.iloc[:, i]
+        text = values.astype(str).where(values.notna(), None)
+        arrays.append(pa.array(text, type=pa.string(), from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _write_parquet(chunks, output_file: Path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                # Declared schema: every column as text, as in the CSV output. Types inferred
+                # from one chunk can change in the next one (empty column, numbers then codes)
+                schema = pa.schema([pa.field(str(col), pa.string()) for col in chunk.columns])
+                writer = pq.ParquetWriter(output_file, schema)
+            writer.write_table(_text_table(chunk, schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def convert_workbook(xlsx_file, output_file, chunk_size=CHUNK_SIZE):
+    """
+    Convert one workbook streaming its rows in read-only mode.
+
+    Skips the conversion when output_file exists and was produced from a
+    workbook with the same content hash (or, without a recorded hash, is not
+    older than the workbook). Parquet outputs store every column as text.
+
+    Args:
+        xlsx_file: Source workbook
+        output_file: Destination .csv or .parquet file
+        chunk_size: Rows kept in memory at a time
+
+    Returns:
+        Message describing the result
+    """
+    xlsx_file = Path(xlsx_file)
+    output_file = Path(output_file)
+    try:
+        source_hash = file_content_hash(xlsx_file)
+        if _is_up_to_date(xlsx_file, output_file, source_hash):
+            return f"El archivo {output_file.name} ya existe. Se omite la conversión."
+
+        tmp_file = output_file.with_name(output_file.name + ".tmp")
+        chunks = _iter_chunks(xlsx_file, chunk_size)
+        if output_file.suffix == ".parquet":
+            rows = _write_parquet(chunks, tmp_file)
+        else:
+            rows = _write_csv(chunks, tmp_file)
+        tmp_file.replace(output_file)
+        _hash_file(output_file).write_text(source_hash, encoding="utf-8")
+        return f"Converted: {xlsx_file.name} -> {output_file.name} ({rows} rows)"
+    except Exception as e:
+        return f"Error converting {xlsx_file.name}: {str(e)}"
+
+
+def convert_xlsx_to_csv(data_folder="data", output_format=".csv", chunk_size=CHUNK_SIZE, max_workers=None):
+    """
+    Convert all xlsx files in the data folder to csv (or parquet) format.
+
+    Workbooks are streamed in chunks of chunk_size rows and converted in
+    parallel, one process per workbook.
+    """
+    data_folder = Path(data_folder)
+
     if not data_folder.exists():
         print(f"Data folder '{data_folder}' not found!")
         return
-    
+
     # Find all xlsx files
     xlsx_files = list(data_folder.glob("*.xlsx"))
-    
+
     if not xlsx_files:
         print("No xlsx files found in data folder!")
         return
-    
+
     print(f"Found {len(xlsx_files)} xlsx files to convert")
-    
-    for xlsx_file in xlsx_files:
-        try:
-            # Create csv filename (same name but with .csv extension)
-            csv_filename = xlsx_file.with_suffix('.csv')
-            # Verifica si el archivo csv ya existe
-            if csv_filename.exists():
-                print(f"El archivo {csv_filename.name} ya existe. Se omite la conversión.")
-                continue
-            # Read the xlsx file
-            df = pd.read_excel(xlsx_file)
-            # Save as csv
-            df.to_csv(csv_filename, index=False)
-            print(f"Converted: {xlsx_file.name} -> {csv_filename.name}")
-        except Exception as e:
-            print(f"Error converting {xlsx_file.name}: {str(e)}")
-    
+
+    if max_workers is None:
+        max_workers = min(len(xlsx_files), os.cpu_count() or 1)
+
+    jobs = [(xlsx_file, xlsx_file.with_suffix(output_format), chunk_size) for xlsx_file in xlsx_files]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(convert_workbook, *job) for job in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            print(future.result())
+
     print("Conversion completed!")
 
 
 if __name__ == "__main__":
-    convert_xlsx_to_csv()
\ No newline at end of file
+    convert_xlsx_to_csv()
@@ -0,0 +1,242 @@
+"""
+Incremental ingestion of AGR_USERS deltas.
+
+Instead of re-running load_data -> merge_df -> split_merge_df over the full
+extract, a delta of added/removed (Usuario, Rol) rows is applied to the
+incidence store (utils.incidence): only the roles of the affected users are
+re-parsed. The patched store is committed atomically as a new revision, and
+the split_roles CSV it mirrors (if any) is rewritten with it.
+
+A delta is a CSV/XLSX with columns Usuario, Rol and Accion, where Accion is
+'A' (added) or 'D' (removed). It can also be computed by diffing two
+AGR_USERS snapshots with diff_snapshots. As in the full rebuild (merge_df
+joins from USER_ADDR), users that are new and not in USER_ADDR are skipped.
+"""
+
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config.constants import AGR_USERS_COLUMNS
+from utils.incidence import DEFAULT_STORE_PATH, load_incidence, patch_incidence
+from utils.utils import parse_roles
+
+ACTION_COLUMN = "Accion"
+ADDED = "A"
+REMOVED = "D"
+
+
+def read_delta(path) -> pd.DataFrame:
+    """
+    Read a delta file.
+
+    Args:
+        path: CSV or XLSX with columns Usuario, Rol, Accion ('A'/'D')
+
+    Returns:
+        Delta DataFrame
+
+    Raises:
+        ValueError: If required columns are missing or Accion has other values
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        delta = pd.read_csv(path)
+    else:
+        delta = pd.read_excel(path)
+
+    missing_columns = [col for col in AGR_USERS_COLUMNS + [ACTION_COLUMN] if col not in delta.columns]
+    if missing_columns:
+        raise ValueError(f"Missing columns in delta file: {missing_columns}")
+
+    delta = delta[AGR_USERS_COLUMNS + [ACTION_COLUMN]].copy()
+    delta[ACTION_COLUMN] = delta[ACTION_COLUMN].astype(str).str.strip().str.upper()
+    invalid = ~delta[ACTION_COLUMN].isin([ADDED, REMOVED])
+    if invalid.any():
+        raise ValueError(f"Invalid {ACTION_COLUMN} values: {sorted(delta.loc[invalid, ACTION_COLUMN].unique())}")
+    return delta
+
+
+def diff_snapshots(old_agr_users_df: pd.DataFrame, new_agr_users_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compute the delta between two AGR_USERS snapshots.
+
+    Args:
+        old_agr_users_df: Previous AGR_USERS (Usuario, Rol)
+        new_agr_users_df: Current AGR_USERS (Usuario, Rol)
+
+    Returns:
+        Delta DataFrame (Usuario, Rol, Accion)
+    """
+    old_pairs = old_agr_users_df[AGR_USERS_COLUMNS].astype(str).drop_duplicates()
+    new_pairs = new_agr_users_df[AGR_USERS_COLUMNS].astype(str).drop_duplicates()
+    merged = old_pairs.merge(new_pairs, on=AGR_USERS_COLUMNS, how='outer', indicator=True)
+
+    added = merged[merged['_merge'] == 'right_only'][AGR_USERS_COLUMNS].assign(**{ACTION_COLUMN: ADDED})
+    removed = merged[merged['_merge'] == 'left_only'][AGR_USERS_COLUMNS].assign(**{ACTION_COLUMN: REMOVED})
+    return pd.concat([removed, added], ignore_index=True)
+
+
+def apply_delta(delta: pd.DataFrame,
+                store_path=DEFAULT_STORE_PATH,
+                user_addr_df: Optional[pd.DataFrame] = None,
+                csv_path=None) -> pd.DataFrame:
+    """
+    Patch the incidence store with a delta and report the changed users.
+
+    Removed roles are dropped from the user's full role list, added roles
+    are appended (as new AGR_USERS rows would be), and the split 'Rol' list
+    of each changed user is rebuilt with the same parser as split_merge_df.
+
+    Args:
+        delta: Delta DataFrame (see read_delta / diff_snapshots)
+        store_path: Incidence store saved with the full roles ('assignments')
+        user_addr_df: USER_ADDR data, used for the Departamento and Función of
+                      users that are new to the store. New users missing from
+                      it are skipped, as the full rebuild (merge_df, a left
+                      join from USER_ADDR) drops them
+        csv_path: split_roles CSV to rewrite (default: the CSV the store mirrors)
+
+    Returns:
+        DataFrame with one row per changed user: Usuario, Added, Removed,
+        New_User and Skipped (new user not in USER_ADDR, nothing applied)
+
+    Raises:
+        ValueError: If the store was saved without the full roles
+    """
+    store = load_incidence(store_path, mmap=False)
+    if not store.has('assignments'):
+        raise ValueError("Incidence store has no full roles ('Roles'); rebuild it with save_incidence")
+
+    delta = delta.copy()
+    delta['Usuario'] = delta['Usuario'].astype(str)
+    delta['Rol'] = delta['Rol'].astype(str)
+    changed_users = pd.unique(delta['Usuario'])
+    positions = pd.Index(store.users).get_indexer(changed_users)
+
+    skipped_users = []
+    if user_addr_df is not None:
+        user_info = user_addr_df.assign(Usuario=user_addr_df['Usuario'].astype(str)).drop_duplicates('Usuario').set_index('Usuario')
+        skipped = (positions < 0) & ~pd.Index(changed_users).isin(user_info.index)
+        skipped_users = list(changed_users[skipped])
+        changed_users, positions = changed_users[~skipped], positions[~skipped]
+    else:
+        print("Warning: no USER_ADDR given, new users are added without Departamento/Función")
+
+    skipped_report = pd.DataFrame({'Usuario': skipped_users, 'Added': 0, 'Removed': 0,
+                                   'New_User': True, 'Skipped': True})
+    if not len(changed_users):
+        return skipped_report
+
+    # Current full roles of the changed users only
+    current = {
+        user: (store.row('assignments', pos) if pos >= 0 else [])
+        for user, pos in zip(changed_users, positions)
+    }
+
+    removed = delta[delta[ACTION_COLUMN] == REMOVED].groupby('Usuario')['Rol'].apply(set).to_dict()
+    added = delta[delta[ACTION_COLUMN] == ADDED].groupby('Usuario')['Rol'].apply(list).to_dict()
+
+    full_roles = []
+    report = []
+    for user in changed_users:
+        to_remove = removed.get(user, set())
+        roles = [rol for rol in current[user] if rol not in to_remove]
+        n_removed = len(current[user]) - len(roles)
+        present = set(roles)
+        n_added = 0
+        for rol in added.get(user, []):
+            if rol not in present:
+                roles.append(rol)
+                present.add(rol)
+                n_added += 1
+        full_roles.append(roles)
+        report.append((user, n_added, n_removed))
+
+    # Re-parse only the affected users' roles (same rules as split_merge_df)
+    flat = pd.Series([rol for roles in full_roles for rol in roles], dtype=object)
+    parsed = parse_roles(flat)
+    bounds = np.cumsum([0] + [len(roles) for roles in full_roles])
+    rol_lists = []
+    location_lists = []
+    for i in range(len(full_roles)):
+        rows = parsed.iloc[bounds[i]:bounds[i + 1]]
+        rows = rows[rows['Valid']]
+        rol_lists.append(rows['Rol'].tolist())
+        location_lists.append(rows['Location'].tolist())
+
+    updates = pd.DataFrame({'Usuario': changed_users, 'Rol': rol_lists, 'Roles': full_roles})
+    if store.has('locations'):
+        updates['Location'] = location_lists
+
+    new_users = positions < 0
+    if new_users.any() and user_addr_df is not None:
+        for column in ('Departamento', 'Función'):
+            updates[column] = [
+                user_info[column].get(user, np.nan) if is_new else _single(store, column, pos)
+                for user, is_new, pos in zip(changed_users, new_users, positions)
+            ]
+
+    patch_incidence(updates, store_path, csv_path)
+
+    report_df = pd.DataFrame(report, columns=['Usuario', 'Added', 'Removed'])
+    report_df['New_User'] = new_users
+    report_df['Skipped'] = False
+    report_df = report_df[(report_df['Added'] > 0) | (report_df['Removed'] > 0) | report_df['New_User']]
+    if skipped_users:
+        report_df = pd.concat([report_df, skipped_report], ignore_index=True)
+    return report_df
+
+
+def _single(store, column, position):
+    """Current Departamento/Función of an existing user in the store."""
+    values = store.row('departments' if column == 'Departamento' else 'functions', position)
+    return values[0] if values else np.nan
+
+
+def ingest(delta_path=None, old_snapshot=None, new_snapshot=None,
+           store_path=DEFAULT_STORE_PATH, user_addr_df=None, csv_path=None) -> pd.DataFrame:
+    """
+    Apply a delta file, or the diff of two AGR_USERS snapshots, to the store.
+
+    user_addr_df (DataFrame or USER_ADDR file) should always be given: new
+    users missing from it are then skipped, so the store matches a full rebuild.
+
+    Returns:
+        Report of the changed users (see apply_delta)
+    """
+    read = lambda path: pd.read_csv(path) if Path(path).suffix.lower() == ".csv" else pd.read_excel(path)
+    if delta_path is not None:
+        delta = read_delta(delta_path)
+    elif old_snapshot is not None and new_snapshot is not None:
+        delta = diff_snapshots(read(old_snapshot), read(new_snapshot))
+    else:
+        raise ValueError("Provide delta_path or both old_snapshot and new_snapshot")
+    if isinstance(user_addr_df, (str, Path)):
+        user_addr_df = read(user_addr_df)
+
+    report = apply_delta(delta, store_path, user_addr_df, csv_path)
+    n_skipped = int(report['Skipped'].sum())
+    print(f"Delta rows: {len(delta)} | Usuarios modificados: {len(report) - n_skipped} | "
+          f"Usuarios fuera de USER_ADDR (omitidos): {n_skipped}")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Apply an AGR_USERS delta to the split roles incidence store")
+    parser.add_argument("--delta", help="Delta file (Usuario, Rol, Accion)")
+    parser.add_argument("--old", help="Previous AGR_USERS snapshot")
+    parser.add_argument("--new", help="Current AGR_USERS snapshot")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH)
+    parser.add_argument("--user-addr", help="USER_ADDR file: Departamento/Función of new users (others are skipped)")
+    parser.add_argument("--csv", help="split_roles CSV to rewrite (default: the one the store mirrors)")
+    args = parser.parse_args()
+
+    changed = ingest(args.delta, args.old, args.new, args.store, args.user_addr, csv_path=args.csv)
+    print(changed.to_string(index=False))
@@ -0,0 +1,193 @@
+"""
+Integer dictionary encoding for the identifiers used across the pipeline.
+
+Usuario, Rol (full and prefix), Departamento and Función are assigned stable
+int32 ids once per snapshot. Joins and set operations then run on integer
+arrays, and labels are decoded only when results are exported or shown.
+
+Ids are append-only: adding new labels never renumbers existing ones, so a
+saved encoding can be extended with a later snapshot.
+"""
+
+import json
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+ID_DTYPE = np.int32
+UNKNOWN_ID = -1
+
+
+class Vocabulary:
+    """
+    Append-only mapping label <-> int32 id.
+
+    Attributes:
+        labels (list): Labels ordered by id
+    """
+
+    def __init__(self, labels: Iterable = ()):
+        self.labels = []
+        self._ids = {}
+        self._index = None
+        self.add(labels)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __contains__(self, label) -> bool:
+        return label in self._ids
+
+    def add(self, labels: Iterable) -> int:
+        """
+        Append the labels not yet in the vocabulary.
+
+        Returns:
+            Number of labels added
+        """
+        added = 0
+        for label in pd.unique(pd.Series(list(labels), dtype=object).dropna()):
+            if label not in self._ids:
+                self._ids[label] = len(self.labels)
+                self.labels.append(label)
+                added += 1
+        if added:
+            self._index = None
+        return added
+
+    def _get_index(self) -> pd.Index:
+        if self._index is None:
+            self._index = pd.Index(self.labels, dtype=object)
+        return self._index
+
+    def encode(self, values, add: bool = False) -> np.ndarray:
+        """
+        Encode labels as ids.
+
+        Args:
+            values: Iterable of labels
+            add: Append unknown labels instead of mapping them to UNKNOWN_ID
+
+        Returns:
+            np.ndarray of int32 ids (UNKNOWN_ID for missing/unknown labels)
+        """
+        values = pd.Series(values, dtype=object) if not isinstance(values, pd.Series) else values.astype(object)
+        if add:
+            self.add(values)
+        if not len(self.labels):
+            return np.full(len(values), UNKNOWN_ID, dtype=ID_DTYPE)
+        return self._get_index().get_indexer(values).astype(ID_DTYPE)
+
+    def id_of(self, label) -> int:
+        return self._ids.get(label, UNKNOWN_ID)
+
+    def decode(self, ids) -> np.ndarray:
+        """Decode ids back to labels (None for UNKNOWN_ID)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        labels = np.asarray(self.labels + [None], dtype=object)
+        return labels[np.where(ids < 0, len(self.labels), ids)]
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([str(label) for label in self.labels], f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path) -> "Vocabulary":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+
+def role_prefix(roles: pd.Series) -> pd.Series:
+    """Role prefix (text before the first '-') of full role strings."""
+    return roles.astype(str).str.split('-', n=1).str[0]
+
+
+def pair_keys(left_ids, right_ids) -> np.ndarray:
+    """
+    Combine two id arrays into one int64 key per pair (e.g. User_Role).
+
+    Pairs with an unknown id on either side get -1.
+    """
+    left_ids = np.asarray(left_ids, dtype=np.int64)
+    right_ids = np.asarray(right_ids, dtype=np.int64)
+    keys = (left_ids << 32) | right_ids
+    return np.where((left_ids < 0) | (right_ids < 0), -1, keys)
+
+
+def known_pairs(keys) -> np.ndarray:
+    """Sorted unique pair keys, without the -1 of pairs with an unknown id."""
+    keys = np.unique(np.asarray(keys, dtype=np.int64))
+    return keys[keys >= 0]
+
+
+def split_pair_keys(keys):
+    """Inverse of pair_keys: returns (left_ids, right_ids)."""
+    keys = np.asarray(keys, dtype=np.int64)
+    return (keys >> 32).astype(ID_DTYPE), (keys & 0xFFFFFFFF).astype(ID_DTYPE)
+
+
+class SnapshotEncoding:
+    """
+    Vocabularies shared by every stage for one data snapshot.
+
+    Attributes:
+        users (Vocabulary): Usuario
+        roles (Vocabulary): Full role strings (AGR_USERS / resumen)
+        role_prefixes (Vocabulary): Role names as used in split_roles ('Rol' lists)
+        departments (Vocabulary): Departamento
+        functions (Vocabulary): Función
+    """
+
+    FIELDS = ('users', 'roles', 'role_prefixes', 'departments', 'functions')
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, Vocabulary())
+
+    @classmethod
+    def from_frames(cls,
+                    split_df: Optional[pd.DataFrame] = None,
+                    agr_users_df: Optional[pd.DataFrame] = None,
+                    resumen_df: Optional[pd.DataFrame] = None) -> "SnapshotEncoding":
+        """
+        Build the encoding from the frames of a snapshot.
+
+        Args:
+            split_df: split_roles DataFrame (Usuario, Departamento, Función, Rol lists)
+            agr_users_df: AGR_USERS DataFrame (Usuario, Rol)
+            resumen_df: Resumen DataFrame (Usuario, Rol, Fecha)
+        """
+        encoding = cls()
+        encoding.update(split_df, agr_users_df, resumen_df)
+        return encoding
+
+    def update(self, split_df=None, agr_users_df=None, resumen_df=None):
+        """Append labels of new frames; existing ids are kept."""
+        if split_df is not None:
+            self.users.add(split_df['Usuario'])
+            self.departments.add(split_df['Departamento'])
+            self.functions.add(split_df['Función'])
+            self.role_prefixes.add(split_df['Rol'].explode().dropna())
+        for df in (agr_users_df, resumen_df):
+            if df is not None:
+                self.users.add(df['Usuario'])
+                self.roles.add(df['Rol'])
+                self.role_prefixes.add(role_prefix(df['Rol'].dropna()))
+
+    def save(self, folder):
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        for field in self.FIELDS:
+            getattr(self, field).save(folder / f"{field}.json")
+
+    @classmethod
+    def load(cls, folder) -> "SnapshotEncoding":
+        folder = Path(folder)
+        encoding = cls()
+        for field in cls.FIELDS:
+            path = folder / f"{field}.json"
+            if path.exists():
+                setattr(encoding, field, Vocabulary.load(path))
+        return encoding
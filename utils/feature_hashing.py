@@ -0,0 +1,118 @@
+"""
+Hashed user features with a fixed width per block.
+
+Instead of one column per department, función and role (a width that grows
+with every onboarded plant), each category is hashed (murmurhash3, through
+sklearn FeatureHasher) into one of a fixed number of buckets per block. The
+matrix width, and with it the memory and embedding cost, stays constant as
+roles are added. Categories that share a bucket become indistinguishable;
+hash_collision_stats reports how often that happens so the dimensions can be
+sized.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction import FeatureHasher
+
+from utils.sparse_features import BLOCK_PREFIXES, SparseFeatures
+
+# Block name -> buckets
+DEFAULT_HASH_DIMS = {
+    'department': 256,
+    'function': 512,
+    'roles': 8192,
+}
+# Block name -> split_roles column
+HASH_FIELDS = {
+    'department': 'Departamento',
+    'function': 'Función',
+    'roles': 'Rol',
+}
+
+
+def _block_lists(split_df: pd.DataFrame, name: str) -> list:
+    """Categories of each user as a list of strings (roles lists, or a single value)."""
+    values = split_df[HASH_FIELDS[name]]
+    if name == 'roles':
+        return [[str(r) for r in roles] if isinstance(roles, (list, tuple, np.ndarray)) else [] for roles in values]
+    return [[str(v)] if pd.notna(v) else [] for v in values]
+
+
+def _hasher(n_buckets: int) -> FeatureHasher:
+    # Non-negative counts, so the hashed vectors stay multi-hot
+    return FeatureHasher(n_features=n_buckets, input_type='string', alternate_sign=False)
+
+
+def hash_dims(dims: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """DEFAULT_HASH_DIMS overridden by dims."""
+    return dict(DEFAULT_HASH_DIMS, **(dims or {}))
+
+
+def create_hashed_features(split_df: pd.DataFrame, dims: Optional[Dict[str, int]] = None,
+                           weights: Optional[Dict[str, float]] = None, dtype=np.float64) -> SparseFeatures:
+    """
+    Hashed multi-hot features: one block of dims[name] buckets per block.
+
+    Args:
+        split_df: split_roles-like DataFrame (Usuario, Departamento, Función, Rol lists)
+        dims: Block name -> number of buckets (default DEFAULT_HASH_DIMS)
+        weights: Block name -> weight
+        dtype: dtype of the matrix
+
+    Returns:
+        SparseFeatures with columns '<prefix>h<bucket>'; a bucket hit by
+        several categories of a user is 1, as in the multi-hot matrix
+    """
+    dims = hash_dims(dims)
+    matrices, columns, blocks = [], [], {}
+    start = 0
+    for name in HASH_FIELDS:
+        matrices.append(_hasher(dims[name]).transform(_block_lists(split_df, name)))
+        columns += [f"{BLOCK_PREFIXES[name]}h{i}" for i in range(dims[name])]
+        blocks[name] = (start, start + dims[name])
+        start += dims[name]
+    matrix = sparse.hstack(matrices, format='csr')
+    matrix.data[:] = 1
+    features = SparseFeatures(matrix, split_df['Usuario'], columns, blocks)
+    return features.scale_blocks(weights or {}, dtype=dtype)
+
+
+def hash_collision_stats(split_df: pd.DataFrame, dims: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+    """
+    Collision statistics of the hashed features, per block.
+
+    Columns:
+        block, buckets, categories, load (categories / buckets),
+        buckets_used, colliding_categories (share of categories sharing a
+        bucket with another one), expected_colliding (same share for a
+        uniform hash: 1 - (1 - 1/buckets)^(categories - 1)),
+        user_collisions (share of users with two of their own categories in
+        one bucket, which loses one of them)
+    """
+    dims = hash_dims(dims)
+    rows = []
+    for name in HASH_FIELDS:
+        n_buckets = dims[name]
+        lists = _block_lists(split_df, name)
+        categories = sorted({c for values in lists for c in values})
+        buckets = _hasher(n_buckets).transform([[c] for c in categories]).indices
+        counts = np.bincount(buckets, minlength=n_buckets)
+
+        user_matrix = _hasher(n_buckets).transform(lists)
+        per_user_buckets = np.diff(user_matrix.indptr)
+        per_user_categories = np.array([len(set(values)) for values in lists])
+        n_categories = len(categories)
+        rows.append({
+            'block': name,
+            'buckets': n_buckets,
+            'categories': n_categories,
+            'load': round(n_categories / n_buckets, 4),
+            'buckets_used': int((counts > 0).sum()),
+            'colliding_categories': round(float(counts[counts > 1].sum()) / n_categories, 4) if n_categories else 0.0,
+            'expected_colliding': round(1 - (1 - 1 / n_buckets) ** max(n_categories - 1, 0), 4),
+            'user_collisions': round(float((per_user_buckets < per_user_categories).mean()), 4) if lists else 0.0,
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,184 @@
+"""
+Persisted, append-only vocabulary of the user feature columns.
+
+create_user_multihot_vectors derives its columns from the data of each run,
+so the layout changes whenever a department, función or role appears or
+disappears. A FeatureVocabulary fixes the column of every category once:
+new categories get new columns at the end, existing columns are never
+renumbered. Feature matrices encoded with the same (or an extended)
+vocabulary are therefore comparable, and new users are encoded with a
+dictionary lookup per role, O(roles per user).
+
+On the first fit the columns are in the same order as the sparse
+create_user_multihot_vectors output (departments, functions, roles, each
+sorted), so the blocks are contiguous ranges; categories added later are
+appended after the roles and their block becomes a list of positions.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils.encoding import Vocabulary
+from utils.sparse_features import BLOCK_PREFIXES, SparseFeatures
+
+FEATURE_VOCABULARY_PATH = "models/modulo_similaridad/feature_vocabulary.json"
+# Block name -> split_roles column
+BLOCK_FIELDS = {
+    'department': 'Departamento',
+    'function': 'Función',
+    'roles': 'Rol',
+}
+
+
+def _labels(values: pd.Series) -> pd.Series:
+    """Labels as strings (saved vocabularies are JSON), missing values kept as NaN."""
+    values = values.astype(object)
+    return values.where(values.isna(), values.astype(str))
+
+
+class FeatureVocabulary:
+    """
+    Column of each (block, category) of the user feature matrix.
+
+    Attributes:
+        labels (dict): Block name -> Vocabulary of its categories
+        positions (dict): Block name -> list of the column of each category id
+        n_columns (int): Total number of columns
+    """
+
+    def __init__(self):
+        self.labels: Dict[str, Vocabulary] = {name: Vocabulary() for name in BLOCK_FIELDS}
+        self.positions: Dict[str, list] = {name: [] for name in BLOCK_FIELDS}
+        self.n_columns = 0
+
+    @classmethod
+    def fit(cls, split_df: pd.DataFrame) -> "FeatureVocabulary":
+        vocabulary = cls()
+        vocabulary.update(split_df)
+        return vocabulary
+
+    def _block_values(self, split_df: pd.DataFrame, name: str) -> pd.Series:
+        values = split_df[BLOCK_FIELDS[name]]
+        if name == 'roles':
+            values = values.explode()
+        return _labels(values)
+
+    def update(self, split_df: pd.DataFrame) -> int:
+        """
+        Append the categories of split_df not yet in the vocabulary (sorted within each block).
+
+        Returns:
+            Number of columns added
+        """
+        added = 0
+        for name in BLOCK_FIELDS:
+            vocabulary = self.labels[name]
+            new = sorted(set(self._block_values(split_df, name).dropna()) - set(vocabulary.labels))
+            vocabulary.add(new)
+            self.positions[name].extend(range(self.n_columns, self.n_columns + len(new)))
+            self.n_columns += len(new)
+            added += len(new)
+        return added
+
+    @property
+    def columns(self) -> list:
+        """Column names (same naming as the dense get_dummies / MultiLabelBinarizer output)."""
+        columns = [None] * self.n_columns
+        for name in BLOCK_FIELDS:
+            prefix = BLOCK_PREFIXES[name]
+            for label, position in zip(self.labels[name].labels, self.positions[name]):
+                columns[position] = f"{prefix}{label}"
+        return columns
+
+    def blocks(self) -> dict:
+        """Block name -> (start, stop) if its columns are contiguous, else array of positions."""
+        blocks = {}
+        for name, positions in self.positions.items():
+            positions = np.asarray(positions, dtype=np.int64)
+            if len(positions) == 0 or (positions == np.arange(positions[0], positions[0] + len(positions))).all():
+                start = int(positions[0]) if len(positions) else 0
+                blocks[name] = (start, start + len(positions))
+            else:
+                blocks[name] = positions
+        return blocks
+
+    def transform(self, split_df: pd.DataFrame, weights: Optional[Dict[str, float]] = None,
+                  dtype=np.float64) -> SparseFeatures:
+        """
+        Encode users with the vocabulary; unknown categories are ignored.
+
+        Args:
+            split_df: split_roles-like DataFrame (Usuario, Departamento, Función, Rol lists)
+            weights: Block name -> weight
+            dtype: dtype of the matrix
+
+        Returns:
+            SparseFeatures with n_columns columns
+        """
+        n_users = len(split_df)
+        rows, cols = [], []
+        for name in BLOCK_FIELDS:
+            values = self._block_values(split_df, name)
+            if name == 'roles':
+                # explode gives one row per role, and one (missing) row for empty or missing lists
+                counts = split_df['Rol'].map(
+                    lambda roles: max(len(roles), 1) if isinstance(roles, (list, tuple, np.ndarray)) else 1
+                )
+                user_rows = np.repeat(np.arange(n_users), counts.to_numpy())
+            else:
+                user_rows = np.arange(n_users)
+            ids = self.labels[name].encode(values)
+            known = ids >= 0
+            rows.append(user_rows[known])
+            cols.append(np.asarray(self.positions[name], dtype=np.int64)[ids[known]])
+
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_users, self.n_columns))
+        # Repeated roles of a user count once (as MultiLabelBinarizer)
+        matrix.data[:] = 1
+        features = SparseFeatures(matrix, split_df['Usuario'], self.columns, self.blocks())
+        return features.scale_blocks(weights or {}, dtype=dtype)
+
+    def fingerprint(self) -> str:
+        """Hash of the vocabulary state (for cache keys)."""
+        return hashlib.sha256(json.dumps(self.to_dict(), ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+
+    def to_dict(self) -> dict:
+        return {
+            name: {'labels': [str(label) for label in self.labels[name].labels], 'positions': self.positions[name]}
+            for name in BLOCK_FIELDS
+        }
+
+    def save(self, path=FEATURE_VOCABULARY_PATH) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        return path
+
+    @classmethod
+    def load(cls, path=FEATURE_VOCABULARY_PATH) -> "FeatureVocabulary":
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Feature vocabulary not found: {path}")
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        vocabulary = cls()
+        for name in BLOCK_FIELDS:
+            vocabulary.labels[name] = Vocabulary(data[name]['labels'])
+            vocabulary.positions[name] = list(data[name]['positions'])
+        vocabulary.n_columns = sum(len(positions) for positions in vocabulary.positions.values())
+        return vocabulary
+
+    @classmethod
+    def load_or_fit(cls, split_df: pd.DataFrame, path=FEATURE_VOCABULARY_PATH) -> "FeatureVocabulary":
+        """Load the saved vocabulary, append the categories of split_df and save it back."""
+        vocabulary = cls.load(path) if Path(path).exists() else cls()
+        if vocabulary.update(split_df) or not Path(path).exists():
+            vocabulary.save(path)
+        return vocabulary
@@ -0,0 +1,499 @@
+"""
+Sparse user x role incidence store.
+
+split_roles.csv keeps 'Rol' and 'Location' as Python-literal lists, so every
+consumer has to run ast.literal_eval row by row. This module persists the
+same information as CSR matrices plus vocabularies:
+
+    users x roles        (one entry per role in the user's 'Rol' list)
+    users x locations    (aligned entry by entry with users x roles)
+    users x departments  (one-hot 'Departamento')
+    users x functions    (one-hot 'Función')
+    users x assignments  (optional: full AGR_USERS roles, the 'Roles' column
+                          of merge_df, used to apply deltas; see utils.deltas)
+
+Each matrix is stored as plain .npy arrays (indptr, indices) and each
+vocabulary as a .npy string array, so a store can be memory-mapped and
+opened in milliseconds. Inside a row, entries keep the original list order
+(duplicates included), which allows the split_roles DataFrame to be rebuilt
+exactly.
+
+Every write goes to a new revision folder (rev-000001/, rev-000002/, ...)
+and meta.json, which names the current revision, is replaced last
+(os.replace). A crash while writing leaves the previous revision in use;
+readers never see arrays of two different revisions. When the store mirrors
+a split_roles CSV (csv_path), the CSV is rewritten with every revision and
+its size/mtime is recorded in meta.json.
+"""
+
+import ast
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+STORE_VERSION = 1
+DEFAULT_STORE_PATH = "data/processed/split_roles"
+# matrix name -> split_roles column it is built from
+STORE_COLUMNS = {
+    'roles': 'Rol',
+    'locations': 'Location',
+    'departments': 'Departamento',
+    'functions': 'Función',
+    'assignments': 'Roles',
+}
+SINGLE_VALUED = ('departments', 'functions')
+
+
+def parse_list(value) -> list:
+    """Parse a split_roles list cell (list, Python-literal string or NaN)."""
+    if isinstance(value, list):
+        return value
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return []
+    if isinstance(value, str):
+        s = value.strip()
+        if s.startswith('[') and s.endswith(']'):
+            try:
+                parsed = ast.literal_eval(s)
+                if isinstance(parsed, list):
+                    return parsed
+            except (ValueError, SyntaxError):
+                pass
+        return [s] if s else []
+    return []
+
+
+def _encode_lists(lists, vocabulary: Optional[np.ndarray] = None):
+    """
+    Encode a sequence of lists as CSR (indptr, indices) over a vocabulary.
+
+    When a vocabulary is given, unseen labels are appended to it so existing
+    column ids never change.
+    """
+    lengths = np.fromiter((len(values) for values in lists), dtype=np.int64, count=len(lists))
+    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    flat = pd.Series([str(value) for values in lists for value in values], dtype=object)
+    if vocabulary is None:
+        codes, uniques = pd.factorize(flat, sort=True)
+        vocabulary = np.asarray(uniques, dtype=str)
+    else:
+        unseen = np.setdiff1d(flat.unique().astype(str), vocabulary)
+        if len(unseen):
+            vocabulary = np.concatenate([vocabulary, unseen])
+        codes = pd.Index(vocabulary).get_indexer(flat)
+    return indptr, codes.astype(np.int32), vocabulary
+
+
+def _column_lists(name: str, values) -> List[list]:
+    """Cells of a split_roles column as lists (single-valued columns: str labels, NaN -> [])."""
+    if name in SINGLE_VALUED:
+        return [[str(v)] if pd.notna(v) else [] for v in values]
+    return [parse_list(v) for v in values]
+
+
+MATRIX_SUFFIXES = ('indptr', 'indices', 'vocab')
+
+
+def _read_meta(store_path: Path) -> Optional[dict]:
+    meta_path = store_path / "meta.json"
+    if not meta_path.exists():
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _data_path(store_path: Path, meta: dict) -> Path:
+    """Folder of the arrays of the current revision (stores written before revisions keep them at the top)."""
+    return store_path / meta['data'] if meta.get('data') else store_path
+
+
+def _new_revision(store_path: Path, meta: Optional[dict]):
+    """(revision number, empty folder) for the next write."""
+    revision = (meta or {}).get('revision', 0) + 1
+    data_path = store_path / f"rev-{revision:06d}"
+    if data_path.exists():
+        # Leftover of a write that crashed before its meta.json was replaced
+        shutil.rmtree(data_path)
+    data_path.mkdir(parents=True)
+    return revision, data_path
+
+
+def _write_matrix(data_path: Path, name: str, indptr, indices, vocabulary):
+    for suffix, array in zip(MATRIX_SUFFIXES, (indptr, indices, vocabulary)):
+        np.save(data_path / f"{name}.{suffix}.npy", array)
+
+
+def _link_matrix(source_path: Path, data_path: Path, name: str):
+    """Reuse the files of an unchanged matrix in the new revision (hard link, copy if not supported)."""
+    for suffix in MATRIX_SUFFIXES:
+        source, target = source_path / f"{name}.{suffix}.npy", data_path / f"{name}.{suffix}.npy"
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+
+def csv_stamp(csv_path) -> dict:
+    """Size and modification time of a file (to detect that it changed)."""
+    stat = Path(csv_path).stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _write_csv(split_df: pd.DataFrame, csv_path) -> Path:
+    """Write the split_roles CSV (without the full roles) through a temporary file."""
+    csv_path = Path(csv_path)
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = csv_path.with_name(csv_path.name + ".tmp")
+    split_df.drop(columns=['Roles'], errors='ignore').to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_path)
+    return csv_path
+
+
+def _commit_revision(store_path: Path, previous: Optional[dict], revision: int, data_path: Path,
+                     n_users: int, matrices, csv_path=None):
+    """
+    Make a fully written revision the current one by replacing meta.json, then
+    remove the files of the previous revision.
+    """
+    meta = {
+        'version': STORE_VERSION,
+        'revision': revision,
+        'data': data_path.name,
+        'n_users': int(n_users),
+        'matrices': sorted(matrices),
+    }
+    if csv_path is not None:
+        meta['csv'] = {'path': os.path.relpath(csv_path, store_path), **csv_stamp(csv_path)}
+    tmp_path = store_path / "meta.json.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, store_path / "meta.json")
+
+    if previous is not None:
+        old_path = _data_path(store_path, previous)
+        if old_path != store_path:
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            # Store written before revisions: arrays at the top of the folder
+            for name in previous['matrices']:
+                for suffix in MATRIX_SUFFIXES:
+                    (store_path / f"{name}.{suffix}.npy").unlink(missing_ok=True)
+            (store_path / "users.npy").unlink(missing_ok=True)
+
+
+def mirrored_csv(store_path) -> Optional[Path]:
+    """split_roles CSV mirrored by a store (None if it was saved without csv_path)."""
+    store_path = Path(store_path)
+    meta = _read_meta(store_path)
+    if meta is None or 'csv' not in meta:
+        return None
+    return (store_path / meta['csv']['path']).resolve()
+
+
+def save_incidence(split_df: pd.DataFrame, store_path=DEFAULT_STORE_PATH, csv_path=None) -> Path:
+    """
+    Persist a split_roles DataFrame as a sparse incidence store.
+
+    Args:
+        split_df: DataFrame with Usuario, Departamento, Función, Rol (lists)
+                  and optionally Location (lists aligned with Rol) and Roles
+                  (full AGR_USERS roles per user, needed to apply deltas)
+        store_path: Folder for the store (created if needed)
+        csv_path: Optional split_roles CSV written together with the store
+                  (without Roles) and kept in sync by patch_incidence
+
+    Returns:
+        Path to the store folder
+    """
+    store_path = Path(store_path)
+    store_path.mkdir(parents=True, exist_ok=True)
+    previous = _read_meta(store_path)
+
+    lists = {
+        name: _column_lists(name, split_df[column])
+        for name, column in STORE_COLUMNS.items()
+        if column in split_df.columns
+    }
+    if 'locations' in lists:
+        if any(len(r) != len(l) for r, l in zip(lists['roles'], lists['locations'])):
+            raise ValueError("Rol and Location lists must have the same length for every user")
+
+    revision, data_path = _new_revision(store_path, previous)
+    np.save(data_path / "users.npy", np.asarray(split_df['Usuario'].astype(str), dtype=str))
+    for name, values in lists.items():
+        _write_matrix(data_path, name, *_encode_lists(values))
+
+    if csv_path is not None:
+        _write_csv(split_df, csv_path)
+    _commit_revision(store_path, previous, revision, data_path, len(split_df), lists.keys(), csv_path)
+    return store_path
+
+
+def _patch_csr(indptr, indices, row_positions, row_codes, n_rows):
+    """
+    Replace some rows of a CSR structure (and grow it to n_rows rows).
+
+    Args:
+        indptr, indices: Current CSR arrays
+        row_positions: Rows to replace (may be >= current row count for new rows)
+        row_codes: One array of column ids per row in row_positions
+        n_rows: Row count of the result
+
+    Returns:
+        (indptr, indices) of the patched structure
+    """
+    indptr = np.asarray(indptr)
+    indices = np.asarray(indices)
+    old_lengths = np.diff(indptr)
+    entry_rows = np.repeat(np.arange(len(old_lengths)), old_lengths)
+    keep = ~np.isin(entry_rows, row_positions)
+
+    new_rows = np.repeat(np.asarray(row_positions, dtype=np.int64), [len(c) for c in row_codes])
+    new_codes = np.concatenate(row_codes) if len(row_codes) else np.empty(0, dtype=np.int32)
+
+    all_rows = np.concatenate([entry_rows[keep], new_rows])
+    all_codes = np.concatenate([indices[keep], new_codes.astype(np.int32)])
+    order = np.argsort(all_rows, kind='stable')
+
+    patched_indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(all_rows, minlength=n_rows), out=patched_indptr[1:])
+    return patched_indptr, all_codes[order]
+
+
+def patch_incidence(updates: pd.DataFrame, store_path=DEFAULT_STORE_PATH, csv_path=None) -> List[str]:
+    """
+    Replace the rows of some users in a store, appending users not in it.
+
+    The patched store is written as a new revision: the CSR arrays of the
+    matrices whose column is present in `updates` (or that get new users) are
+    rebuilt, the files of the other matrices are hard-linked from the
+    previous revision, and meta.json is replaced last. New users get empty
+    rows in the matrices not in `updates`. Vocabularies are extended, never
+    renumbered.
+
+    Args:
+        updates: split_roles-like DataFrame (Usuario plus any of Rol, Location,
+                 Departamento, Función, Roles) with one row per changed user
+        store_path: Store to patch
+        csv_path: split_roles CSV to rewrite with the patched data (default:
+                  the CSV the store mirrors, if any)
+
+    Returns:
+        List of the users that were added to the store
+    """
+    store_path = Path(store_path)
+    store = IncidenceStore(store_path, mmap=False)
+    csv_path = csv_path or mirrored_csv(store_path)
+    user_names = updates['Usuario'].astype(str).to_numpy()
+    positions = pd.Index(store.users).get_indexer(user_names).astype(np.int64)
+    is_new = positions < 0
+    n_old = len(store.users)
+    positions[is_new] = n_old + np.arange(is_new.sum())
+    users = np.concatenate([store.users, user_names[is_new]]).astype(str)
+
+    revision, data_path = _new_revision(store_path, store.meta)
+    for name in store.meta['matrices']:
+        column = STORE_COLUMNS.get(name)
+        if column not in updates.columns and not is_new.any():
+            _link_matrix(store.data_path, data_path, name)
+            continue
+        indptr, indices = store._arrays[name]
+        if column in updates.columns:
+            rows, values = positions, _column_lists(name, updates[column])
+        else:
+            rows, values = positions[is_new], [[] for _ in range(is_new.sum())]
+        _, codes, vocabulary = _encode_lists(values, store.vocabularies[name])
+        bounds = np.cumsum([0] + [len(v) for v in values])
+        row_codes = [codes[bounds[i]:bounds[i + 1]] for i in range(len(values))]
+        indptr, indices = _patch_csr(indptr, indices, rows, row_codes, len(users))
+        _write_matrix(data_path, name, indptr, indices, vocabulary)
+    np.save(data_path / "users.npy", users)
+
+    if csv_path is not None:
+        # The CSV has no row-level patch: it is rewritten from the new revision
+        _write_csv(IncidenceStore.from_data(data_path, users, store.meta['matrices']).to_split_df(), csv_path)
+    _commit_revision(store_path, store.meta, revision, data_path, len(users), store.meta['matrices'], csv_path)
+    return user_names[is_new].tolist()
+
+
+class IncidenceStore:
+    """
+    Read access to a persisted incidence store.
+
+    Attributes:
+        store_path (Path): Folder of the store
+        users (np.ndarray): User ids, one per matrix row
+        vocabularies (dict): matrix name -> np.ndarray with its column labels
+    """
+
+    def __init__(self, store_path=DEFAULT_STORE_PATH, mmap: bool = True):
+        """
+        Open a store.
+
+        Args:
+            store_path: Folder written by save_incidence
+            mmap: Memory-map the arrays instead of reading them into memory
+
+        Raises:
+            FileNotFoundError: If the folder is not an incidence store
+        """
+        self.store_path = Path(store_path)
+        self.meta = _read_meta(self.store_path)
+        if self.meta is None:
+            raise FileNotFoundError(f"Incidence store not found: {store_path}")
+        self.data_path = _data_path(self.store_path, self.meta)
+        self._load(mmap)
+
+    def _load(self, mmap: bool):
+        mmap_mode = 'r' if mmap else None
+        self.users = np.load(self.data_path / "users.npy")
+        self._arrays = {}
+        self.vocabularies = {}
+        for name in self.meta['matrices']:
+            self._arrays[name] = (
+                np.load(self.data_path / f"{name}.indptr.npy", mmap_mode=mmap_mode),
+                np.load(self.data_path / f"{name}.indices.npy", mmap_mode=mmap_mode),
+            )
+            self.vocabularies[name] = np.load(self.data_path / f"{name}.vocab.npy")
+
+    @classmethod
+    def from_data(cls, data_path, users, matrices) -> "IncidenceStore":
+        """Open the arrays of a revision folder that is not (yet) the current one."""
+        store = cls.__new__(cls)
+        store.data_path = Path(data_path)
+        store.store_path = store.data_path.parent
+        store.meta = {'matrices': list(matrices), 'n_users': len(users)}
+        store._load(mmap=False)
+        return store
+
+    def has(self, name: str) -> bool:
+        return name in self._arrays
+
+    def matrix(self, name: str) -> sparse.csr_matrix:
+        """
+        Users x vocabulary CSR matrix with 1 for every entry.
+
+        Duplicated entries inside a row (same role in two locations) are
+        summed, so for 'roles' the values are the number of times the user
+        holds the role.
+        """
+        indptr, indices = self._arrays[name]
+        data = np.ones(len(indices), dtype=np.float32)
+        # Copies: sum_duplicates sorts in place and the arrays may be read-only memmaps
+        X = sparse.csr_matrix(
+            (data, np.array(indices), np.array(indptr)),
+            shape=(len(self.users), len(self.vocabularies[name])),
+        )
+        X.sum_duplicates()
+        return X
+
+    def row_lists(self, name: str) -> List[list]:
+        """Per-user lists of labels in their original order."""
+        indptr, indices = self._arrays[name]
+        labels = self.vocabularies[name][np.asarray(indices)].tolist()
+        bounds = np.asarray(indptr)
+        return [labels[bounds[i]:bounds[i + 1]] for i in range(len(self.users))]
+
+    def row(self, name: str, position: int) -> list:
+        """Labels of a single row (user position) in their original order."""
+        indptr, indices = self._arrays[name]
+        start, end = indptr[position], indptr[position + 1]
+        return self.vocabularies[name][np.asarray(indices[start:end])].tolist()
+
+    def _single_values(self, name: str) -> list:
+        return [values[0] if values else np.nan for values in self.row_lists(name)]
+
+    def user_roles_dict(self) -> Dict[str, Set[str]]:
+        """Usuario -> set of roles."""
+        return {user: set(roles) for user, roles in zip(self.users.tolist(), self.row_lists('roles'))}
+
+    def user_role_pairs(self) -> pd.DataFrame:
+        """Long (Usuario, Rol) DataFrame, one row per entry of the roles matrix."""
+        indptr, indices = self._arrays['roles']
+        counts = np.diff(np.asarray(indptr))
+        return pd.DataFrame({
+            'Usuario': np.repeat(self.users, counts),
+            'Rol': self.vocabularies['roles'][np.asarray(indices)],
+        })
+
+    def to_split_df(self, include_assignments: bool = False) -> pd.DataFrame:
+        """Rebuild the split_roles DataFrame (Rol/Location as lists, optionally Roles)."""
+        df = pd.DataFrame({
+            'Usuario': self.users,
+            'Departamento': self._single_values('departments'),
+            'Función': self._single_values('functions'),
+            'Rol': self.row_lists('roles'),
+        })
+        if self.has('locations'):
+            df['Location'] = self.row_lists('locations')
+        if include_assignments and self.has('assignments'):
+            df['Roles'] = self.row_lists('assignments')
+        return df
+
+
+def is_incidence_store(path) -> bool:
+    return (Path(path) / "meta.json").exists()
+
+
+def load_incidence(store_path=DEFAULT_STORE_PATH, mmap: bool = True) -> IncidenceStore:
+    return IncidenceStore(store_path, mmap=mmap)
+
+
+def store_mirrors_csv(store_path, csv_path) -> bool:
+    """
+    Whether a store holds the same data as a split_roles CSV.
+
+    True when the store recorded this CSV (save_incidence / patch_incidence
+    with csv_path) and the CSV has not changed since (same size and mtime).
+    For stores that recorded no CSV, true when the store is not older than
+    the CSV.
+    """
+    store_path, csv_path = Path(store_path), Path(csv_path)
+    meta = _read_meta(store_path)
+    if meta is None or not csv_path.exists():
+        return False
+    if 'csv' in meta:
+        recorded = meta['csv']
+        return ((store_path / recorded['path']).resolve() == csv_path.resolve()
+                and {'size': recorded['size'], 'mtime_ns': recorded['mtime_ns']} == csv_stamp(csv_path))
+    return (store_path / "meta.json").stat().st_mtime_ns >= csv_path.stat().st_mtime_ns
+
+
+def load_split_roles(path, store_path=None) -> pd.DataFrame:
+    """
+    Load split roles with 'Rol' (and 'Location') as lists.
+
+    Args:
+        path: Incidence store folder, or a split_roles CSV (legacy). For a
+              CSV path, a store with the same stem next to it
+              (e.g. split_roles/ for split_roles.csv) is used only when it
+              mirrors the current CSV (see store_mirrors_csv); a CSV
+              regenerated after the store is read as is.
+        store_path: Explicit incidence store to read instead of path
+
+    Returns:
+        split_roles DataFrame
+    """
+    if store_path is not None:
+        return load_incidence(store_path).to_split_df()
+    path = Path(path)
+    if is_incidence_store(path):
+        return load_incidence(path).to_split_df()
+    sibling = path.with_suffix('')
+    if path.suffix == '.csv' and is_incidence_store(sibling) and store_mirrors_csv(sibling, path):
+        return load_incidence(sibling).to_split_df()
+
+    df = pd.read_csv(path)
+    df['Rol'] = df['Rol'].apply(parse_list)
+    if 'Location' in df.columns:
+        df['Location'] = df['Location'].apply(parse_list)
+    return df
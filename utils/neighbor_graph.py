@@ -0,0 +1,162 @@
+"""
+Sparse top-k neighbor graph of the users.
+
+RoleRecommender only reads, for each user, the similarities above the
+threshold (and at most n_top of them). Instead of the dense n x n similarity
+DataFrame, the cosine similarities are computed one row block at a time and
+only the top k neighbors (and/or those above the threshold) of each user are
+kept in a CSR adjacency: memory is O(n * k) plus one block_size x n work
+block per worker, instead of O(n^2).
+
+Blocks are processed in a thread pool: the block matmul runs in BLAS, which
+releases the GIL, so n_jobs blocks are computed in parallel without copying
+the embeddings to other processes. threshold_similarity_join keeps every
+pair above the threshold (the same pairs as the dense similarity matrix).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+GRAPH_BLOCK_SIZE = 1024
+DEFAULT_N_JOBS = min(8, os.cpu_count() or 1)
+
+
+class NeighborGraph:
+    """
+    CSR user x user similarity graph (self-similarities excluded).
+
+    Attributes:
+        adjacency (sparse.csr_matrix): Similarity of each kept (user, neighbor) pair
+        index (pd.Index): Usuario of each row/column
+    """
+
+    def __init__(self, adjacency, index):
+        self.adjacency = sparse.csr_matrix(adjacency)
+        self.index = pd.Index(index, name='Usuario')
+
+    @property
+    def shape(self):
+        return self.adjacency.shape
+
+    @property
+    def nnz(self) -> int:
+        return self.adjacency.nnz
+
+    def __contains__(self, user) -> bool:
+        return user in self.index
+
+    def neighbors(self, user, threshold: Optional[float] = None) -> List[Tuple[str, float]]:
+        """(neighbor, similarity) pairs of a user, by decreasing similarity."""
+        position = self.index.get_indexer([user])[0]
+        if position < 0:
+            return []
+        start, stop = self.adjacency.indptr[position], self.adjacency.indptr[position + 1]
+        columns = self.adjacency.indices[start:stop]
+        similarities = self.adjacency.data[start:stop]
+        if threshold is not None:
+            keep = similarities >= threshold
+            columns, similarities = columns[keep], similarities[keep]
+        order = np.argsort(-similarities, kind='stable')
+        return list(zip(self.index[columns[order]], similarities[order].astype(np.float64)))
+
+    def to_frame(self) -> pd.DataFrame:
+        """Edge list (Usuario, Neighbor, Similarity)."""
+        coo = self.adjacency.tocoo()
+        return pd.DataFrame({
+            'Usuario': self.index[coo.row],
+            'Neighbor': self.index[coo.col],
+            'Similarity': coo.data,
+        })
+
+
+def _graph_block(sim: np.ndarray, start: int, k: Optional[int], threshold: Optional[float], dtype):
+    """Kept neighbors of the rows of a similarity block starting at row start: (columns, similarities, neighbors per row)."""
+    n = sim.shape[1]
+    rows = np.arange(sim.shape[0])
+    sim[rows, rows + start] = -np.inf
+    if k is not None and k < n - 1:
+        columns = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+        values = np.take_along_axis(sim, columns, axis=1)
+    else:
+        columns = np.broadcast_to(np.arange(n), sim.shape)
+        values = sim
+    keep = values >= threshold if threshold is not None else np.isfinite(values)
+    return columns[keep], values[keep].astype(dtype, copy=False), keep.sum(axis=1)
+
+
+def graph_from_blocks(similarity_block: Callable[[int, int], np.ndarray], index, k: Optional[int] = None,
+                      threshold: Optional[float] = None, block_size: int = GRAPH_BLOCK_SIZE, dtype=np.float64,
+                      n_jobs: int = 1) -> NeighborGraph:
+    """
+    Neighbor graph from a function returning the (stop - start) x n similarity block of rows start:stop.
+
+    Used by build_neighbor_graph (cosine) and by the binary metrics of
+    utils.similarity_metrics; see build_neighbor_graph for the parameters.
+    """
+    if k is None and threshold is None:
+        raise ValueError("build_neighbor_graph needs k and/or threshold")
+    n = len(index)
+    dtype = np.dtype(dtype)
+    if dtype == np.float16:
+        # scipy.sparse has no float16: the kept similarities are stored in float32
+        dtype = np.dtype(np.float32)
+    bounds = [(start, min(start + block_size, n)) for start in range(0, n, block_size)]
+
+    def compute(bound):
+        return _graph_block(similarity_block(*bound), bound[0], k, threshold, dtype)
+
+    if n_jobs > 1 and len(bounds) > 1:
+        # map keeps the block order; at most n_jobs blocks are in flight
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            blocks = list(executor.map(compute, bounds))
+    else:
+        blocks = [compute(bound) for bound in bounds]
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    if blocks:
+        np.cumsum(np.concatenate([counts for _, _, counts in blocks]), out=indptr[1:])
+    adjacency = sparse.csr_matrix(
+        (np.concatenate([values for _, values, _ in blocks]) if blocks else np.zeros(0, dtype=dtype),
+         np.concatenate([columns for columns, _, _ in blocks]) if blocks else np.zeros(0, dtype=np.int64),
+         indptr),
+        shape=(n, n),
+    )
+    return NeighborGraph(adjacency, index)
+
+
+def build_neighbor_graph(emb_df: pd.DataFrame, k: Optional[int] = None, threshold: Optional[float] = None,
+                         block_size: int = GRAPH_BLOCK_SIZE, dtype=None, n_jobs: int = 1) -> NeighborGraph:
+    """
+    Cosine neighbor graph of the rows of emb_df.
+
+    Args:
+        emb_df: Embeddings indexed by Usuario
+        k: Keep at most the k most similar users of each user
+        threshold: Keep only similarities >= threshold
+        block_size: Rows per similarity block (peak work memory is
+            n_jobs * block_size * n similarities)
+        dtype: dtype of the stored similarities (default: the embedding dtype;
+            float16 is stored as float32)
+        n_jobs: Blocks computed in parallel (threads)
+
+    Returns:
+        NeighborGraph with at most k neighbors per user
+    """
+    Z = normalize(emb_df.to_numpy())
+    return graph_from_blocks(lambda start, stop: Z[start:stop] @ Z.T, emb_df.index, k=k, threshold=threshold,
+                             block_size=block_size, dtype=dtype or Z.dtype, n_jobs=n_jobs)
+
+
+def threshold_similarity_join(emb_df: pd.DataFrame, threshold: float, block_size: int = GRAPH_BLOCK_SIZE,
+                              dtype=None, n_jobs: int = DEFAULT_N_JOBS) -> NeighborGraph:
+    """
+    Every pair of users with cosine similarity >= threshold, computed in
+    parallel row blocks (no n x n matrix is built).
+    """
+    return build_neighbor_graph(emb_df, threshold=threshold, block_size=block_size, dtype=dtype, n_jobs=n_jobs)
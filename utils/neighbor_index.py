@@ -0,0 +1,289 @@
+"""
+Nearest-neighbor indexes over user embeddings (cosine similarity).
+
+A NeighborIndex is built once from the embeddings (e.g. the compute_kpca
+output) and answers "most similar users" queries by user id or by vector,
+one at a time or in batches, without the n x n similarity matrix:
+
+- BruteForceIndex ('exact'): exact search, one matrix product per query block
+- RandomProjectionForest ('rp_forest'): approximate search; each tree splits
+  the users recursively by random hyperplanes down to leaves of at most
+  leaf_size users. A query only re-ranks the users in its leaf of each tree,
+  O(n_trees * (depth + leaf_size)) instead of O(n).
+
+Indexes are saved and loaded with joblib; recall_at_k measures an
+approximate index against the exact one.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+
+DEFAULT_N_NEIGHBORS = 50
+QUERY_BLOCK_SIZE = 1024
+
+
+class NeighborIndex:
+    """
+    Base class: normalized embeddings plus the search of a backend.
+
+    Attributes:
+        index (pd.Index): Usuario of each embedding row
+        vectors (np.ndarray): L2-normalized embeddings
+        n_neighbors (int): Default k of the queries
+    """
+
+    backend = None
+
+    def __init__(self, n_neighbors: int = DEFAULT_N_NEIGHBORS):
+        self.n_neighbors = n_neighbors
+        self.index = None
+        self.vectors = None
+
+    def build(self, emb_df: pd.DataFrame) -> "NeighborIndex":
+        self.index = pd.Index(emb_df.index, name='Usuario')
+        self.vectors = normalize(emb_df.to_numpy())
+        self._build()
+        return self
+
+    def _build(self):
+        pass
+
+    def _search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (positions, similarities) of normalized queries, by decreasing similarity."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        return 0 if self.index is None else len(self.index)
+
+    def __contains__(self, user) -> bool:
+        return self.index is not None and user in self.index
+
+    def search_vectors(self, vectors, k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Batch query by vectors.
+
+        Returns:
+            (positions, similarities), both (n_queries, k); missing neighbors have position -1
+        """
+        k = min(k or self.n_neighbors, len(self))
+        queries = normalize(np.atleast_2d(np.asarray(vectors, dtype=self.vectors.dtype)))
+        return self._search(queries, k)
+
+    def query(self, user=None, vector=None, k: Optional[int] = None,
+              threshold: Optional[float] = None) -> List[Tuple[str, float]]:
+        """
+        Most similar users of a user id (the user itself excluded) or of a vector.
+
+        Returns:
+            List of (Usuario, similarity) by decreasing similarity
+        """
+        return self.query_batch([user] if vector is None else None,
+                                None if vector is None else [vector], k, threshold)[0]
+
+    def query_batch(self, users: Optional[Sequence] = None, vectors=None, k: Optional[int] = None,
+                    threshold: Optional[float] = None) -> List[List[Tuple[str, float]]]:
+        """Batch version of query (users unknown to the index get an empty list)."""
+        k = k or self.n_neighbors
+        if users is not None:
+            positions = self.index.get_indexer(list(users))
+            rows = np.flatnonzero(positions >= 0)
+            results = [[] for _ in positions]
+            if not len(rows):
+                return results
+            # One extra neighbor, the user itself is removed afterwards
+            found, similarities = self.search_vectors(self.vectors[positions[rows]], k + 1)
+            for row, cols, sims in zip(rows, found, similarities):
+                keep = (cols >= 0) & (cols != positions[row])
+                results[row] = self._pairs(cols[keep][:k], sims[keep][:k], threshold)
+            return results
+        found, similarities = self.search_vectors(vectors, k)
+        return [self._pairs(cols[cols >= 0], sims[cols >= 0], threshold) for cols, sims in zip(found, similarities)]
+
+    def _pairs(self, cols, sims, threshold) -> List[Tuple[str, float]]:
+        if threshold is not None:
+            keep = sims >= threshold
+            cols, sims = cols[keep], sims[keep]
+        return list(zip(self.index[cols], np.asarray(sims, dtype=np.float64)))
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(self, path)
+        return path
+
+    @staticmethod
+    def load(path) -> "NeighborIndex":
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Neighbor index not found: {path}")
+        return joblib.load(path)
+
+
+def _top_k(similarities: np.ndarray, k: int, candidates: Optional[np.ndarray] = None):
+    """Top-k of each row by decreasing similarity (positions from candidates if given)."""
+    if k < similarities.shape[1]:
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(similarities.shape[1]), similarities.shape)
+    values = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    top, values = np.take_along_axis(top, order, axis=1), np.take_along_axis(values, order, axis=1)
+    return (top if candidates is None else candidates[top]), values
+
+
+class BruteForceIndex(NeighborIndex):
+    """Exact search: similarities against every user, one query block at a time."""
+
+    backend = 'exact'
+
+    def __init__(self, n_neighbors: int = DEFAULT_N_NEIGHBORS, block_size: int = QUERY_BLOCK_SIZE):
+        super().__init__(n_neighbors)
+        self.block_size = block_size
+
+    def _search(self, queries, k):
+        positions, similarities = [], []
+        for start in range(0, len(queries), self.block_size):
+            block = queries[start:start + self.block_size] @ self.vectors.T
+            top, values = _top_k(block, k)
+            positions.append(top)
+            similarities.append(values)
+        return np.vstack(positions), np.vstack(similarities)
+
+
+class RandomProjectionForest(NeighborIndex):
+    """
+    Approximate search with a forest of random-projection trees.
+
+    Each internal node splits its users by the hyperplane orthogonal to the
+    difference of two random users, at the median projection. More trees
+    (n_trees) and bigger leaves (leaf_size) raise recall and query cost.
+    """
+
+    backend = 'rp_forest'
+
+    def __init__(self, n_neighbors: int = DEFAULT_N_NEIGHBORS, n_trees: int = 10, leaf_size: int = 64,
+                 random_state: Optional[int] = 42):
+        super().__init__(n_neighbors)
+        self.n_trees = n_trees
+        self.leaf_size = leaf_size
+        self.random_state = random_state
+        self.trees: List[Dict[str, np.ndarray]] = []
+
+    def _build(self):
+        rng = np.random.default_rng(self.random_state)
+        self.trees = [self._build_tree(rng) for _ in range(self.n_trees)]
+
+    def _build_tree(self, rng) -> Dict[str, np.ndarray]:
+        normals, offsets, children, leaves = [], [], [], []
+        # (node id, positions); node arrays are filled when the node is popped
+        stack = [(0, np.arange(len(self.vectors)))]
+        n_nodes = 1
+        nodes = {}
+        while stack:
+            node, positions = stack.pop()
+            split = None
+            # A few attempts: two identical users (or many equal projections) give no split
+            for _ in range(3 if len(positions) > self.leaf_size else 0):
+                a, b = rng.choice(positions, 2, replace=False)
+                normal = self.vectors[a] - self.vectors[b]
+                projections = self.vectors[positions] @ normal
+                offset = np.median(projections)
+                right = projections > offset
+                if 0 < right.sum() < len(positions):
+                    split = (normal, offset, positions[~right], positions[right])
+                    break
+            if split is None:
+                nodes[node] = (None, 0.0, (-1, -1), positions)
+                continue
+            normal, offset, left_positions, right_positions = split
+            left_id, right_id = n_nodes, n_nodes + 1
+            n_nodes += 2
+            nodes[node] = (normal, offset, (left_id, right_id), None)
+            stack += [(left_id, left_positions), (right_id, right_positions)]
+
+        dim = self.vectors.shape[1]
+        for node in range(n_nodes):
+            normal, offset, child, positions = nodes[node]
+            normals.append(np.zeros(dim, dtype=self.vectors.dtype) if normal is None else normal)
+            offsets.append(offset)
+            children.append(child)
+            leaves.append(positions)
+        return {
+            'normals': np.vstack(normals),
+            'offsets': np.asarray(offsets),
+            'children': np.asarray(children, dtype=np.int64),
+            'leaves': leaves,
+        }
+
+    def _leaves(self, tree, queries) -> np.ndarray:
+        """Leaf node of each query, descending all queries level by level."""
+        nodes = np.zeros(len(queries), dtype=np.int64)
+        active = tree['children'][nodes, 0] >= 0
+        while active.any():
+            rows = np.flatnonzero(active)
+            current = nodes[rows]
+            side = np.einsum('ij,ij->i', queries[rows], tree['normals'][current]) > tree['offsets'][current]
+            nodes[rows] = tree['children'][current, side.astype(np.int64)]
+            active[rows] = tree['children'][nodes[rows], 0] >= 0
+        return nodes
+
+    def _search(self, queries, k):
+        leaves = [self._leaves(tree, queries) for tree in self.trees]
+        positions = np.full((len(queries), k), -1, dtype=np.int64)
+        similarities = np.full((len(queries), k), -np.inf)
+        for row, query in enumerate(queries):
+            candidates = np.unique(np.concatenate([
+                tree['leaves'][leaf[row]] for tree, leaf in zip(self.trees, leaves)
+            ]))
+            top, values = _top_k((self.vectors[candidates] @ query)[None, :], min(k, len(candidates)), candidates)
+            positions[row, :top.shape[1]] = top[0]
+            similarities[row, :top.shape[1]] = values[0]
+        return positions, similarities
+
+
+NEIGHBOR_INDEX_BACKENDS = {
+    BruteForceIndex.backend: BruteForceIndex,
+    RandomProjectionForest.backend: RandomProjectionForest,
+}
+
+
+def build_neighbor_index(emb_df: pd.DataFrame, backend: str = 'exact', **params) -> NeighborIndex:
+    """
+    Build a neighbor index over the embeddings.
+
+    Args:
+        emb_df: Embeddings indexed by Usuario
+        backend: 'exact' or 'rp_forest'
+        params: Backend parameters (n_neighbors, n_trees, leaf_size, ...)
+    """
+    if backend not in NEIGHBOR_INDEX_BACKENDS:
+        raise ValueError(f"Unknown neighbor index: {backend}. Options: {list(NEIGHBOR_INDEX_BACKENDS)}")
+    return NEIGHBOR_INDEX_BACKENDS[backend](**params).build(emb_df)
+
+
+def recall_at_k(index: NeighborIndex, reference: Optional[NeighborIndex] = None, k: int = 10,
+                users: Optional[Sequence] = None, sample: int = 1000, random_state: int = 0) -> float:
+    """
+    Share of the exact top-k neighbors that the index returns.
+
+    Args:
+        index: Index to evaluate
+        reference: Exact index over the same embeddings (built if None)
+        k: Neighbors per query
+        users: Query users (default: a random sample of sample users)
+    """
+    if reference is None:
+        reference = BruteForceIndex(n_neighbors=k)
+        reference.index, reference.vectors = index.index, index.vectors
+    if users is None:
+        rng = np.random.default_rng(random_state)
+        users = index.index[rng.choice(len(index), min(sample, len(index)), replace=False)]
+    exact = reference.query_batch(users, k=k)
+    approx = index.query_batch(users, k=k)
+    hits = sum(len({u for u, _ in e} & {u for u, _ in a}) for e, a in zip(exact, approx))
+    total = sum(len(e) for e in exact)
+    return hits / total if total else 1.0
@@ -1,15 +1,297 @@
+"""
+Month-partitioned store for the Resumen_Relaciones assignment history.
+
+The history (Usuario, Rol, Fecha) is stored as one Parquet folder per month:
+
+    data/processed/resumen/
+        Mes=2025-01/part-<id>.parquet
+        Mes=2025-02/part-<id>.parquet
+        ...
+
+read_resumen pushes the date filters down to the partitions: only the
+folders of the months that can match are opened, and rows are filtered
+only inside the boundary month. Appending a new month writes a new folder
+and never rewrites the existing ones.
+
+Run as a script to (re)build the store and the legacy resumen_2025.csv from
+the Resumen_Relaciones workbook. build_store records the size and mtime of
+the CSV it wrote (source.json), so read_resumen only reads a CSV through the
+store while the CSV is unchanged.
+"""
+
+import json
+import os
+import shutil
+import sys
+import uuid
+from pathlib import Path
+from typing import Optional
+
 import pandas as pd
 
-# Leer el archivo Excel
-df = pd.read_excel('data/Resumen_Relaciones_0509.xlsx')
-print("Despues del read_excel")
-# Quedarse solo con las columnas necesarias
-df = df[['Usuario', 'Rol', 'Fecha']]
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.snapshot_cache import PARQUET_AVAILABLE
+from utils.schema import enforce_schema
+
+RESUMEN_COLUMNS = ['Usuario', 'Rol', 'Fecha']
+RESUMEN_STORE_PATH = "data/processed/resumen"
+RESUMEN_CSV_PATH = "data/processed/resumen_2025.csv"
+PARTITION_KEY = "Mes"
+MONTH_FORMAT = "%Y-%m"
+SOURCE_FILE = "source.json"
+
+
+def _partition_dir(store_path: Path, month: pd.Period) -> Path:
+    return store_path / f"{PARTITION_KEY}={month.strftime(MONTH_FORMAT)}"
+
+
+def list_partitions(store_path=RESUMEN_STORE_PATH) -> dict:
+    """
+    Months present in the store.
+
+    Returns:
+        Dict month (pd.Period) -> partition folder, sorted by month
+    """
+    store_path = Path(store_path)
+    partitions = {}
+    if not store_path.exists():
+        return partitions
+    for folder in store_path.glob(f"{PARTITION_KEY}=*"):
+        if folder.is_dir():
+            partitions[pd.Period(folder.name.split("=", 1)[1], freq="M")] = folder
+    return dict(sorted(partitions.items()))
+
+
+def is_resumen_store(path) -> bool:
+    path = Path(path)
+    return path.is_dir() and bool(list_partitions(path))
+
+
+def write_resumen(df: pd.DataFrame, store_path=RESUMEN_STORE_PATH, mode: str = "append") -> list:
+    """
+    Write assignment rows into their month partitions.
+
+    Args:
+        df: DataFrame with Usuario, Rol and Fecha
+        store_path: Store folder (created on demand)
+        mode: 'append' adds a new part file to each month, 'overwrite'
+              replaces the months present in df (other months are untouched)
+
+    Returns:
+        List of the months written (pd.Period)
+
+    Raises:
+        ValueError: If columns are missing or mode is unknown
+        ImportError: If no Parquet engine is installed
+    """
+    if not PARQUET_AVAILABLE:
+        raise ImportError("pyarrow is required to write the resumen store")
+    if mode not in ("append", "overwrite"):
+        raise ValueError(f"Unknown mode: {mode}")
+    missing_columns = [col for col in RESUMEN_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing columns in resumen data: {missing_columns}")
+
+    store_path = Path(store_path)
+    df = df[RESUMEN_COLUMNS].copy()
+    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    df = df.dropna(subset=['Fecha'])
+
+    written = []
+    for month, rows in df.groupby(df['Fecha'].dt.to_period("M"), sort=True):
+        folder = _partition_dir(store_path, month)
+        if mode == "overwrite" and folder.exists():
+            shutil.rmtree(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        part = folder / f"part-{uuid.uuid4().hex}.parquet"
+        tmp_part = part.with_suffix(".tmp")
+        rows.to_parquet(tmp_part, index=False)
+        tmp_part.replace(part)
+        written.append(month)
+    return written
+
+
+def _read_partitions(folders, columns) -> pd.DataFrame:
+    files = [f for folder in folders for f in sorted(folder.glob("*.parquet"))]
+    if not files:
+        return pd.DataFrame(columns=columns)
+    return pd.concat([pd.read_parquet(f, columns=columns) for f in files], ignore_index=True)
+
+
+def _file_stamp(path: Path) -> dict:
+    stat = path.stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _record_source(store_path: Path, csv_path: Path, months):
+    """Remember the CSV written together with the store and its months (see store_mirrors_csv)."""
+    tmp_path = store_path / (SOURCE_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({'csv': os.path.relpath(csv_path, store_path), **_file_stamp(csv_path),
+                   'months': sorted(month.strftime(MONTH_FORMAT) for month in months)}, f)
+    os.replace(tmp_path, store_path / SOURCE_FILE)
+
+
+def _source_months(store_path: Path) -> Optional[set]:
+    """Months of the CSV recorded with the store (None without a record)."""
+    source_path = store_path / SOURCE_FILE
+    if not source_path.exists():
+        return None
+    with open(source_path, "r", encoding="utf-8") as f:
+        months = json.load(f).get('months')
+    return None if months is None else {pd.Period(month, freq="M") for month in months}
+
+
+def store_mirrors_csv(store_path, csv_path) -> bool:
+    """
+    Whether a store can be read in place of a resumen CSV.
+
+    True when build_store wrote this CSV together with the store and the CSV
+    has not changed since (same size and mtime); read_resumen then reads
+    only the months written with the CSV (the store may keep other months).
+    For stores without that record, true when no CSV row can be newer than
+    the store: every partition file is at least as recent as the CSV.
+    """
+    store_path, csv_path = Path(store_path), Path(csv_path)
+    if not csv_path.exists():
+        return True
+    source_path = store_path / SOURCE_FILE
+    if source_path.exists():
+        with open(source_path, "r", encoding="utf-8") as f:
+            source = json.load(f)
+        return ((store_path / source['csv']).resolve() == csv_path.resolve()
+                and {'size': source['size'], 'mtime_ns': source['mtime_ns']} == _file_stamp(csv_path))
+    parts = [f for folder in list_partitions(store_path).values() for f in folder.glob("*.parquet")]
+    return bool(parts) and min(f.stat().st_mtime_ns for f in parts) >= csv_path.stat().st_mtime_ns
+
+
+def _resolve_store(path) -> Optional[Path]:
+    """
+    Store for a path: the path itself, or a store next to a resumen CSV that
+    mirrors it (a CSV regenerated after the store is read as is).
+    """
+    path = Path(path)
+    if is_resumen_store(path):
+        return path
+    if path.suffix == ".csv":
+        for candidate in (path.with_suffix(''), path.parent / Path(RESUMEN_STORE_PATH).name):
+            if is_resumen_store(candidate) and store_mirrors_csv(candidate, path):
+                return candidate
+    return None
+
+
+def read_resumen(path=RESUMEN_STORE_PATH,
+                 fecha_min=None,
+                 fecha_max=None,
+                 inclusive: bool = True,
+                 columns=None,
+                 store_path=None) -> pd.DataFrame:
+    """
+    Read the assignment history keeping only rows in a date range.
+
+    With a store, only the partitions of the months overlapping the range
+    are read. A CSV path (legacy) is read through the store next to it
+    (e.g. resumen/ beside resumen_2025.csv) only when that store mirrors the
+    current CSV (see store_mirrors_csv), limited to the months written with
+    that CSV; otherwise the CSV is read and filtered in memory.
+
+    Args:
+        path: Store folder or resumen CSV
+        fecha_min: Lower bound of Fecha (None: no bound)
+        fecha_max: Upper bound of Fecha, always inclusive (None: no bound)
+        inclusive: Keep rows with Fecha == fecha_min (>=) or not (>)
+        columns: Columns to read (default: Usuario, Rol, Fecha)
+        store_path: Explicit store to read instead of path
+
+    Returns:
+        Resumen DataFrame (utils.schema 'resumen': categorical Usuario/Rol,
+        datetime Fecha, rows without Usuario/Rol rejected; rows without a
+        valid Fecha are rejected only when fecha_min or fecha_max is given)
+    """
+    columns = list(columns or RESUMEN_COLUMNS)
+    if 'Fecha' not in columns:
+        columns.append('Fecha')
+    start = pd.to_datetime(fecha_min) if fecha_min is not None else None
+    end = pd.to_datetime(fecha_max) if fecha_max is not None else None
+
+    from_csv = store_path is None and Path(path).suffix == ".csv"
+    store_path = Path(store_path) if store_path is not None else _resolve_store(path)
+    if store_path is not None:
+        # A store read in place of a CSV only serves the months written with that CSV
+        months = _source_months(store_path) if from_csv else None
+        folders = [
+            folder for month, folder in list_partitions(store_path).items()
+            if (start is None or month.end_time >= start) and (end is None or month.start_time <= end)
+            and (months is None or month in months)
+        ]
+        df = _read_partitions(folders, columns)
+    else:
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Resumen file not found: {path}")
+        df = pd.read_csv(path, usecols=lambda col: col in columns)
+
+    if 'Fecha' not in df.columns:
+        return df.reset_index(drop=True)
+    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    if start is not None:
+        df = df[df['Fecha'] >= start] if inclusive else df[df['Fecha'] > start]
+    if end is not None:
+        df = df[df['Fecha'] <= end]
+    # Fecha is only required to apply a date filter: without one, rows with a missing or
+    # unparseable Fecha are kept (NaT), as the CSV reader did
+    required = ['Usuario', 'Rol'] + (['Fecha'] if start is not None or end is not None else [])
+    df, _ = enforce_schema(df, "resumen", required=required)
+    return df.reset_index(drop=True)
+
+
+def build_store(xlsx_file, store_path=RESUMEN_STORE_PATH, csv_path=RESUMEN_CSV_PATH,
+                year: Optional[int] = 2025, chunk_size: Optional[int] = None):
+    """
+    Stream the Resumen_Relaciones workbook into the store (and the legacy CSV).
+
+    Months present in the workbook are replaced; other months in the store
+    are kept.
+
+    Args:
+        xlsx_file: Resumen_Relaciones workbook
+        store_path: Store folder
+        csv_path: Legacy CSV with the same rows (None to skip it)
+        year: Keep only this year (None keeps every row)
+        chunk_size: Rows read from the workbook at a time
+    """
+    from utils.conver_xlsx_to_csv import CHUNK_SIZE, _iter_chunks
+
+    replaced = set()
+    rows = 0
+    csv_file = open(csv_path, "w", encoding="utf-8", newline="") if csv_path else None
+    try:
+        for chunk in _iter_chunks(Path(xlsx_file), chunk_size or CHUNK_SIZE):
+            df = chunk[RESUMEN_COLUMNS].copy()
+            df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+            if year is not None:
+                df = df[df['Fecha'].dt.year == year]
+            if df.empty:
+                continue
+
+            # First rows of a month replace its partition, later chunks append to it
+            months = set(df['Fecha'].dt.to_period("M"))
+            new_months = df['Fecha'].dt.to_period("M").isin(months - replaced)
+            if new_months.any():
+                write_resumen(df[new_months], store_path, mode="overwrite")
+            if (~new_months).any():
+                write_resumen(df[~new_months], store_path, mode="append")
+            replaced |= months
+
+            if csv_file is not None:
+                df.to_csv(csv_file, index=False, header=(rows == 0))
+            rows += len(df)
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+    if csv_path and Path(store_path).exists():
+        _record_source(Path(store_path), Path(csv_path), replaced)
+    print(f"Resumen: {rows} filas en {len(replaced)} meses -> {store_path}")
 
-# Convertir la columna Fecha a datetime (formato día,mes,año)
-# Filtrar solo los valores del año 2025
-df_2025 = df[df['Fecha'].dt.year == 2025]
-print("Despues del to_datetime")
 
-# Guardar el resultado en un CSV
-df_2025.to_csv('data/processed/resumen_2025.csv', index=False)
+if __name__ == "__main__":
+    build_store('data/Resumen_Relaciones_0509.xlsx')
@@ -0,0 +1,120 @@
+"""
+Schema layer applied when the extracts are loaded.
+
+Every frame entering the pipeline (USER_ADDR, AGR_USERS, merged users and
+the resumen history) is coerced once to compact dtypes: identifiers and
+labels become categorical and Fecha becomes datetime64, so later stages do
+not re-parse dates or carry object columns around.
+
+Rows that cannot satisfy the schema (missing Usuario/Rol, unparseable
+Fecha) are rejected and listed in a SchemaReport, together with the memory
+used by the frame before and after the coercion.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+CATEGORY = "category"
+DATETIME = "datetime64[ns]"
+
+# name -> (column dtypes, columns that may not be null)
+SCHEMAS: Dict[str, Tuple[Dict[str, str], List[str]]] = {
+    "user_addr": ({"Usuario": CATEGORY, "Departamento": CATEGORY, "Función": CATEGORY}, ["Usuario"]),
+    "agr_users": ({"Usuario": CATEGORY, "Rol": CATEGORY}, ["Usuario", "Rol"]),
+    "resumen": ({"Usuario": CATEGORY, "Rol": CATEGORY, "Fecha": DATETIME}, ["Usuario", "Rol", "Fecha"]),
+}
+# merge_df output: USER_ADDR columns plus the 'Roles' lists
+SCHEMAS["merged"] = SCHEMAS["user_addr"]
+
+REPORT_SAMPLE_ROWS = 5
+
+
+class SchemaReport:
+    """
+    Result of enforcing a schema on a frame.
+
+    Attributes:
+        name (str): Schema name
+        rows (int): Rows received
+        rejected (pd.DataFrame): Rejected rows with a 'Motivo' column
+        memory_before (int): Bytes used before the coercion (deep)
+        memory_after (int): Bytes used after the coercion (deep)
+    """
+
+    def __init__(self, name, rows, rejected, memory_before, memory_after):
+        self.name = name
+        self.rows = rows
+        self.rejected = rejected
+        self.memory_before = memory_before
+        self.memory_after = memory_after
+
+    def summary(self) -> str:
+        mb = 1024 ** 2
+        text = (f"[schema:{self.name}] filas {self.rows} | rechazadas {len(self.rejected)} | "
+                f"memoria {self.memory_before / mb:.1f} MB -> {self.memory_after / mb:.1f} MB")
+        if len(self.rejected):
+            counts = self.rejected['Motivo'].value_counts()
+            text += "\n" + "\n".join(f"  {reason}: {count}" for reason, count in counts.items())
+            text += "\n" + self.rejected.head(REPORT_SAMPLE_ROWS).to_string()
+        return text
+
+
+def _memory(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def enforce_schema(df: pd.DataFrame, name: str, verbose: bool = True,
+                   required: Optional[List[str]] = None) -> Tuple[pd.DataFrame, SchemaReport]:
+    """
+    Coerce a frame to one of SCHEMAS and drop the rows that do not fit.
+
+    Only the schema columns present in df are coerced; other columns (e.g.
+    'Roles' lists or the source file column) are kept as they are.
+
+    Args:
+        df: Frame to coerce
+        name: Schema name (key of SCHEMAS)
+        verbose: Print the report summary
+        required: Columns that may not be null or unparseable (default: those of the
+                  schema); other columns are coerced but their rows are kept
+
+    Returns:
+        (coerced DataFrame, SchemaReport)
+    """
+    dtypes, schema_required = SCHEMAS[name]
+    required = schema_required if required is None else required
+    memory_before = _memory(df)
+    df = df.copy()
+
+    reasons = pd.Series(None, index=df.index, dtype=object)
+    for col in required:
+        if col in df.columns:
+            reasons = reasons.mask(reasons.isna() & df[col].isna(), f"{col} vacío")
+
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if dtype == DATETIME:
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                parsed = pd.to_datetime(df[col], errors='coerce')
+                if col in required:
+                    invalid = parsed.isna() & df[col].notna()
+                    reasons = reasons.mask(reasons.isna() & invalid, f"{col} inválida")
+                df[col] = parsed
+        elif not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(CATEGORY)
+
+    bad = reasons.notna()
+    rejected = df[bad].assign(Motivo=reasons[bad])
+    if bad.any():
+        df = df[~bad]
+    # Categories of rejected (or filtered) rows are not kept
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.remove_unused_categories()
+
+    report = SchemaReport(name, len(bad), rejected, memory_before, _memory(df))
+    if verbose:
+        print(report.summary())
+    return df, report
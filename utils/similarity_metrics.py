@@ -0,0 +1,114 @@
+"""
+Binary similarity metrics between the multi-hot user features.
+
+'jaccard', 'dice' and 'jaccard_hamming' (Jaccard / Hamming, as
+main/similarity_implementations/j_h.py) only depend on the intersection
+counts |a & b| and the row sizes |a|, |b| of the binary feature rows. The
+intersections of a row block are one sparse product B[start:stop] B^T, so
+each metric costs O(nnz) per block instead of the O(n^2 * d) of a dense
+pdist or a per-pair loop. The metrics treat every non-zero feature as 1, so
+block weights do not change them.
+
+engine='bitpacked' computes the same block similarities with the popcount
+kernels of utils.bitpacked_similarity (faster when users have many roles).
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils.bitpacked_similarity import PackedRows
+from utils.neighbor_graph import GRAPH_BLOCK_SIZE, NeighborGraph, graph_from_blocks
+from utils.precision import SIMILARITY_BLOCK_SIZE
+from utils.sparse_features import BINARY_METRICS, SparseFeatures, binary_rows, overlap_similarity
+
+# Metrics accepted by SimilarityCalculator: cosine is computed on the embeddings,
+# the binary metrics on the features
+SIMILARITY_METRICS = ('cosine',) + BINARY_METRICS
+# Kernels of the binary metrics: sparse intersection counts or bit-packed popcounts
+BINARY_ENGINES = ('sparse', 'bitpacked')
+
+
+def resolve_metric(metric: str) -> str:
+    if metric not in SIMILARITY_METRICS:
+        raise ValueError(f"Unknown similarity metric: {metric}. Options: {list(SIMILARITY_METRICS)}")
+    return metric
+
+
+class BinaryOverlap:
+    """
+    Binary rows and row sizes of a feature matrix, with the similarity of any row block.
+
+    Attributes:
+        binary (sparse.csr_matrix): Features with non-zero entries set to 1
+        sizes (np.ndarray): Number of features of each row
+        index (pd.Index): Usuario of each row
+    """
+
+    def __init__(self, X, metric: str = 'jaccard'):
+        if metric not in BINARY_METRICS:
+            raise ValueError(f"Unknown binary metric: {metric}. Options: {list(BINARY_METRICS)}")
+        if isinstance(X, SparseFeatures):
+            matrix, index = X.matrix, X.index
+        elif isinstance(X, pd.DataFrame):
+            numeric = X.drop(columns=['Usuario'], errors='ignore').select_dtypes(include=[np.number])
+            matrix = sparse.csr_matrix(numeric.to_numpy())
+            index = pd.Index(X['Usuario'] if 'Usuario' in X.columns else X.index, name='Usuario')
+        else:
+            raise TypeError("X must be a SparseFeatures or a DataFrame")
+        self.metric = metric
+        self.binary = binary_rows(matrix)
+        self.binary_t = self.binary.T.tocsr()
+        self.sizes = np.asarray(self.binary.sum(axis=1)).ravel()
+        self.index = index
+
+    def __len__(self) -> int:
+        return self.binary.shape[0]
+
+    def block(self, start: int, stop: int) -> np.ndarray:
+        """Similarities of rows start:stop against every row ((stop - start) x n)."""
+        intersection = (self.binary[start:stop] @ self.binary_t).toarray()
+        return overlap_similarity(intersection, self.sizes[start:stop], self.sizes, self.metric)
+
+
+def binary_overlap(X, metric: str = 'jaccard', engine: str = 'sparse'):
+    """BinaryOverlap ('sparse') or PackedRows ('bitpacked') of X: both expose block(start, stop) and index."""
+    if engine == 'sparse':
+        return BinaryOverlap(X, metric)
+    if engine == 'bitpacked':
+        return PackedRows(X, metric)
+    raise ValueError(f"Unknown binary engine: {engine}. Options: {list(BINARY_ENGINES)}")
+
+
+def binary_similarity_frame(X, metric: str = 'jaccard', dtype=np.float64,
+                            block_size: int = SIMILARITY_BLOCK_SIZE, engine: str = 'sparse') -> pd.DataFrame:
+    """
+    Dense users x users similarity DataFrame of a binary metric, filled one row block at a time.
+
+    Args:
+        X: SparseFeatures or multi-hot DataFrame
+        metric: 'jaccard', 'dice' or 'jaccard_hamming'
+        dtype: dtype of the stored similarities
+        engine: 'sparse' or 'bitpacked'
+    """
+    overlap = binary_overlap(X, metric, engine)
+    n = len(overlap)
+    sim = np.empty((n, n), dtype=dtype)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        sim[start:stop] = overlap.block(start, stop)
+    return pd.DataFrame(sim, index=overlap.index, columns=overlap.index)
+
+
+def binary_similarity_graph(X, metric: str = 'jaccard', k: Optional[int] = None, threshold: Optional[float] = None,
+                            block_size: int = GRAPH_BLOCK_SIZE, dtype=np.float64, n_jobs: int = 1,
+                            engine: str = 'sparse') -> NeighborGraph:
+    """
+    Neighbor graph of a binary metric (top k and/or similarities >= threshold),
+    computed in parallel row blocks as build_neighbor_graph.
+    """
+    overlap = binary_overlap(X, metric, engine)
+    return graph_from_blocks(overlap.block, overlap.index, k=k, threshold=threshold,
+                             block_size=block_size, dtype=dtype, n_jobs=n_jobs)
@@ -0,0 +1,224 @@
+"""
+Columnar snapshot cache for the SAP extracts read by utils.utils.load_data.
+
+The first time an extract (USER_ADDR_IDAD3, AGR_USERS, ...) is loaded, the
+trimmed frame (only the columns the pipeline uses) is written to a Parquet
+snapshot with categorical dtypes. Later loads of the same file read only the
+needed columns from the snapshot and skip CSV/XLSX parsing entirely.
+
+Snapshots are content-addressed: the snapshot name is derived from the
+SHA-256 of the source file plus the requested columns. A small manifest
+keeps (path, size, mtime) -> hash so unchanged files are not re-hashed on
+every run; if size or mtime change the file is hashed again, and a file that
+was only touched (same content) still reuses its snapshot.
+"""
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (Parquet engine)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+
+# Bump when the snapshot layout changes so old snapshots are ignored
+CACHE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_content_hash(path: Path) -> str:
+    """
+    Compute the SHA-256 of a file reading it in fixed-size chunks.
+
+    Args:
+        path: File to hash
+
+    Returns:
+        Hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SnapshotCache:
+    """
+    Parquet snapshot store for trimmed and typed source extracts.
+
+    Attributes:
+        cache_dir (Path): Folder where snapshots and the manifest are stored
+        manifest (dict): resolved source path -> {size, mtime_ns, sha256}
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir (str or Path): Folder for the snapshots (created on demand)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.manifest = self._load_manifest()
+        # load_data may read several extracts in parallel threads
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Snapshots need a Parquet engine; without it the cache is a no-op."""
+        return PARQUET_AVAILABLE
+
+    def _manifest_path(self) -> Path:
+        return self.cache_dir / MANIFEST_NAME
+
+    def _load_manifest(self) -> dict:
+        path = self._manifest_path()
+        if not path.exists():
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (ValueError, OSError):
+            # A corrupt manifest only costs a re-hash of the sources
+            return {}
+
+    def _save_manifest(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._manifest_path().with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        tmp_path.replace(self._manifest_path())
+
+    def fingerprint(self, source_path: Path) -> str:
+        """
+        Return the content hash of a source file, reusing the manifest entry
+        when path, size and mtime are unchanged.
+
+        Args:
+            source_path: Source extract
+
+        Returns:
+            SHA-256 hex digest of the file content
+        """
+        source_path = Path(source_path).resolve()
+        stat = source_path.stat()
+        key = str(source_path)
+        entry = self.manifest.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+
+        sha256 = file_content_hash(source_path)
+        with self._lock:
+            self.manifest[key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+            }
+            self._save_manifest()
+        return sha256
+
+    def snapshot_path(self, source_path: Path, columns: List[str]) -> Path:
+        """
+        Path of the snapshot for a source file and a set of columns.
+
+        Args:
+            source_path: Source extract
+            columns: Columns kept in the snapshot
+
+        Returns:
+            Path to the Parquet snapshot (may not exist yet)
+        """
+        sha256 = self.fingerprint(source_path)
+        key = hashlib.sha256(
+            json.dumps([CACHE_VERSION, sha256, list(columns)]).encode("utf-8")
+        ).hexdigest()[:24]
+        return self.cache_dir / f"{Path(source_path).stem}_{key}.parquet"
+
+    def load(self, source_path: Path, columns: List[str]) -> Optional[pd.DataFrame]:
+        """
+        Read a snapshot if one exists for the current content of source_path.
+
+        Args:
+            source_path: Source extract
+            columns: Columns to read
+
+        Returns:
+            DataFrame with the requested columns or None on a cache miss
+        """
+        if not self.enabled:
+            return None
+        path = self.snapshot_path(source_path, columns)
+        if not path.exists():
+            return None
+        try:
+            return pd.read_parquet(path, columns=list(columns))
+        except Exception as e:
+            print(f"Ignoring unreadable snapshot {path.name}: {str(e)}")
+            return None
+
+    def save(self, df: pd.DataFrame, source_path: Path, columns: List[str]) -> Optional[Path]:
+        """
+        Write the trimmed frame as a Parquet snapshot with categorical columns.
+
+        Args:
+            df: Trimmed DataFrame (only `columns`)
+            source_path: Source extract the frame was read from
+            columns: Columns kept in the snapshot
+
+        Returns:
+            Path of the written snapshot, or None if the cache is disabled
+        """
+        if not self.enabled:
+            return None
+        path = self.snapshot_path(source_path, columns)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        to_categorical(df[list(columns)]).to_parquet(tmp_path, index=False)
+        tmp_path.replace(path)
+        return path
+
+    def read(self, source_path: Path, columns: List[str],
+             reader: Callable[[Path], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Load a source extract through the cache.
+
+        Args:
+            source_path: Source extract
+            columns: Columns the caller needs
+            reader: Function that parses the source file on a cache miss
+
+        Returns:
+            DataFrame with at least `columns` (categorical on a cache hit)
+        """
+        cached = self.load(source_path, columns)
+        if cached is not None:
+            print(f"Loaded snapshot for {Path(source_path).name}")
+            return cached
+
+        df = reader(source_path)
+        missing_columns = [col for col in columns if col not in df.columns]
+        if missing_columns:
+            # Let the caller report the missing columns, nothing is cached
+            return df
+
+        df = to_categorical(df[list(columns)])
+        self.save(df, source_path, columns)
+        return df
+
+
+def to_categorical(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert text columns to categorical; numeric/date columns are kept."""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype):
+            df[col] = df[col].astype("category")
+    return df
@@ -0,0 +1,340 @@
+"""
+Sparse user feature matrix.
+
+create_user_multihot_vectors(..., sparse=True) returns a SparseFeatures
+instead of a dense DataFrame: a CSR matrix (users x features) plus the user
+index, the column names and the columns of each block (departments,
+functions, roles). A block is a (start, stop) column range, or an array of
+column positions when its columns are not contiguous (features encoded with
+an extended FeatureVocabulary). Block weights are applied by scaling the
+stored values, so the matrix is never densified.
+
+KernelStats holds the statistics the kernel parameters need (variance, mean
+squared row norm, per-block densities). They are computed in one pass over
+the stored values, kept on the SparseFeatures (and therefore cached with it)
+and derived without a new pass when blocks are rescaled.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Block name -> column prefix (same names as the dense get_dummies output)
+BLOCK_PREFIXES = {
+    'department': 'Departamento_',
+    'function': 'Función_',
+    'roles': 'role_',
+}
+
+
+def block_positions(spec) -> np.ndarray:
+    """Column positions of a block given as a (start, stop) range or as an array of positions."""
+    if isinstance(spec, tuple):
+        return np.arange(*spec)
+    return np.asarray(spec, dtype=np.int64)
+
+
+def _block_totals(mask: np.ndarray, nnz: np.ndarray, sums: np.ndarray, sums_sq: np.ndarray) -> Dict[str, float]:
+    """KernelStats block entry from per-column totals of the columns in mask."""
+    return {'width': int(mask.sum()), 'nnz': int(nnz[mask].sum()),
+            'sum': float(sums[mask].sum()), 'sum_sq': float(sums_sq[mask].sum())}
+
+
+class KernelStats:
+    """
+    Entry statistics of a users x features matrix, per column block.
+
+    Attributes:
+        n_rows (int): Users
+        n_cols (int): Features
+        blocks (dict): Block name -> {'width', 'nnz', 'sum', 'sum_sq'} of its stored values
+    """
+
+    def __init__(self, n_rows: int, n_cols: int, blocks: Dict[str, Dict[str, float]]):
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.blocks = {name: dict(block) for name, block in blocks.items()}
+
+    @classmethod
+    def from_matrix(cls, matrix, blocks: Dict[str, Tuple[int, int]]) -> "KernelStats":
+        """
+        One pass over the stored values of a sparse or dense matrix.
+
+        Args:
+            matrix: Sparse or dense users x features matrix
+            blocks: Block name -> (start, stop) column range or column positions;
+                columns outside every block are counted in an 'other' block
+        """
+        n_rows, n_cols = matrix.shape
+        if sparse.issparse(matrix):
+            coo = sparse.coo_matrix(matrix)
+            cols, data = coo.col, coo.data.astype(np.float64)
+        else:
+            values = np.asarray(matrix, dtype=np.float64)
+            _, cols = np.nonzero(values)
+            data = values[values != 0]
+
+        names = list(blocks)
+        block_of_col = np.full(n_cols, len(names), dtype=np.int64)
+        for i, name in enumerate(names):
+            block_of_col[block_positions(blocks[name])] = i
+        widths = np.bincount(block_of_col, minlength=len(names) + 1)
+        block_ids = block_of_col[cols]
+        nnz = np.bincount(block_ids, minlength=len(names) + 1)
+        sums = np.bincount(block_ids, weights=data, minlength=len(names) + 1)
+        sums_sq = np.bincount(block_ids, weights=data ** 2, minlength=len(names) + 1)
+
+        if widths[-1] > 0:
+            names.append('other')
+        stats = {
+            name: {'width': int(widths[i]), 'nnz': int(nnz[i]), 'sum': float(sums[i]), 'sum_sq': float(sums_sq[i])}
+            for i, name in enumerate(names)
+        }
+        return cls(n_rows, n_cols, stats)
+
+    @classmethod
+    def from_frame(cls, X: pd.DataFrame) -> "KernelStats":
+        """
+        Statistics of a dense feature DataFrame; blocks are recognized by column prefix.
+
+        Computed from per-column sums of the values, without reordering or
+        masking a copy of the matrix.
+        """
+        values = X.to_numpy()
+        column_totals = (
+            np.count_nonzero(values, axis=0),
+            values.sum(axis=0, dtype=np.float64),
+            np.einsum('ij,ij->j', values, values, dtype=np.float64),
+        )
+        columns = pd.Index(X.columns).astype(str)
+        in_block = np.zeros(len(columns), dtype=bool)
+        stats = {}
+        for name, prefix in BLOCK_PREFIXES.items():
+            mask = np.asarray(columns.str.startswith(prefix))
+            in_block |= mask
+            stats[name] = _block_totals(mask, *column_totals)
+        if not in_block.all():
+            stats['other'] = _block_totals(~in_block, *column_totals)
+        return cls(values.shape[0], values.shape[1], stats)
+
+    def scaled(self, weights: Dict[str, float]) -> "KernelStats":
+        """Statistics after multiplying each block by its weight (no pass over the data)."""
+        blocks = {}
+        for name, block in self.blocks.items():
+            weight = float(weights.get(name, 1.0))
+            blocks[name] = {
+                'width': block['width'],
+                'nnz': block['nnz'] if weight != 0 else 0,
+                'sum': block['sum'] * weight,
+                'sum_sq': block['sum_sq'] * weight ** 2,
+            }
+        return KernelStats(self.n_rows, self.n_cols, blocks)
+
+    @property
+    def size(self) -> int:
+        return self.n_rows * self.n_cols
+
+    @property
+    def mean(self) -> float:
+        return sum(b['sum'] for b in self.blocks.values()) / self.size if self.size else 0.0
+
+    @property
+    def variance(self) -> float:
+        """Variance over every entry (zeros included), as X.values.var() of the dense matrix."""
+        if self.size == 0:
+            return 0.0
+        sum_sq = sum(b['sum_sq'] for b in self.blocks.values())
+        return float(max(sum_sq / self.size - self.mean ** 2, 0.0))
+
+    @property
+    def mean_squared_norm(self) -> float:
+        """Mean of ||x||^2 over the rows."""
+        if self.n_rows == 0:
+            return 0.0
+        return sum(b['sum_sq'] for b in self.blocks.values()) / self.n_rows
+
+    @property
+    def densities(self) -> Dict[str, float]:
+        """Block name -> share of non-zero entries."""
+        return {
+            name: b['nnz'] / (self.n_rows * b['width']) if self.n_rows * b['width'] else 0.0
+            for name, b in self.blocks.items()
+        }
+
+    def gamma(self, mode: str = 'scale') -> float:
+        """
+        RBF gamma as sklearn computes it: 'scale' -> 1 / (n_features * var),
+        'auto' -> 1 / n_features (1.0 for degenerate matrices).
+        """
+        if mode == 'scale':
+            var = self.variance
+            return 1.0 / (self.n_cols * var) if self.n_cols > 0 and var > 0 else 1.0
+        if mode == 'auto':
+            return 1.0 / self.n_cols if self.n_cols > 0 else 1.0
+        raise ValueError(f"Unknown gamma mode: {mode}")
+
+
+def kernel_stats(X) -> KernelStats:
+    """
+    KernelStats of a SparseFeatures (cached on it) or of a dense DataFrame.
+
+    Dense frames are not cached: pandas carries DataFrame.attrs through
+    arithmetic, so stats stored there would be reused for X * w.
+    """
+    if isinstance(X, SparseFeatures):
+        return X.stats()
+    return KernelStats.from_frame(X)
+
+
+class SparseFeatures:
+    """
+    CSR feature matrix with its user index and column-block metadata.
+
+    Attributes:
+        matrix (sparse.csr_matrix): users x features
+        index (pd.Index): Usuario of each row
+        columns (list): Feature names (same as the dense DataFrame columns)
+        blocks (dict): Block name -> (start, stop) column range or array of column positions
+    """
+
+    def __init__(self, matrix, index, columns: List[str], blocks: Dict):
+        self.matrix = sparse.csr_matrix(matrix)
+        self.index = pd.Index(index, name='Usuario')
+        self.columns = list(columns)
+        self.blocks = dict(blocks)
+        self._stats: Optional[KernelStats] = None
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def block(self, name: str) -> sparse.csr_matrix:
+        """Columns of one block."""
+        spec = self.blocks[name]
+        if isinstance(spec, tuple):
+            start, stop = spec
+            return self.matrix[:, start:stop]
+        return self.matrix[:, block_positions(spec)]
+
+    def block_columns(self, name: str) -> List[str]:
+        return [self.columns[i] for i in block_positions(self.blocks[name])]
+
+    def scale_blocks(self, weights: Dict[str, float], dtype=np.float64) -> "SparseFeatures":
+        """
+        Multiply each block by its weight.
+
+        Args:
+            weights: Block name -> weight (blocks not listed keep weight 1)
+            dtype: dtype of the scaled matrix (float64 or float32)
+
+        Returns:
+            New SparseFeatures; only the stored values are scaled
+        """
+        column_weights = np.ones(self.matrix.shape[1])
+        for name, weight in weights.items():
+            column_weights[block_positions(self.blocks[name])] = weight
+        matrix = self.matrix.astype(dtype, copy=True)
+        matrix.data *= column_weights[matrix.indices].astype(dtype, copy=False)
+        scaled = SparseFeatures(matrix, self.index, self.columns, self.blocks)
+        scaled._stats = self.stats().scaled(weights)
+        return scaled
+
+    def stats(self) -> KernelStats:
+        """KernelStats of the matrix, computed on first use and kept with the features."""
+        if getattr(self, '_stats', None) is None:
+            self._stats = KernelStats.from_matrix(self.matrix, self.blocks)
+        return self._stats
+
+    def variance(self) -> float:
+        """Variance over every entry (zeros included), as X.values.var() of the dense matrix."""
+        return self.stats().variance
+
+    def astype(self, dtype) -> "SparseFeatures":
+        """Same features with the matrix in dtype (no copy if it already is)."""
+        if self.matrix.dtype == dtype:
+            return self
+        features = SparseFeatures(self.matrix.astype(dtype), self.index, self.columns, self.blocks)
+        features._stats = getattr(self, '_stats', None)
+        return features
+
+    def to_frame(self) -> pd.DataFrame:
+        """Dense DataFrame (only for small matrices)."""
+        return pd.DataFrame(self.matrix.toarray(), index=self.index, columns=self.columns)
+
+
+def one_hot_block(values: pd.Series, prefix: str) -> Tuple[sparse.csr_matrix, List[str]]:
+    """
+    One-hot encode a single-valued column (like pd.get_dummies, missing -> empty row).
+
+    Returns:
+        (CSR matrix, column names)
+    """
+    categorical = pd.Categorical(values)
+    codes = np.asarray(categorical.codes)
+    rows = np.flatnonzero(codes >= 0)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, codes[rows])),
+        shape=(len(codes), len(categorical.categories)),
+    )
+    return matrix, [f"{prefix}{c}" for c in categorical.categories]
+
+
+# Similarities computed from the intersection counts of binary rows
+BINARY_METRICS = ('jaccard', 'dice', 'jaccard_hamming')
+
+
+def binary_rows(matrix) -> sparse.csr_matrix:
+    """CSR copy of a matrix with every non-zero entry set to 1 (float64)."""
+    binary = sparse.csr_matrix(matrix, copy=True)
+    binary.eliminate_zeros()
+    binary.data = np.ones_like(binary.data, dtype=np.float64)
+    return binary
+
+
+def overlap_similarity(intersection: np.ndarray, row_sizes: np.ndarray, col_sizes: np.ndarray,
+                       metric: str = 'jaccard') -> np.ndarray:
+    """
+    Binary similarity from intersection counts |a & b| and row sizes |a|, |b|.
+
+    - jaccard: |a & b| / |a | b| (1 if both rows are empty, as scipy pdist)
+    - dice: 2 |a & b| / (|a| + |b|) (1 if both rows are empty, as scipy pdist)
+    - jaccard_hamming: jaccard / hamming with hamming = |a | b| - |a & b|
+      (0 if hamming is 0, as j_h.user_similarity_jaccard_hamming)
+    """
+    totals = row_sizes[:, None] + col_sizes[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'jaccard':
+            union = totals - intersection
+            return np.where(union > 0, intersection / union, 1.0)
+        if metric == 'dice':
+            return np.where(totals > 0, 2 * intersection / totals, 1.0)
+        if metric == 'jaccard_hamming':
+            union = totals - intersection
+            hamming = union - intersection
+            return np.where(hamming > 0, intersection / (union * hamming), 0.0)
+    raise ValueError(f"Métrica no soportada: {metric}")
+
+
+def binary_overlap_similarity(matrix, metric: str = 'jaccard') -> np.ndarray:
+    """
+    Jaccard, Dice or Jaccard/Hamming similarity between rows, treating non-zero entries as 1.
+
+    Computed from the sparse intersection counts (X X^T) instead of a dense
+    pdist (see overlap_similarity for the empty-row conventions).
+
+    Args:
+        matrix: CSR matrix (users x features)
+        metric: 'jaccard', 'dice' or 'jaccard_hamming'
+
+    Returns:
+        Dense users x users similarity matrix
+    """
+    binary = binary_rows(matrix)
+    intersection = (binary @ binary.T).toarray()
+    sizes = np.asarray(binary.sum(axis=1)).ravel()
+    return overlap_similarity(intersection, sizes, sizes, metric)
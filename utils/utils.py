@@ -1,63 +1,152 @@
 # --- MÉTRICAS DE EVALUACIÓN: PRECISION, RECALL, F1 ---
 
+import os
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from sklearn import neighbors
-from config.constants import USER_ADDR_COLUMNS, AGR_USERS_COLUMNS
+from config.constants import USER_ADDR_COLUMNS, AGR_USERS_COLUMNS, CACHE_FOLDER
+from utils.snapshot_cache import SnapshotCache, to_categorical
+from utils.schema import enforce_schema
+from utils.sparse_features import BLOCK_PREFIXES, SparseFeatures, one_hot_block
+from utils.feature_hashing import create_hashed_features
+from scipy import sparse as sp
 from sklearn.preprocessing import MultiLabelBinarizer
 from ast import literal_eval
 
-def load_data(data_folder,file_type = ".csv"):
-    
+def _read_source(file_path, file_type, columns):
+    """Parse a CSV/XLSX extract keeping only `columns` (missing ones are left out)."""
+    usecols = lambda col: col in columns
+    if file_type == ".csv":
+        return pd.read_csv(file_path, usecols=usecols)
+    return pd.read_excel(file_path, usecols=usecols)
+
+
+def _read_union(file_paths, columns, keys, read, max_workers=None, source_column=None):
+    """
+    Read several extracts in parallel and union them.
+
+    At most max_workers files are parsed at a time; each one is trimmed to
+    `columns` and deduplicated before being kept, so memory stays bounded by
+    the in-flight files plus the (deduplicated) result. Files are combined in
+    name order and, for duplicated keys, the row of the last file wins.
+
+    Args:
+        file_paths: Extracts to read (sorted by name)
+        columns: Required columns
+        keys: Columns that identify a row (e.g. ['Usuario'] or ['Usuario', 'Rol'])
+        read: Function (file_path, columns) -> DataFrame
+        max_workers: Number of reader threads (default: one per file, up to the CPU count)
+        source_column: If given, name of the column recording the source file name
+
+    Returns:
+        Union DataFrame, or None if a file is missing required columns.
+        A single file is returned as read (no deduplication).
+    """
+    if max_workers is None:
+        max_workers = min(len(file_paths), os.cpu_count() or 1)
+
+    def read_one(file_path):
+        print(f"Reading file: {file_path}")
+        df = read(file_path, columns)
+        missing_columns = [col for col in columns if col not in df.columns]
+        if missing_columns:
+            return file_path, missing_columns
+        df = df[columns]
+        if len(file_paths) > 1:
+            df = df.drop_duplicates(subset=keys, keep='last')
+        if source_column is not None:
+            df = df.assign(**{source_column: file_path.name})
+        return file_path, df
+
+    parts = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Submit in windows of max_workers to cap the number of parsed frames held at once
+        for start in range(0, len(file_paths), max_workers):
+            window = file_paths[start:start + max_workers]
+            for file_path, result in executor.map(read_one, window):
+                if isinstance(result, list):
+                    print(f"Missing columns in {file_path.name}: {result}")
+                    return None
+                parts.append(result)
+
+    if len(parts) == 1:
+        return parts[0]
+    union = pd.concat(parts, ignore_index=True)
+    del parts
+    union = union.drop_duplicates(subset=keys, keep='last').reset_index(drop=True)
+    return to_categorical(union)
+
+
+def load_data(data_folder,file_type = ".csv", use_cache=True, cache_folder=None,
+              max_workers=None, source_column=None):
+    """
+    Load USER_ADDR_IDAD3 and AGR_USERS trimmed to USER_ADDR_COLUMNS / AGR_USERS_COLUMNS.
+
+    Every file matching USER_ADDR_IDAD3* / AGR_USERS* is read (in parallel
+    threads) and the extracts are unioned, e.g. when they are split per plant
+    or per month. USER_ADDR rows are deduplicated on Usuario and AGR_USERS rows
+    on (Usuario, Rol); on duplicates the file that sorts last wins. With a
+    single file per extract the result is the same as reading that file.
+
+    Both frames go through utils.schema (categorical Usuario, Departamento,
+    Función and Rol; rows without Usuario/Rol are rejected and reported).
+
+    With use_cache=True the trimmed frames are stored as Parquet snapshots
+    (see utils.snapshot_cache) in cache_folder (default: data_folder/.cache/snapshots),
+    so repeated loads of the same extracts skip CSV/XLSX parsing.
+
+    Args:
+        source_column: If given (e.g. config.constants.SOURCE_COLUMN), add a column with the
+                       name of the file each row came from
+    """
+    data_folder = Path(data_folder)
     if not data_folder.exists():
         print(f"Data folder '{data_folder}' not found!")
         return None, None, None
     
-    user_files = list(data_folder.glob("USER_ADDR_IDAD3*"+file_type))
+    user_files = sorted(data_folder.glob("USER_ADDR_IDAD3*"+file_type))
     
     if not user_files:
         print("No USER_ADDR_IDAD3 Excel file found!")
         return None, None, None
 
-    agr_users_files = list(data_folder.glob("AGR_USERS*"+file_type))
+    agr_users_files = sorted(data_folder.glob("AGR_USERS*"+file_type))
     if not agr_users_files:
         print("No AGR_USERS Excel file found!")
         return None, None, None
     
+    if cache_folder is None:
+        cache_folder = data_folder / CACHE_FOLDER / "snapshots"
+    cache = SnapshotCache(cache_folder) if use_cache else None
 
+    def read(file_path, columns):
+        reader = lambda path: _read_source(path, file_type, columns)
+        if cache is None:
+            return reader(file_path)
+        return cache.read(file_path, columns, reader)
 
     try:
-        # Read the Excel files
-        file_path = user_files[0]
-        print(f"Reading file: {file_path}")
-        if file_type == ".csv":
-
-            user_addr_df = pd.read_csv(file_path)
-            
-            agr_users_df = pd.read_csv(agr_users_files[0])
-        else:
-            user_addr_df = pd.read_excel(file_path)
-            agr_users_df = pd.read_excel(agr_users_files[0])
-
-        #Check if the required columns are present and delete the not necessary columns
-        
-        missing_columns = [col for col in USER_ADDR_COLUMNS if col not in user_addr_df.columns]
-        if missing_columns:
-            print(f"Missing columns in USER_ADDR file: {missing_columns}")
+        # Read the files (or their snapshots) and union each extract
+        user_addr_df = _read_union(user_files, USER_ADDR_COLUMNS, ['Usuario'], read,
+                                   max_workers, source_column)
+        if user_addr_df is None:
             return None, None, None
-        else:
-            user_addr_df = user_addr_df[USER_ADDR_COLUMNS]
 
-        missing_columns = [col for col in AGR_USERS_COLUMNS if col not in agr_users_df.columns]
-        if missing_columns:
-            print(f"Missing columns in AGR_USERS file: {missing_columns}")
+        agr_users_df = _read_union(agr_users_files, AGR_USERS_COLUMNS, AGR_USERS_COLUMNS, read,
+                                   max_workers, source_column)
+        if agr_users_df is None:
             return None, None, None
-        else:
-            agr_users_df = agr_users_df[AGR_USERS_COLUMNS]
 
-    
+        # Compact dtypes (categorical ids/labels) and rejection of malformed rows
+        user_addr_df, _ = enforce_schema(user_addr_df, "user_addr")
+        agr_users_df, _ = enforce_schema(agr_users_df, "agr_users")
+
+        if len(user_files) > 1 or len(agr_users_files) > 1:
+            print(f"Union of {len(user_files)} USER_ADDR and {len(agr_users_files)} AGR_USERS files: "
+                  f"{len(user_addr_df)} usuarios, {len(agr_users_df)} asignaciones")
 
         return user_addr_df, agr_users_df
 
@@ -70,9 +159,10 @@ def merge_df(user_addr_df, agr_users_df):
     """Merge the three DataFrames on the USER_ID column."""
     role_column = 'Rol'
     if role_column in agr_users_df.columns:
-        roles_grouped = agr_users_df.groupby('Usuario')[role_column].apply(list).reset_index()
+        roles_grouped = agr_users_df.groupby('Usuario', observed=True)[role_column].apply(list).reset_index()
         roles_grouped.rename(columns={role_column: 'Roles'}, inplace=True)   
         merged_df = pd.merge(user_addr_df, roles_grouped, on='Usuario', how='left')
+        merged_df, _ = enforce_schema(merged_df, "merged", verbose=False)
 
         return merged_df
     else:
@@ -81,32 +171,85 @@ def merge_df(user_addr_df, agr_users_df):
     return merged_df
 
 
+# Nombre del rol: todo lo anterior al primer '-'. Location: lo posterior al ultimo ':' (si existe)
+# (?s): '.' también acepta saltos de línea, como el split(':') original
+ROLE_PATTERN = r"(?s)^(?=(?P<Rol>[^-]*))(?:.*:(?P<Location>[^:]*))?"
+VALID_LOCATIONS = ("514", "504")
+
+
+def parse_roles(roles):
+    """
+    Parse full role strings into role name, location and validity in a single pass.
+
+    A role is kept (Valid) when it contains '_' and ':' and its location
+    (text after the last ':') contains 514 or 504, e.g.
+    'ZD_ALMMPU0-001-07-001:0504' -> Rol: 'ZD_ALMMPU0', Location: '0504'.
+    Non-string values are never valid.
+
+    Returns a DataFrame aligned with `roles` with columns Rol, Location and Valid.
+    """
+    roles = pd.Series(roles, dtype=object)
+    roles = roles.where(roles.map(lambda r: isinstance(r, str)))
+    if roles.isna().all():
+        return pd.DataFrame({'Rol': roles, 'Location': roles, 'Valid': False}, index=roles.index)
+
+    parsed = roles.str.extract(ROLE_PATTERN)
+    valid = roles.str.contains('_', regex=False, na=False) & parsed['Location'].notna()
+    location_ok = pd.Series(False, index=roles.index)
+    for loc in VALID_LOCATIONS:
+        location_ok |= parsed['Location'].str.contains(loc, regex=False, na=False)
+    parsed['Valid'] = valid & location_ok
+    return parsed
+
+
 def split_merge_df(merged_df):
     """
     Split the 'Roles' column into 'Rol' and 'Location' columns.
     Example: 'ROL_NAME-XYZ' -> Rol: 'ROL_NAME', Location: 'XYZ'
+
+    Roles are exploded once and each distinct role string is parsed only once
+    (see parse_roles); the valid role names are then split back into one list
+    per user, preserving the original order. Users without roles get [].
     """
-    rol_list = []
-    for idx, row in merged_df.iterrows():
-        roles = row['Roles']
-        temp_rol = []
-        for rol in roles:
-            rol_name = rol.split('-')[0] if '_' in rol else None
-            location = rol.split(':')[-1] if ':' in rol else None
-            if location == None or rol_name == None:
-                continue
-            elif "514" in location or "504" in location:
-                temp_rol.append(rol_name)
-
-        rol_list.append(temp_rol)
+    roles = merged_df['Roles'].reset_index(drop=True).explode()
+    codes, uniques = pd.factorize(roles)
+    parsed = parse_roles(uniques)
+
+    valid_codes = parsed['Valid'].to_numpy()
+    keep = codes >= 0
+    keep[keep] = valid_codes[codes[keep]]
+    kept_names = parsed['Rol'].to_numpy(dtype=object)[codes[keep]]
+
+    # explode keeps rows grouped and in order, so each user's roles are a
+    # contiguous slice of kept_names delimited by the user position
+    user_pos = roles.index.to_numpy()[keep]
+    bounds = np.searchsorted(user_pos, np.arange(1, len(merged_df)))
+    rol_list = [names.tolist() for names in np.split(kept_names, bounds)] if len(merged_df) else []
+
     merged_df['Rol'] = rol_list
     merged_df = merged_df.drop(columns=['Roles'])
     return merged_df
 
-def create_user_multihot_vectors(df, department_weight=1, function_weight=1, roleloc_weight=1, roles_weight=1):
+def create_user_multihot_vectors(df, department_weight=1, function_weight=1, roleloc_weight=1, roles_weight=1, sparse=False,
+                                 dtype=None, vocabulary=None, hash_dims=None):
+    # dtype: dtype de la matriz (None = float64 en modo sparse, tipos de get_dummies en modo denso)
+    # vocabulary: FeatureVocabulary ajustado; las columnas son las suyas (categorías desconocidas se ignoran)
+    # hash_dims: bloque -> nº de buckets; activa el modo hashed (ancho fijo, ver utils.feature_hashing)
+    weights = {'department': department_weight, 'function': function_weight, 'roles': roles_weight}
+    if vocabulary is not None or hash_dims is not None:
+        if vocabulary is not None:
+            features = vocabulary.transform(df, weights, dtype=dtype or np.float64)
+        else:
+            features = create_hashed_features(df, hash_dims, weights, dtype=dtype or np.float64)
+        return features if sparse else features.to_frame()
+
     # Asegura que Usuario sea el índice para todos los DataFrames
     df = df.set_index('Usuario')
 
+    if sparse:
+        return _create_sparse_multihot(df, department_weight, function_weight, roles_weight,
+                                       dtype=dtype or np.float64)
+
     # One-hot encoding para Departamento y Función
     department_df = pd.get_dummies(df[['Departamento']])
     function_df = pd.get_dummies(df[['Función']])
@@ -125,10 +268,47 @@ def create_user_multihot_vectors(df, department_weight=1, function_weight=1, rol
         roles_weight * roles_df
     ], axis=1)
 
+    if dtype is not None:
+        final_multihot = final_multihot.astype(dtype)
     return final_multihot
 
 
+def _create_sparse_multihot(df, department_weight, function_weight, roles_weight, dtype=np.float64):
+    """
+    Same features as create_user_multihot_vectors as a SparseFeatures (CSR)
+    with one block per feature group; weights scale the stored values.
+    """
+    department, department_cols = one_hot_block(df['Departamento'], BLOCK_PREFIXES['department'])
+    function, function_cols = one_hot_block(df['Función'], BLOCK_PREFIXES['function'])
+
+    mlb_roles = MultiLabelBinarizer(sparse_output=True)
+    roles = mlb_roles.fit_transform(df['Rol'])
+    roles_cols = [f"{BLOCK_PREFIXES['roles']}{c}" for c in mlb_roles.classes_]
+
+    blocks = {}
+    start = 0
+    for name, cols in (('department', department_cols), ('function', function_cols), ('roles', roles_cols)):
+        blocks[name] = (start, start + len(cols))
+        start += len(cols)
+
+    features = SparseFeatures(
+        sp.hstack([department, function, roles], format='csr'),
+        df.index,
+        department_cols + function_cols + roles_cols,
+        blocks,
+    )
+    return features.scale_blocks({
+        'department': department_weight,
+        'function': function_weight,
+        'roles': roles_weight,
+    }, dtype=dtype)
+
+
 def roles_found(sim_df, resumen_df, split_roles, fecha_min='2025-06-01', k=5, threshold=None, location_filter=True, debug_missing=True):
+    # resumen_df puede ser una ruta (store por mes o CSV): solo se leen los meses >= fecha_min
+    if not isinstance(resumen_df, pd.DataFrame):
+        from utils.resumen import read_resumen
+        resumen_df = read_resumen(resumen_df, fecha_min=fecha_min)
     # Asegura que la columna 'Rol' de split_roles es lista
     split_roles['Rol'] = split_roles['Rol']
     
@@ -176,7 +356,7 @@ def roles_found(sim_df, resumen_df, split_roles, fecha_min='2025-06-01', k=5, th
     collapsed_duplicates = []  # lista de (usuario, base_role, roles_originales) cuando >1 original colapsa
 
     # Pre-calcular roles originales por usuario (solo usuarios presentes en resumen_df)
-    roles_por_usuario_full = resumen_df.groupby('Usuario')['Rol'].apply(list).to_dict()
+    roles_por_usuario_full = resumen_df.groupby('Usuario', observed=True)['Rol'].apply(list).to_dict()
 
     for idx, row in sim_df.iterrows():
         count += 1